@@ -41,6 +41,7 @@ from nova.scheduler import rpcapi as scheduler_rpcapi
 from oslo.config import cfg
 
 from . import image
+from cobalt.nova.extension import warmpool
 
 # New API capabilities should be added here
 
@@ -55,6 +56,9 @@ CAPABILITIES = ['user-data',
                 'scheduler-hints',
                 'install-policy',
                 'supports-volumes',
+                'prefetch',
+                'evacuate-host',
+                'warm-pool',
                 ]
 
 LOG = logging.getLogger('nova.cobalt.api')
@@ -63,7 +67,26 @@ CONF = cfg.CONF
 cobalt_api_opts = [
                cfg.StrOpt('cobalt_topic',
                default='cobalt',
-               help='the topic Cobalt nodes listen on') ]
+               help='the topic Cobalt nodes listen on'),
+
+               cfg.StrOpt('cobalt_prefetch_policy',
+               default='none',
+               help='How hosts are chosen when pre-placing the artifacts of a '
+                    'new live-image. One of: none (do not prefetch), '
+                    'least_loaded (the hosts running the fewest instances), '
+                    'availability_zone (every host in '
+                    'cobalt_prefetch_availability_zone) or history (the hosts '
+                    'that most often launched clones of the same source).'),
+
+               cfg.IntOpt('cobalt_prefetch_hosts',
+               default=3,
+               help='The maximum number of hosts a live-image is prefetched '
+                    'onto by the least_loaded and history policies.'),
+
+               cfg.StrOpt('cobalt_prefetch_availability_zone',
+               default=None,
+               help='The availability zone used by the availability_zone '
+                    'prefetch policy.') ]
 CONF.register_opts(cobalt_api_opts)
 
 class API(base.Base):
@@ -337,6 +360,93 @@ class API(base.Base):
                 hosts.append(srv['host'])
         return hosts
 
+    def _list_least_loaded_hosts(self, context, hosts):
+        """ Returns hosts sorted from the least to the most loaded. """
+        load = {}
+        for node in self.db.compute_node_get_all(context.elevated()):
+            host = node['service']['host']
+            if host in hosts:
+                load[host] = (node['running_vms'], -node['free_ram_mb'])
+        # Hosts without a compute node record are considered the most loaded
+        # since we know nothing about them.
+        return sorted(hosts, key=lambda host: load.get(host, (sys.maxint, 0)))
+
+    def _list_history_hosts(self, context, instance_uuid, hosts):
+        """
+        Returns the hosts that have launched clones of the live-image's source
+        instance, the most frequent first.
+        """
+        system_metadata = self.db.instance_system_metadata_get(context,
+                                                               instance_uuid)
+        source_uuid = system_metadata.get('blessed_from', None)
+        live_images = [instance_uuid]
+        if source_uuid is not None:
+            live_images += [blessed['uuid'] for blessed in
+                            self.list_blessed_instances(context, source_uuid)]
+
+        counts = {}
+        for live_image in set(live_images):
+            for launched in self.list_launched_instances(context, live_image):
+                host = launched['host']
+                if host in hosts:
+                    counts[host] = counts.get(host, 0) + 1
+        return sorted(counts.keys(), key=lambda host: -counts[host])
+
+    def _find_prefetch_hosts(self, context, instance_uuid, policy,
+                             num_hosts, availability_zone):
+        if policy == 'none':
+            return []
+        elif policy == 'availability_zone':
+            if availability_zone is None:
+                raise exception.NovaException(
+                        _("An availability zone is required to prefetch by zone."))
+            return self._list_cobalt_hosts(context,
+                                           availability_zone=availability_zone)
+
+        co_hosts = self._list_cobalt_hosts(context)
+        if policy == 'least_loaded':
+            hosts = self._list_least_loaded_hosts(context, co_hosts)
+        elif policy == 'history':
+            hosts = self._list_history_hosts(context, instance_uuid, co_hosts)
+        else:
+            raise exception.NovaException(_("Unknown prefetch policy %s.") % policy)
+        return hosts[:num_hosts]
+
+    def prefetch_instance(self, context, instance_uuid, policy=None,
+                          num_hosts=None, availability_zone=None, hosts=None):
+        """
+        Pre-places the artifacts of a live-image into the image cache of a set
+        of hosts so that the first launches there do not pay for the download.
+        The hosts are either given explicitly or chosen by the prefetch policy.
+        Returns the list of hosts that were asked to prefetch.
+        """
+        if not(self._is_instance_blessed(context, instance_uuid)):
+            raise exception.NovaException(_("Instance %s is not a live image. " +
+                  "Only live images can be prefetched.") % instance_uuid)
+
+        if hosts is None:
+            if policy is None:
+                policy = CONF.cobalt_prefetch_policy
+            if num_hosts is None:
+                num_hosts = CONF.cobalt_prefetch_hosts
+            if availability_zone is None:
+                availability_zone = CONF.cobalt_prefetch_availability_zone
+            hosts = self._find_prefetch_hosts(context, instance_uuid, policy,
+                                              int(num_hosts), availability_zone)
+        else:
+            co_hosts = self._list_cobalt_hosts(context)
+            for host in hosts:
+                if host not in co_hosts:
+                    raise exception.NovaException(_("Cannot prefetch onto host %s "
+                                        "because it is not running the cobalt "
+                                        "service.") % host)
+
+        for host in hosts:
+            LOG.debug(_("Casting cobalt message for prefetch_instance to %s"), host)
+            self._cast_cobalt_message('prefetch_instance', context, instance_uuid,
+                                      host=host)
+        return hosts
+
     def bless_instance(self, context, instance_uuid, params=None):
         if params is None:
             params = {}
@@ -407,7 +517,64 @@ class API(base.Base):
             self._rollback_reservation(context, reservations)
             raise ei[0], ei[1], ei[2]
 
-    def launch_instance(self, context, instance_uuid, params={}):
+    def _claim_pooled_instances(self, context, instance, count, params):
+        """
+        Claims up to count paused clones of the live-image from the warm pools
+        of the hosts, and gives them the user, name, user data and key of the
+        launch. Returns the claimed instances.
+        """
+        # The clones are only claimed within the project of the launch, even
+        # when an admin context would let get_all see the other projects.
+        pooled = self.compute_api.get_all(context,
+                    {'metadata': {'launched_from': '%s' % instance['uuid']},
+                     'task_state': warmpool.POOLED,
+                     'project_id': context.project_id,
+                     'deleted': False})
+        pooled = [pooled_instance for pooled_instance in pooled
+                  if pooled_instance['project_id'] == context.project_id]
+        if len(pooled) == 0:
+            return []
+
+        key_name = params.get('key_name', None)
+        if key_name != None:
+            key_pair = self.db.key_pair_get(context, context.user_id, key_name)
+
+        name = params.get('name', "%s-%s" % (instance['display_name'], "clone"))
+        claimed = []
+        for pooled_instance in pooled:
+            if len(claimed) == count:
+                break
+            updates = {'task_state': warmpool.CLAIMED,
+                       # Only one launch gets to move it out of the pool.
+                       'expected_task_state': warmpool.POOLED,
+                       'user_id': context.user_id,
+                       'display_name': name,
+                       'hostname': utils.sanitize_hostname(name),
+                       'user_data': params.get('user_data', None) or '',
+                       'launch_index': len(claimed)}
+            if key_name != None:
+                updates['key_name'] = key_name
+                updates['key_data'] = key_pair['public_key']
+            try:
+                claimed.append(self.db.instance_update(context,
+                                                       pooled_instance['uuid'],
+                                                       updates))
+            except (exception.UnexpectedTaskStateError, exception.InstanceNotFound):
+                # Another launch got there first, or it was deleted.
+                continue
+        return claimed
+
+    def _return_pooled_instances(self, context, instances):
+        for instance in instances:
+            try:
+                self.db.instance_update(context, instance['uuid'],
+                                        {'task_state': warmpool.POOLED,
+                                         'expected_task_state': warmpool.CLAIMED})
+            except Exception:
+                LOG.exception(_("Failed to return instance %s to the warm pool"),
+                              instance['uuid'])
+
+    def launch_instance(self, context, instance_uuid, params={}, warm_pool=False):
         pid = context.project_id
         uid = context.user_id
 
@@ -434,7 +601,30 @@ class API(base.Base):
                 raise exception.NovaException(_('num_instances must be at least 1'))
         except TypeError:
             raise exception.NovaException(_('num_instances must be an integer'))
-        reservations = self._acquire_addition_reservation(context, instance, num_instances)
+
+        # Pooled clones only fit launches that would have been set up the same
+        # way, and their quota was reserved when they were pooled.
+        claimed = []
+        if not(warm_pool) and security_group_names == None and \
+           not [key for key in ('availability_zone', 'scheduler_hints',
+                                'target', 'guest') if params.get(key)]:
+            claimed = self._claim_pooled_instances(context, instance,
+                                                   num_instances, params)
+            num_instances -= len(claimed)
+        if num_instances == 0:
+            for launch_instance in claimed:
+                self._cast_cobalt_message('launch_instance', context,
+                    launch_instance['uuid'], launch_instance['host'],
+                    { "params" : params })
+            return self.get(context, claimed[0]['uuid'])
+
+        try:
+            reservations = self._acquire_addition_reservation(context, instance,
+                                                              num_instances)
+        except:
+            ei = sys.exc_info()
+            self._return_pooled_instances(context, claimed)
+            raise ei[0], ei[1], ei[2]
 
         try:
             launch_instances = []
@@ -459,7 +649,7 @@ class API(base.Base):
                     new_user_data=instance_params.pop('user_data', None),
                     security_groups=security_groups,
                     key_name=instance_params.pop('key_name', None),
-                    launch_index=i,
+                    launch_index=len(claimed) + i,
                     # Note this is after groking by handle_az above
                     availability_zone=availability_zone))
 
@@ -469,15 +659,21 @@ class API(base.Base):
             for host, launch_instance in zip(hosts, launch_instances):
                 self._cast_cobalt_message('launch_instance', context,
                     launch_instance['uuid'], host,
-                    { "params" : params })
+                    { "params" : params, "warm_pool" : warm_pool })
 
             self._commit_reservation(context, reservations)
         except:
             ei = sys.exc_info()
             self._rollback_reservation(context, reservations)
+            self._return_pooled_instances(context, claimed)
             raise ei[0], ei[1], ei[2]
 
-        return self.get(context, launch_instances[0]['uuid'])
+        for launch_instance in claimed:
+            self._cast_cobalt_message('launch_instance', context,
+                launch_instance['uuid'], launch_instance['host'],
+                { "params" : params })
+
+        return self.get(context, (claimed + launch_instances)[0]['uuid'])
 
     def _create_request_spec(self, context, instances):
         """ Creates a scheduler request spec for the launch instances."""
@@ -541,6 +737,42 @@ class API(base.Base):
                                        instance_ref['uuid'], host=instance_ref['host'],
                                        params={"dest" : dest})
 
+    def list_evacuation_destinations(self, context, host, dests=None):
+        """
+        Returns the hosts that host may be evacuated to, the least loaded
+        first. The destinations default to every other cobalt host.
+        """
+        cobalt_hosts = self._list_cobalt_hosts(context)
+        if host not in cobalt_hosts:
+            raise exception.NovaException(_("Cannot evacuate host %s because it is "
+                                            "not running the cobalt service.") % host)
+        if dests:
+            for dest in dests:
+                if dest not in cobalt_hosts:
+                    raise exception.NovaException(_("Cannot evacuate to host %s because "
+                                    "it is not running the cobalt service.") % dest)
+        else:
+            dests = cobalt_hosts
+        dests = [dest for dest in dests if dest != host]
+        if len(dests) == 0:
+            raise exception.NovaException(_("There are no available hosts to evacuate "
+                                            "host %s to.") % host)
+        return self._list_least_loaded_hosts(context, dests)
+
+    def evacuate_host(self, context, host, dests=None):
+        """
+        Migrates every active instance off host. The migrations are run in
+        waves by the host itself; the destinations default to every other
+        cobalt host. Returns the destinations, the least loaded first.
+        """
+        dests = self.list_evacuation_destinations(context, host, dests)
+
+        LOG.debug(_("Casting cobalt message for evacuate_host to %s"), host)
+        queue = rpc.queue_get_for(context, CONF.cobalt_topic, host)
+        rpc.cast(context, queue, {'method': 'evacuate_host',
+                                  'args': {'dests': dests}})
+        return dests
+
     def list_launched_instances(self, context, instance_uuid):
         # Assert that the instance with the uuid actually exists.
         self.get(context, instance_uuid)
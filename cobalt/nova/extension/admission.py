@@ -0,0 +1,190 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Limits how many operations of each kind a host runs at once, so that a burst
+of requests queues up instead of slowing every operation down.
+"""
+
+import bisect
+import itertools
+import time
+
+import greenlet
+from eventlet import event
+
+from nova.openstack.common import log as logging
+from nova.openstack.common.gettextutils import _
+
+LOG = logging.getLogger('nova.cobalt.admission')
+
+# Waiting operations are admitted in this order. Incoming migrations come
+# first because a source host is blocked on them, new launches come last.
+PRIORITIES = {'migrate_in': 0,
+              'migrate_out': 1,
+              'discard': 2,
+              'bless': 3,
+              'launch': 4}
+
+# Operations that do not count against the total limit. Two hosts migrating
+# to each other would otherwise deadlock once they are both full.
+EXEMPT = ('migrate_in',)
+
+# Operations whose caller waits for their reply, so they can only queue where
+# they were called. The others are cast and may queue in the background.
+REPLIED = ('migrate_in',)
+
+def parse_limits(value):
+    """ Parses 'operation=limit,...' into a dict. """
+    limits = {}
+    for entry in (value or '').split(','):
+        if entry.strip() == '':
+            continue
+        (operation, _sep, limit) = entry.partition('=')
+        try:
+            limits[operation.strip()] = int(limit)
+        except ValueError:
+            LOG.warn(_("Ignoring invalid operation limit '%s'"), entry)
+    return limits
+
+class AdmissionControl(object):
+    """
+    Admits operations while both the limit for their kind and the total
+    limit allow it, and queues them by priority otherwise. A limit of zero
+    means no limit. Admission is reentrant: an operation that starts another
+    one in the same greenthread (e.g. the bless of a migration) is not
+    queued again.
+
+    The limits may be given as callables, which lets them follow
+    configuration changes.
+    """
+
+    def __init__(self, limits=None, total=0):
+        self.limits = limits if limits is not None else {}
+        self.total = total
+        self.running = {}
+        self.total_running = 0
+        # Sorted (priority, sequence, operation, event) tuples.
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.holders = {}
+        self.stats = {}
+
+    def _value(self, value):
+        if callable(value):
+            return value()
+        return value
+
+    def _stats(self, operation):
+        return self.stats.setdefault(operation, {'admitted': 0,
+                                                 'queued': 0,
+                                                 'deferred': 0,
+                                                 'wait_time': 0.0,
+                                                 'max_wait_time': 0.0})
+
+    def _has_room(self, operation, limits, total):
+        limit = limits.get(operation, 0)
+        if limit > 0 and self.running.get(operation, 0) >= limit:
+            return False
+        if operation not in EXEMPT and total > 0 and \
+           self.total_running >= total:
+            return False
+        return True
+
+    def _start(self, operation):
+        self.running[operation] = self.running.get(operation, 0) + 1
+        if operation not in EXEMPT:
+            self.total_running += 1
+        self._stats(operation)['admitted'] += 1
+
+    def _finish(self, operation):
+        self.running[operation] -= 1
+        if operation not in EXEMPT:
+            self.total_running -= 1
+
+    def _dispatch(self):
+        """ Admits the waiters that fit, in priority order. """
+        limits = self._value(self.limits)
+        total = self._value(self.total)
+        for waiter in list(self.waiters):
+            (priority, sequence, operation, admitted) = waiter
+            if self._has_room(operation, limits, total):
+                self.waiters.remove(waiter)
+                self._start(operation)
+                admitted.send()
+            elif operation not in EXEMPT and total > 0 and \
+                 self.total_running >= total:
+                # Nothing of lower priority may jump ahead for the total.
+                break
+
+    def admit(self, operation, blocking=True):
+        """
+        Waits until the operation may run. Without blocking, returns False
+        instead of queueing the operation if it may not run right away.
+        """
+        current = greenlet.getcurrent()
+        if current in self.holders:
+            self.holders[current][1] += 1
+            return True
+
+        admitted = event.Event()
+        waiter = (PRIORITIES.get(operation, len(PRIORITIES)),
+                  self.sequence.next(), operation, admitted)
+        bisect.insort(self.waiters, waiter)
+        self._dispatch()
+        if not admitted.ready() and not blocking:
+            self.waiters.remove(waiter)
+            self._stats(operation)['deferred'] += 1
+            return False
+        if not admitted.ready():
+            stats = self._stats(operation)
+            stats['queued'] += 1
+            LOG.debug(_("Queueing %s behind %d waiting operations"),
+                      operation, len(self.waiters) - 1)
+            start = time.time()
+            try:
+                admitted.wait()
+            except:
+                if admitted.ready():
+                    self._finish(operation)
+                    self._dispatch()
+                else:
+                    self.waiters.remove(waiter)
+                raise
+            wait_time = time.time() - start
+            stats['wait_time'] += wait_time
+            stats['max_wait_time'] = max(stats['max_wait_time'], wait_time)
+        self.holders[current] = [operation, 1]
+        return True
+
+    def release(self):
+        """ Ends the operation of the current greenthread. """
+        current = greenlet.getcurrent()
+        holder = self.holders[current]
+        holder[1] -= 1
+        if holder[1] > 0:
+            return
+        del self.holders[current]
+        self._finish(holder[0])
+        self._dispatch()
+
+    def get_stats(self):
+        stats = {}
+        for operation in set(self.stats.keys() + self.running.keys()):
+            stats[operation] = dict(self._stats(operation),
+                running=self.running.get(operation, 0),
+                waiting=len([waiter for waiter in self.waiters
+                             if waiter[2] == operation]))
+        return stats
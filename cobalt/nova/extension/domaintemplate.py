@@ -0,0 +1,72 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Keeps the disk layout and libvirt XML of the first clone of a live-image
+launched on a host, so the domains of the following clones are made by
+patching in their uuid, name and network interfaces instead of being
+generated again.
+"""
+
+from xml.etree import ElementTree
+
+from cobalt.nova.extension import lru
+
+class DomainTemplate(object):
+    """
+    The domain of a clone, from which the domains of its siblings are made.
+    The uuid and name of the clone are replaced wherever they appear (the
+    name, the sysinfo, the paths of the disks and console, etc.), and its
+    interfaces are replaced, in place so the devices keep their order.
+    """
+
+    def __init__(self, xml, uuid, name, disk_info, flavor=None):
+        self.xml = xml
+        self.uuid = uuid
+        self.name = name
+        self.disk_info = disk_info
+        self.flavor = flavor
+        self.interfaces = len(ElementTree.fromstring(xml).findall('devices/interface'))
+
+    def _patch(self, value, uuid, name):
+        if value is None:
+            return None
+        return value.replace(self.uuid, uuid).replace(self.name, name)
+
+    def clone_xml(self, uuid, name, interfaces):
+        """
+        Returns the XML of the domain of the clone with the given uuid and
+        name and interfaces (a list of the XML of each interface).
+        """
+        if len(interfaces) != self.interfaces:
+            raise ValueError("The template has %d interfaces, not %d" %
+                             (self.interfaces, len(interfaces)))
+        domain = ElementTree.fromstring(self.xml)
+        for element in domain.iter():
+            element.text = self._patch(element.text, uuid, name)
+            for (key, value) in element.attrib.items():
+                element.set(key, self._patch(value, uuid, name))
+
+        devices = domain.find('devices')
+        index = 0
+        for (position, device) in enumerate(list(devices)):
+            if device.tag == 'interface':
+                devices.remove(device)
+                devices.insert(position, ElementTree.fromstring(interfaces[index]))
+                index += 1
+        return ElementTree.tostring(domain)
+
+class DomainTemplateCache(lru.LRUCache):
+    """ The templates of the most recently launched live-images. """
@@ -13,15 +13,91 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import sys
+
+import eventlet
+from eventlet import event
+
 from nova import exception
 from nova.image import glance
 from nova.openstack.common import log as logging
+from nova.openstack.common.gettextutils import _
 from nova.virt.libvirt import driver
+from oslo.config import cfg
 
 from cobalt.nova.extension import vmsconn
 from cobalt.nova.extension import vmsapi
 
 LOG = logging.getLogger('nova.cobalt.driver.libvirt')
+CONF = cfg.CONF
+
+libvirt_driver_opts = [
+                cfg.FloatOpt('cobalt_iptables_batch_window',
+                default=0.1,
+                help='The number of seconds for which the firewall rules of '
+                     'instances being set up together are collected before '
+                     'iptables is updated once for all of them. Set to 0 to '
+                     'update iptables for every instance.')]
+CONF.register_opts(libvirt_driver_opts)
+
+class _FilterBatch(object):
+
+    def __init__(self):
+        self.active = 0
+        self.closed = False
+        self.done = event.Event()
+
+class _FilterBatcher(object):
+    """
+    Group-commits the iptables updates of the instances whose filters are set
+    up within the same window. Every caller prepares its rules while iptables
+    applies are deferred and returns once the single apply for its batch has
+    happened.
+    """
+
+    def __init__(self, iptables):
+        self.iptables = iptables
+        self.batch = None
+
+    def run(self, fn):
+        window = CONF.cobalt_iptables_batch_window
+        if window <= 0:
+            return fn()
+
+        batch = self.batch
+        if batch == None:
+            batch = self.batch = _FilterBatch()
+            self.iptables.defer_apply_on()
+            eventlet.spawn_after(window, self._close, batch)
+
+        batch.active += 1
+        try:
+            result = fn()
+        finally:
+            batch.active -= 1
+            if batch.closed and batch.active == 0:
+                self._commit(batch)
+        batch.done.wait()
+        return result
+
+    def _close(self, batch):
+        batch.closed = True
+        if self.batch is batch:
+            self.batch = None
+        # Callers still preparing their rules commit when they are done.
+        if batch.active == 0:
+            self._commit(batch)
+
+    def _commit(self, batch):
+        if batch.done.ready():
+            return
+        try:
+            # Applies the rules of the whole batch.
+            self.iptables.defer_apply_off()
+            batch.done.send(None)
+        except:
+            LOG.exception(_("Failed to apply the batched iptables rules"))
+            batch.done.send_exception(*sys.exc_info())
 
 class LibvirtDriver(driver.LibvirtDriver):
 
@@ -31,6 +107,23 @@ class LibvirtDriver(driver.LibvirtDriver):
         self.vms_conn = vmsconn.LibvirtConnection(vmsapi.get_vmsapi())
         self.vms_conn.configure()
 
+        iptables = getattr(self.firewall_driver, 'iptables', None)
+        if hasattr(iptables, 'defer_apply_on'):
+            self.filter_batcher = _FilterBatcher(iptables)
+        else:
+            self.filter_batcher = None
+
+    def ensure_filtering_rules_for_instance(self, instance, network_info,
+                                            time_module=None):
+        # Cobalt asks for this through pre_live_migration for every instance
+        # it launches, so a burst of clones would otherwise rewrite iptables
+        # once per clone.
+        ensure = super(LibvirtDriver, self).ensure_filtering_rules_for_instance
+        if self.filter_batcher == None:
+            return ensure(instance, network_info, time_module=time_module)
+        return self.filter_batcher.run(
+                lambda: ensure(instance, network_info, time_module=time_module))
+
     @exception.wrap_exception()
     def spawn(self, context, instance, image_meta, injected_files,
         admin_password, network_info=None, block_device_info=None):
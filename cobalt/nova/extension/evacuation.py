@@ -0,0 +1,55 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Plans the evacuation of a host, which migrates its instances away in waves
+spread over the destination hosts.
+"""
+
+def wave_size(size, bandwidth=0, migration_bandwidth=0):
+    """
+    The number of migrations that fit in a wave of at most size, given the
+    bandwidth of the evacuation and of one migration (0 for no limit).
+    """
+    size = max(size, 1)
+    if bandwidth > 0 and migration_bandwidth > 0:
+        size = min(size, max(1, bandwidth // migration_bandwidth))
+    return size
+
+def plan_wave(pending, dests, placed, size, per_destination, failed):
+    """
+    Assigns up to size of the pending instances to the destinations, at most
+    per_destination to each. Every instance goes to the destination that has
+    been given the fewest instances so far (placed) and, while there is
+    another one, not to a destination it failed to migrate to (failed).
+    Returns the (instance_uuid, dest) pairs and the instances left over.
+    """
+    wave = []
+    remaining = []
+    in_wave = dict([(dest, 0) for dest in dests])
+    for instance_uuid in pending:
+        allowed = [dest for dest in dests
+                   if dest not in failed.get(instance_uuid, ())] or dests
+        candidates = [dest for dest in allowed
+                      if per_destination <= 0 or in_wave[dest] < per_destination]
+        if len(wave) >= size or len(candidates) == 0:
+            remaining.append(instance_uuid)
+            continue
+        dest = min(candidates,
+                   key=lambda dest: (placed.get(dest, 0), dests.index(dest)))
+        in_wave[dest] += 1
+        placed[dest] = placed.get(dest, 0) + 1
+        wave.append((instance_uuid, dest))
+    return wave, remaining
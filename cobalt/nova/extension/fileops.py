@@ -0,0 +1,127 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Creates directories, files and symlinks as another user without forking a
+sudo for each of them.
+
+When the process runs as root on Linux the operations are done in process,
+with the file system uid and gid switched to the user's. Those belong to the
+OS thread that all the greenthreads share, so nothing may yield while they
+are switched, and the operations are plain system calls that do not.
+Elsewhere a batch of operations is run by a single shell under sudo.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import pipes
+import pwd
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _setfsuid = _libc.setfsuid
+    _setfsgid = _libc.setfsgid
+except (OSError, AttributeError):
+    _setfsuid = None
+    _setfsgid = None
+
+def in_process():
+    """ Returns True if the operations can be done without sudo. """
+    return _setfsuid is not None and os.geteuid() == 0
+
+class _FsCredentials(object):
+    """ Switches the file system uid and gid of the thread. """
+
+    def __init__(self, uid, gid):
+        self.uid = uid
+        self.gid = gid
+
+    def __enter__(self):
+        self.old_gid = _setfsgid(self.gid)
+        self.old_uid = _setfsuid(self.uid)
+        # The calls return the previous ids even when they fail, and an
+        # invalid id only reads the current one back.
+        if _setfsuid(-1) != self.uid or _setfsgid(-1) != self.gid:
+            self.__exit__(None, None, None)
+            raise OSError(errno.EPERM, os.strerror(errno.EPERM))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _setfsuid(self.old_uid)
+        _setfsgid(self.old_gid)
+
+def _mkdir(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+def _touch(path):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_NOCTTY | os.O_NONBLOCK, 0666)
+    os.close(fd)
+    os.utime(path, None)
+
+def _symlink(target, link):
+    os.symlink(target, link)
+
+_OPERATIONS = {'mkdir': (_mkdir, 'mkdir -p %s'),
+               'touch': (_touch, 'touch %s'),
+               'symlink': (_symlink, 'ln -s %s %s')}
+
+class FileOps(object):
+    """
+    A batch of file operations, done in order as the user uid (and gid, the
+    user's group by default) when run. Without the privileges to do them in
+    process, they are run with run_command, e.g. utilities.check_command.
+    """
+
+    def __init__(self, uid, gid=None, run_command=None):
+        self.uid = uid
+        if gid is None:
+            try:
+                gid = pwd.getpwuid(uid).pw_gid
+            except KeyError:
+                gid = os.getegid()
+        self.gid = gid
+        self.run_command = run_command
+        self.operations = []
+
+    def mkdir(self, path):
+        """ Creates the directory and its parents, like mkdir -p. """
+        self.operations.append(('mkdir', path))
+
+    def touch(self, path):
+        self.operations.append(('touch', path))
+
+    def symlink(self, target, link):
+        self.operations.append(('symlink', target, link))
+
+    def _script(self, operations):
+        return ' && '.join([_OPERATIONS[operation[0]][1] %
+                            tuple([pipes.quote(arg) for arg in operation[1:]])
+                            for operation in operations])
+
+    def run(self):
+        """ Does the operations queued since the last run. """
+        operations, self.operations = self.operations, []
+        if len(operations) == 0:
+            return
+        if in_process():
+            with _FsCredentials(self.uid, self.gid):
+                for operation in operations:
+                    _OPERATIONS[operation[0]][0](*operation[1:])
+        else:
+            self.run_command(['sudo', '-u', '#%d' % self.uid,
+                              'sh', '-c', self._script(operations)])
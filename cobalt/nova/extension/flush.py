@@ -0,0 +1,116 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Flushes the disks of a single instance to stable storage, so a migration
+does not have to wait on the dirty pages of every other instance on the
+host as it does with sync.
+
+These calls block, so they are meant to be run in a native thread.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import stat
+
+from xml.etree import ElementTree
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _syncfs = _libc.syncfs
+    _syncfs.argtypes = [ctypes.c_int]
+except (OSError, AttributeError):
+    _syncfs = None
+
+def disk_paths(libvirt_xml):
+    """ Returns the files and devices backing the disks of a domain. """
+    paths = []
+    for source in ElementTree.parse(libvirt_xml).findall('devices/disk/source'):
+        path = source.get('file') or source.get('dev')
+        if path:
+            paths.append(path)
+    return paths
+
+def instance_paths(working_dir):
+    """
+    Returns the files in the working directory of an instance along with the
+    disks of its domain, with symlinks resolved.
+    """
+    paths = [os.path.join(working_dir, name) for name in os.listdir(working_dir)]
+    libvirt_xml = os.path.join(working_dir, 'libvirt.xml')
+    if os.path.exists(libvirt_xml):
+        paths += disk_paths(libvirt_xml)
+    paths = [os.path.realpath(path) for path in paths]
+    return sorted(set([path for path in paths
+                       if os.path.isfile(path) or _is_block_device(path)]))
+
+def _is_block_device(path):
+    try:
+        return stat.S_ISBLK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+def _fsync(path, data_only=True):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if data_only:
+            os.fdatasync(fd)
+        else:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def syncfs(path):
+    """ Flushes the file system holding path. """
+    if _syncfs is None:
+        raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS))
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if _syncfs(fd) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+    finally:
+        os.close(fd)
+
+def flush_instance(working_dir, mode='files'):
+    """
+    Flushes the disks of the instance whose files are in working_dir, either
+    file by file (mode files) or the file systems holding them (mode
+    filesystem, which falls back to files where syncfs is missing). Block
+    devices are always flushed on their own. Returns the number of files,
+    devices and file systems flushed.
+    """
+    if mode == 'filesystem' and _syncfs is None:
+        mode = 'files'
+
+    flushed = 0
+    filesystems = set()
+    for path in instance_paths(working_dir):
+        if mode == 'filesystem' and not _is_block_device(path):
+            device = os.stat(path).st_dev
+            if device not in filesystems:
+                filesystems.add(device)
+                syncfs(path)
+                flushed += 1
+        else:
+            _fsync(path)
+            flushed += 1
+
+    if os.stat(working_dir).st_dev not in filesystems:
+        # Make the directory entries themselves durable.
+        _fsync(working_dir, data_only=False)
+    return flushed
@@ -0,0 +1,104 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Helpers for launching instances from live-images, so that the independent
+steps of a launch overlap instead of running one after another and repeated
+launches of a live-image skip the lookups made by the first.
+"""
+
+import sys
+
+import eventlet
+
+from cobalt.nova.extension import lru
+
+class LaunchPipeline(object):
+    """
+    Runs the steps of a launch concurrently as greenthreads. A step starts
+    once the steps it requires have finished. Once a step fails no further
+    step is started, and wait() raises the first failure after the steps
+    that were already running are done.
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.threads = {}
+        self.failure = None
+
+    def add(self, name, fn, requires=()):
+        def run():
+            for required in requires:
+                self.threads[required].wait()
+            if self.failure is not None:
+                return None
+            try:
+                return fn()
+            except:
+                # The failure is raised by wait(), not by the greenthread, so
+                # that the hub does not print it.
+                if self.failure is None:
+                    self.failure = sys.exc_info()
+                return None
+
+        self.steps.append(name)
+        self.threads[name] = eventlet.spawn(run)
+
+    def wait(self):
+        """ Returns the result of each step, keyed by name. """
+        results = {}
+        for name in self.steps:
+            results[name] = self.threads[name].wait()
+        if self.failure is not None:
+            raise self.failure[0], self.failure[1], self.failure[2]
+        return results
+
+class LaunchContext(object):
+    """
+    What a launch needs to know about the live-image it launches from.
+    """
+
+    def __init__(self, name, image_refs, lvm_info, requested_networks,
+                 policy_template, artifacts):
+        self.name = name
+        self.image_refs = image_refs
+        self.lvm_info = lvm_info
+        self.requested_networks = requested_networks
+        self.policy_template = policy_template
+        self.artifacts = artifacts
+
+    def copy(self):
+        requested_networks = self.requested_networks
+        if requested_networks != None:
+            requested_networks = [list(network) for network in requested_networks]
+        return LaunchContext(self.name, list(self.image_refs), dict(self.lvm_info),
+                             requested_networks, self.policy_template,
+                             dict(self.artifacts))
+
+class LaunchContextCache(lru.LRUCache):
+    """
+    The launch contexts of the most recently launched live-images, keyed by
+    the uuid of the blessed instance. Launches are given copies, which they
+    are free to change.
+    """
+
+    def get(self, blessed_uuid):
+        launch_context = super(LaunchContextCache, self).get(blessed_uuid)
+        if launch_context == None:
+            return None
+        return launch_context.copy()
+
+    def put(self, blessed_uuid, launch_context):
+        super(LaunchContextCache, self).put(blessed_uuid, launch_context.copy())
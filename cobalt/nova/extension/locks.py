@@ -0,0 +1,175 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Keeps operations on the same instance from running at once on a host. Each
+instance has a lock of its own, so releasing one only wakes up an operation
+waiting on that instance.
+"""
+
+import collections
+import sys
+import time
+
+import eventlet
+import greenlet
+from eventlet import event
+from eventlet.green import threading as gthreading
+
+from nova import exception
+from nova.openstack.common import log as logging
+from nova.openstack.common.gettextutils import _
+
+LOG = logging.getLogger('nova.cobalt.locks')
+
+class InstanceLock(object):
+    """
+    The lock for a single instance. It is reentrant for the greenthread that
+    holds it and is handed directly to the waiters in FIFO order, so releasing
+    it only ever wakes up the next waiter of this instance.
+    """
+
+    def __init__(self):
+        self.owner = None
+        self.refcount = 0
+        self.waiters = collections.deque()
+
+class InstanceLocks(object):
+    """
+    The locks of the instances that operations are working on, keyed by
+    instance uuid. A waiter gives up after timeout seconds, if it is set.
+    """
+
+    def __init__(self, timeout=0):
+        self.timeout = timeout
+        # Use an eventlet green thread lock instead of the regular threading
+        # module. The main threading module is not monkey patched, so all of
+        # the green threads would share the same base lock. The guard only
+        # protects locks, the per-instance locks are waited on without it.
+        self.guard = gthreading.Lock()
+        self.locks = {}
+        self.stats = {'acquired': 0,
+                      'contended': 0,
+                      'timeouts': 0,
+                      'wait_time': 0.0,
+                      'max_wait_time': 0.0}
+
+    def _value(self, value):
+        if callable(value):
+            return value()
+        return value
+
+    def acquire(self, key, blocking=True):
+        """
+        Locks the instance for the current greenthread. Returns False without
+        waiting if the lock is held elsewhere and blocking is not set.
+        """
+        current_thread = id(greenlet.getcurrent())
+        self.guard.acquire()
+        try:
+            LOG.debug(_("Acquiring lock for instance %s" % (key)))
+            lock = self.locks.get(key, None)
+            if lock is None:
+                lock = InstanceLock()
+                self.locks[key] = lock
+
+            if lock.owner is None or lock.owner == current_thread:
+                lock.owner = current_thread
+                lock.refcount += 1
+                self.stats['acquired'] += 1
+                LOG.debug(_("Acquired lock for instance %s (me: %s, refcount=%s)" \
+                            % (key, current_thread, lock.refcount)))
+                return True
+
+            if not blocking:
+                return False
+
+            LOG.debug(_("Lock for instance %s already acquired by %s (me: %s)" \
+                        % (key, lock.owner, current_thread)))
+            waiter = event.Event()
+            lock.waiters.append((current_thread, waiter))
+            self.stats['contended'] += 1
+        finally:
+            self.guard.release()
+
+        start = time.time()
+        timeout = None
+        if self._value(self.timeout) > 0:
+            timeout = eventlet.Timeout(self._value(self.timeout))
+        try:
+            # The lock is handed over by release, along with a refcount of
+            # one, before the waiter is signalled.
+            waiter.wait()
+        except:
+            ei = sys.exc_info()
+            self.guard.acquire()
+            try:
+                handed_over = (lock.owner == current_thread)
+                if not handed_over:
+                    lock.waiters.remove((current_thread, waiter))
+            finally:
+                self.guard.release()
+
+            if ei[1] is timeout:
+                if not handed_over:
+                    self.stats['timeouts'] += 1
+                    raise exception.NovaException(
+                        _("Timed out waiting for the lock on instance %s") % key)
+                # We were handed the lock just as we timed out, so keep it.
+            else:
+                # Never leave the lock with a greenthread that is going away.
+                if handed_over:
+                    self.release(key)
+                raise ei[0], ei[1], ei[2]
+        finally:
+            if timeout is not None:
+                timeout.cancel()
+            waited = time.time() - start
+            self.stats['wait_time'] += waited
+            self.stats['max_wait_time'] = max(self.stats['max_wait_time'], waited)
+
+        self.stats['acquired'] += 1
+        LOG.debug(_("Acquired lock for instance %s (me: %s, waited=%.3fs)" \
+                    % (key, current_thread, waited)))
+        return True
+
+    def release(self, key):
+        self.guard.acquire()
+        try:
+            lock = self.locks.get(key, None)
+            if lock is None:
+                return
+            if lock.refcount > 1:
+                lock.refcount -= 1
+            elif len(lock.waiters) > 0:
+                # Hand the lock to the next waiter in line and only wake it up.
+                (lock.owner, waiter) = lock.waiters.popleft()
+                lock.refcount = 1
+                waiter.send()
+            else:
+                del self.locks[key]
+        finally:
+            self.guard.release()
+
+    def locked(self):
+        """ Returns the keys of the instances that are locked. """
+        self.guard.acquire()
+        try:
+            return set(self.locks.keys())
+        finally:
+            self.guard.release()
+
+    def get_stats(self):
+        return dict(self.stats, locked=len(self.locks))
@@ -0,0 +1,58 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+A small least recently used cache for what a host remembers about the
+live-images launched on it.
+"""
+
+import collections
+
+class LRUCache(object):
+    """
+    The values of the most recently used keys, up to size of them (which may
+    be a callable, so that it follows a configuration option).
+    """
+
+    def __init__(self, size=64):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def _value(self, value):
+        if callable(value):
+            return value()
+        return value
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        value = self.entries.pop(key, None)
+        if value is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        self.entries[key] = value
+        return value
+
+    def put(self, key, value):
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while len(self.entries) > max(self._value(self.size), 0):
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
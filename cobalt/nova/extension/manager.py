@@ -20,15 +20,15 @@ The :py:class:`CobaltManager` class is a :py:class:`nova.manager.Manager` that
 handles RPC calls relating to Cobalt functionality creating instances.
 """
 
+import random
 import time
 import traceback
 import os
 import re
-import socket
-import subprocess
+import sys
 
+import eventlet
 import greenlet
-from eventlet.green import threading as gthreading
 
 from nova import conductor
 from nova import context as nova_context
@@ -51,18 +51,211 @@ cobalt_opts = [
                help='IPv4 address to host migrations from; the VM on the '
                     'migration destination will connect to this address. '
                     'Must be in dotted-decimcal format, i.e., ddd.ddd.ddd.ddd. '
+                    'A different address can be given for each destination '
+                    'host as a comma separated list of host=address pairs. '
                     'By default, the outgoing migration address is determined '
                     'automatically by the host\'s routing tables.'),
 
+                cfg.IntOpt('cobalt_migration_dns_ttl',
+                default=300,
+                help='The number of seconds the address of a migration '
+                     'destination host is cached for.'),
+
                 cfg.IntOpt('cobalt_compute_timeout',
                 deprecated_name='gridcentric_compute_timeout',
                 default=60* 60,
                 help='The timeout used to wait on called to nova-compute to setup the '
                      'iptables rules for an instance. Since this is a locking procedure '
-                     'mutliple launches on the same host will be processed synchronously. '
+                     'mutliple launches on the same host will be processed synchronously, '
+                     'unless nova-compute runs the cobalt libvirt driver, which updates '
+                     'iptables once for all of the instances set up within '
+                     'cobalt_iptables_batch_window seconds. '
                      'This timeout can be raised to ensure that launch waits long enough '
                      'for nova-compute to process its request. By default this is set to '
-                     'one hour.')]
+                     'one hour.'),
+
+                cfg.IntOpt('cobalt_lock_timeout',
+                default=0,
+                help='The number of seconds an operation waits for another '
+                     'operation on the same instance to finish before giving '
+                     'up. By default operations wait indefinitely.'),
+
+                cfg.StrOpt('cobalt_operation_limits',
+                default='launch=16,bless=4,migrate_out=2,migrate_in=4,discard=8',
+                help='The maximum number of operations of each kind '
+                     '(launch, bless, migrate_out, migrate_in and discard) '
+                     'that this host runs at once, as operation=limit pairs. '
+                     'Further operations wait, incoming migrations first and '
+                     'new launches last. A limit of 0 means no limit.'),
+
+                cfg.IntOpt('cobalt_max_concurrent_operations',
+                default=0,
+                help='The maximum number of operations of all kinds that this '
+                     'host runs at once, or 0 for no limit. Incoming '
+                     'migrations are not counted, since their source host is '
+                     'waiting on them.'),
+
+                cfg.IntOpt('cobalt_notification_queue_size',
+                default=1000,
+                help='The number of notifications that can wait to be emitted '
+                     'by the notification greenthread. Set to 0 to emit '
+                     'notifications from the operations themselves.'),
+
+                cfg.IntOpt('cobalt_notification_batch_size',
+                default=50,
+                help='The maximum number of notifications emitted before the '
+                     'notification greenthread yields to other work.'),
+
+                cfg.StrOpt('cobalt_notification_overflow',
+                default='drop_oldest',
+                help='What to do with a notification when the queue is full: '
+                     'drop_oldest, drop_newest or block (the operation waits '
+                     'for room).'),
+
+                cfg.StrOpt('cobalt_notification_payload',
+                default='full',
+                help='The payload of notifications: full, for the usage '
+                     'information nova sends, or lean, for only the identity '
+                     'and state of the instance.'),
+
+                cfg.StrOpt('cobalt_metrics_file',
+                default='$state_path/cobalt-metrics.json',
+                help='The file to which histograms of the time spent in each '
+                     'phase of the operations on this host are written. Set '
+                     'to an empty string to not write them.'),
+
+                cfg.IntOpt('cobalt_metrics_interval',
+                default=60,
+                help='The minimum number of seconds between two writes of the '
+                     'metrics file.'),
+
+                cfg.IntOpt('cobalt_refresh_host_interval',
+                default=60,
+                help='The minimum number of seconds between two scans of this '
+                     'host for instances left behind by interrupted migrations.'),
+
+                cfg.IntOpt('cobalt_refresh_host_jitter',
+                default=30,
+                help='Up to this many seconds are randomly added to the first '
+                     'and every following host scan so that hosts do not all '
+                     'query the database at the same time.'),
+
+                cfg.IntOpt('cobalt_refresh_host_batch_size',
+                default=20,
+                help='The number of instance updates the host scan applies '
+                     'before yielding to other operations.'),
+
+                cfg.IntOpt('cobalt_volume_operation_concurrency',
+                default=8,
+                help='The number of requests for volume snapshots, detaches, '
+                     'etc. that are issued concurrently for one instance.'),
+
+                cfg.IntOpt('cobalt_launch_cache_size',
+                default=64,
+                help='The number of live-images for which this host remembers '
+                     'the artifacts, networks and vms policy needed to launch '
+                     'them, so that repeated launches skip the lookups.'),
+
+                cfg.IntOpt('cobalt_port_pool_size',
+                default=0,
+                help='The number of unbound quantum ports kept ready for each '
+                     'tenant network that live-images are launched on, so that '
+                     'launches do not wait for ports to be created. Networks '
+                     'join the pool on their first launch. Set to 0 to disable '
+                     'the pool.'),
+
+                cfg.IntOpt('cobalt_port_pool_max_ports',
+                default=100,
+                help='The largest number of ports pooled on this host.'),
+
+                cfg.IntOpt('cobalt_port_pool_idle_timeout',
+                default=3600,
+                help='The number of seconds after the last launch on a network '
+                     'that its pooled ports are deleted.'),
+
+                cfg.StrOpt('cobalt_warm_pool',
+                default='',
+                help='The live-images that this host keeps paused clones of, '
+                     'as live-image-uuid=count pairs. A launch of one of them '
+                     'takes a pooled clone when it can, and the pool is '
+                     'refilled in the background. Empty disables the pool.'),
+
+                cfg.IntOpt('cobalt_warm_pool_max_instances',
+                default=20,
+                help='The largest number of clones pooled on this host.'),
+
+                cfg.IntOpt('cobalt_warm_pool_idle_timeout',
+                default=3600,
+                help='The number of seconds after the last launch of a '
+                     'live-image that its pooled clones are deleted. They are '
+                     'pooled again after its next launch on this host. 0 '
+                     'keeps them forever.'),
+
+                cfg.FloatOpt('cobalt_retry_initial_delay',
+                default=0.5,
+                help='The upper bound, in seconds, of the randomized delay before '
+                     'the first retry of a failed database update or RPC call. The '
+                     'bound doubles with every retry.'),
+
+                cfg.FloatOpt('cobalt_retry_max_delay',
+                default=10.0,
+                help='The largest upper bound, in seconds, of the randomized delay '
+                     'between two retries.'),
+
+                cfg.IntOpt('cobalt_db_retry_deadline',
+                default=60,
+                help='The number of seconds a database update is retried for '
+                     'before the operation fails. Calls to nova-compute and the '
+                     'network service are retried for cobalt_compute_timeout '
+                     'seconds.'),
+
+                cfg.IntOpt('cobalt_evacuate_wave_size',
+                default=8,
+                help='The number of instances an evacuation migrates at once. '
+                     'The next wave starts once the whole wave is done. The '
+                     'migrations are still subject to cobalt_operation_limits.'),
+
+                cfg.IntOpt('cobalt_evacuate_per_destination',
+                default=2,
+                help='The maximum number of instances a wave of an evacuation '
+                     'migrates to the same destination host, or 0 for no limit.'),
+
+                cfg.IntOpt('cobalt_evacuate_bandwidth',
+                default=0,
+                help='The network bandwidth, in Mbit/s, that an evacuation may '
+                     'use. Waves are made smaller so that their migrations, at '
+                     'cobalt_migration_bandwidth each, fit. 0 means no limit.'),
+
+                cfg.IntOpt('cobalt_migration_bandwidth',
+                default=1000,
+                help='The network bandwidth, in Mbit/s, that one migration is '
+                     'expected to use.'),
+
+                cfg.IntOpt('cobalt_evacuate_retries',
+                default=2,
+                help='The number of times an evacuation retries a failed '
+                     'migration, on another destination host if there is one.'),
+
+                cfg.IntOpt('cobalt_migration_heartbeat_interval',
+                default=5,
+                help='The number of seconds between the heartbeats the '
+                     'destination of a migration sends to the source host.'),
+
+                cfg.IntOpt('cobalt_migration_stall_timeout',
+                default=30,
+                help='The number of seconds without a heartbeat after which the '
+                     'source host gives up on a migration and rolls it back.'),
+
+                cfg.IntOpt('cobalt_migration_base_timeout',
+                default=300,
+                help='The number of seconds the destination of a migration is '
+                     'given to launch the instance, on top of the time its '
+                     'artifacts are expected to take to transfer.'),
+
+                cfg.FloatOpt('cobalt_migration_throughput',
+                default=20.0,
+                help='The throughput, in MB/s, that the artifacts of a migration '
+                     'are expected to transfer at until one has been observed.')]
 CONF.register_opts(cobalt_opts)
 
 from nova import manager
@@ -87,6 +280,20 @@ from nova import notifications
 
 from cobalt.nova.api import API
 import cobalt.nova.extension.vmsconn as vmsconn
+from cobalt.nova.extension import admission
+from cobalt.nova.extension import evacuation
+from cobalt.nova.extension import launch
+from cobalt.nova.extension import locks
+from cobalt.nova.extension import manifest
+from cobalt.nova.extension import metrics
+from cobalt.nova.extension import migrationwatch
+from cobalt.nova.extension import notifyqueue
+from cobalt.nova.extension import portpool
+from cobalt.nova.extension import profiler
+from cobalt.nova.extension import retry
+from cobalt.nova.extension import routing
+from cobalt.nova.extension import updatebuffer
+from cobalt.nova.extension import warmpool
 
 def _lock_call(fn):
     """
@@ -115,7 +322,8 @@ def _lock_call(fn):
             instance_ref['name'] = CONF.instance_name_template % instance_ref['id']
 
         LOG.debug("Locking instance %s (fn:%s)" % (instance_uuid, fn.__name__))
-        self._lock_instance(instance_uuid)
+        with metrics.phase('lock'):
+            self._lock_instance(instance_uuid)
         try:
             return fn(self, context, **kwargs)
         finally:
@@ -127,6 +335,118 @@ def _lock_call(fn):
 
     return wrapped_fn
 
+def _operation_name(operation, kwargs):
+    """ The operation may be a function of the call's keyword arguments. """
+    if callable(operation):
+        return operation(kwargs)
+    return operation
+
+def _launch_operation(kwargs):
+    if kwargs.get('migration_url'):
+        return 'migrate_in'
+    return 'launch'
+
+def _timed(operation):
+    """
+    Times the call, split into the phases it marks, and records the timings
+    in the metrics of the host. A call made while another operation is timed
+    in the same greenthread (e.g. the bless of a migration) is timed as one
+    of its phases instead.
+    """
+
+    def decorator(fn):
+        def wrapped_fn(self, context, **kwargs):
+            name = _operation_name(operation, kwargs)
+            if metrics.current().operation is not None:
+                with metrics.phase(name):
+                    return fn(self, context, **kwargs)
+
+            timer = metrics.PhaseTimer(name)
+            failed = True
+            with metrics.timing(timer):
+                try:
+                    result = fn(self, context, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    self.metrics.record(timer, failed=failed)
+                    profiler.operation_done()
+
+        wrapped_fn.__name__ = fn.__name__
+        wrapped_fn.__doc__ = fn.__doc__
+
+        return wrapped_fn
+
+    return decorator
+
+def _admitted(operation):
+    """
+    Holds the call back until admission control lets an operation of its kind
+    run on this host. This wraps _timed and _lock_call so that queued calls
+    hold no locks and are timed from their admission.
+
+    A call that waited where it was dispatched would hold one of the workers
+    of nova's RPC dispatcher, and a burst of queued launches would leave none
+    for the incoming migrations, their heartbeats and confirmations. So a
+    call that has to queue returns right away and waits in a greenthread of
+    its own, unless its caller waits for the reply (see admission.REPLIED).
+    """
+
+    def decorator(fn):
+        def run(self, context, kwargs):
+            try:
+                return fn(self, context, **kwargs)
+            finally:
+                self.admission.release()
+
+        def run_queued(self, context, name, kwargs):
+            try:
+                self.admission.admit(name)
+                run(self, context, kwargs)
+            except:
+                _log_error(name)
+
+        def wrapped_fn(self, context, **kwargs):
+            name = _operation_name(operation, kwargs)
+            if self.admission.admit(name, blocking=False):
+                return run(self, context, kwargs)
+            if name in admission.REPLIED:
+                self.admission.admit(name)
+                return run(self, context, kwargs)
+            LOG.debug(_("Queueing %s (fn:%s) in the background"), name, fn.__name__)
+            eventlet.spawn_n(run_queued, self, context, name, kwargs)
+
+        wrapped_fn.__name__ = fn.__name__
+        wrapped_fn.__doc__ = fn.__doc__
+
+        return wrapped_fn
+
+    return decorator
+
+def _heartbeats(fn):
+    """
+    Sends heartbeats to the source host of a migration for as long as the
+    call, including its wait for admission and locks, is in progress.
+    """
+
+    def wrapped_fn(self, context, **kwargs):
+        source_host = kwargs.get('heartbeat_host', None)
+        if not source_host:
+            return fn(self, context, **kwargs)
+        instance_uuid = kwargs.get('instance_uuid', None) or \
+                        kwargs['instance_ref']['uuid']
+        heartbeat = eventlet.spawn(self._send_heartbeats, context,
+                                   instance_uuid, source_host)
+        try:
+            return fn(self, context, **kwargs)
+        finally:
+            heartbeat.kill()
+
+    wrapped_fn.__name__ = fn.__name__
+    wrapped_fn.__doc__ = fn.__doc__
+
+    return wrapped_fn
+
 def memory_string_to_pages(mem):
     mem = mem.lower()
     units = { '^(\d+)tb$' : 40,
@@ -148,48 +468,87 @@ def _log_error(operation):
     """ Log exceptions with a common format. """
     LOG.exception(_("Error during %s") % operation)
 
-def _retry_rpc(fn):
-    def wrapped_fn(*args, **kwargs):
-        timeout = CONF.gridcentric_compute_timeout
-        i = 0
-        start = time.time()
-        while True:
-            try:
-                return fn(*args, **kwargs)
-            except Timeout:
-                elapsed = time.time() - start
-                if elapsed > timeout:
-                    raise
-                LOG.debug(_("%s timing out after %d seconds, try %d."),
-                            fn.__name__, elapsed, i)
-                i += 1
+def _map_concurrently(fn, items, concurrency):
+    """
+    Calls fn on every item, with at most concurrency calls in flight, and
+    returns a (result, exc_info) pair for each item once all calls are done.
+    """
+    pool = eventlet.GreenPool(max(concurrency, 1))
+    results = [None] * len(items)
 
-    wrapped_fn.__name__ = fn.__name__
-    wrapped_fn.__doc__ = fn.__doc__
+    def run(index, item):
+        try:
+            results[index] = (fn(item), None)
+        except:
+            results[index] = (None, sys.exc_info())
 
-    return wrapped_fn
+    for index, item in enumerate(items):
+        pool.spawn_n(run, index, item)
+    pool.waitall()
+    return results
 
 class CobaltManager(manager.SchedulerDependentManager):
 
     def __init__(self, *args, **kwargs):
 
         self.quantum_attempted = False
+        self.port_pool = None
+        self.port_pool_reclaimed = False
+        self.warm_pool = None
+        self.launch_contexts = launch.LaunchContextCache(
+                    size=lambda: CONF.cobalt_launch_cache_size)
+        self.evacuating = False
+        self.migration_watches = {}
+        # The throughput of the last migrations, in bytes per second.
+        self.migration_throughput = CONF.cobalt_migration_throughput * 1024 * 1024
         self.network_api = network.API()
         self.cobalt_api = API()
         self.compute_manager = compute_manager.ComputeManager()
         self.volume_api = volume.API()
         self.conductor_api = conductor.API()
 
+        # Database updates are idempotent, so any error that does not come
+        # from the update itself is worth retrying. Calls to other services
+        # are only retried when they time out.
+        self.db_retry = retry.RetryPolicy('conductor',
+                            fatal=(exception.NotFound, exception.Invalid,
+                                   ValueError, TypeError),
+                            deadline=lambda: CONF.cobalt_db_retry_deadline,
+                            initial_delay=lambda: CONF.cobalt_retry_initial_delay,
+                            max_delay=lambda: CONF.cobalt_retry_max_delay)
+        self.rpc_retry = retry.RetryPolicy('rpc',
+                            transient=(Timeout,),
+                            deadline=lambda: CONF.cobalt_compute_timeout,
+                            initial_delay=lambda: CONF.cobalt_retry_initial_delay,
+                            max_delay=lambda: CONF.cobalt_retry_max_delay)
+
+        self.routes = routing.RouteTable(dns_ttl=CONF.cobalt_migration_dns_ttl)
+        self.admission = admission.AdmissionControl(
+                    limits=lambda: admission.parse_limits(CONF.cobalt_operation_limits),
+                    total=lambda: CONF.cobalt_max_concurrent_operations)
+
         self.vms_conn = kwargs.pop('vmsconn', None)
         self._init_vms()
         self.nodename = self.vms_conn.get_hypervisor_hostname()
 
-        # Use an eventlet green thread condition lock instead of the regular threading module. This
-        # is required for eventlet threads because they essentially run on a single system thread.
-        # All of the green threads will share the same base lock, defeating the point of using the
-        # it. Since the main threading module is not monkey patched we cannot use it directly.
-        self.cond = gthreading.Condition()
-        self.locked_instances = {}
+        self.instance_locks = locks.InstanceLocks(
+                    timeout=lambda: CONF.cobalt_lock_timeout)
+        self.bless_stats = {'paused': 0,
+                            'pause_time': 0.0,
+                            'max_pause_time': 0.0}
+        self.volume_stats = {'detached': 0,
+                             'detach_time': 0.0,
+                             'max_detach_time': 0.0}
+        self.next_refresh_host = time.time() + \
+                random.uniform(0, CONF.cobalt_refresh_host_jitter)
+        self.metrics = metrics.MetricsSink()
+        self.notifications = notifyqueue.NotificationQueue(self._emit_notification,
+                    max(CONF.cobalt_notification_queue_size, 1),
+                    batch_size=lambda: CONF.cobalt_notification_batch_size,
+                    overflow=lambda: CONF.cobalt_notification_overflow)
+        self.next_metrics_flush = 0
+        if CONF.cobalt_profile_on_start:
+            profiler.get_profiler().start()
         super(CobaltManager, self).__init__(service_name="cobalt", *args, **kwargs)
 
     def _init_vms(self):
@@ -210,60 +569,20 @@ class CobaltManager(manager.SchedulerDependentManager):
             self.vms_conn = vmsconn.get_vms_connection(connection_type)
             self.vms_conn.configure(compute_manager.ComputeVirtAPI(self.compute_manager))
 
-    def _lock_instance(self, instance_uuid):
-        self.cond.acquire()
-        try:
-            LOG.debug(_("Acquiring lock for instance %s" % (instance_uuid)))
-            current_thread = id(greenlet.getcurrent())
-
-            while True:
-                (locking_thread, refcount) = self.locked_instances.get(instance_uuid,
-                                                                       (current_thread, 0))
-                if locking_thread != current_thread:
-                    LOG.debug(_("Lock for instance %s already acquired by %s (me: %s)" \
-                            % (instance_uuid, locking_thread, current_thread)))
-                    self.cond.wait()
-                else:
-                    break
-
-            LOG.debug(_("Acquired lock for instance %s (me: %s, refcount=%s)" \
-                        % (instance_uuid, current_thread, refcount + 1)))
-            self.locked_instances[instance_uuid] = (locking_thread, refcount + 1)
-        finally:
-            self.cond.release()
+    def _lock_instance(self, instance_uuid, blocking=True):
+        """
+        Locks the instance for the current greenthread. Returns False without
+        waiting if the lock is held elsewhere and blocking is not set.
+        """
+        return self.instance_locks.acquire(instance_uuid, blocking=blocking)
 
     def _unlock_instance(self, instance_uuid):
-        self.cond.acquire()
-        try:
-            if instance_uuid in self.locked_instances:
-                (locking_thread, refcount) = self.locked_instances[instance_uuid]
-                if refcount == 1:
-                    del self.locked_instances[instance_uuid]
-                    # The lock is now available for other threads to take so wake them up.
-                    self.cond.notifyAll()
-                else:
-                    self.locked_instances[instance_uuid] = (locking_thread, refcount - 1)
-        finally:
-            self.cond.release()
+        self.instance_locks.release(instance_uuid)
 
     def _instance_update(self, context, instance_uuid, **kwargs):
         """Update an instance in the database using kwargs as value."""
-        retries = 0
-        while True:
-            try:
-                # Database updates are idempotent, so we can retry this when
-                # we encounter transient failures. We retry up to 10 seconds.
-                return self.conductor_api.instance_update(context,
-                                                          instance_uuid,
-                                                          **kwargs)
-            except:
-                # We retry the database update up to 60 seconds. This gives
-                # us a decent window for avoiding database restarts, etc.
-                if retries < 12:
-                    retries += 1
-                    time.sleep(5.0)
-                else:
-                    raise
+        return self.db_retry.call(self.conductor_api.instance_update,
+                                  context, instance_uuid, **kwargs)
 
     def _system_metadata_get(self, instance):
         '''Returns {key:value} dict of system_metadata from instance_ref.'''
@@ -274,123 +593,177 @@ class CobaltManager(manager.SchedulerDependentManager):
         self.vms_conn.periodic_clean()
 
     @periodic_task.periodic_task
-    def _refresh_host(self, context):
-
-        # Grab the global lock and fetch all instances.
-        self.cond.acquire()
-
+    def _flush_metrics(self, context):
+        now = time.time()
+        if not(CONF.cobalt_metrics_file) or now < self.next_metrics_flush:
+            return
+        self.next_metrics_flush = now + CONF.cobalt_metrics_interval
         try:
-            # Scan all instances and check for stalled operations.
-            db_instances = instance_obj.InstanceList.get_by_host(context,
-                                                                 self.host)
-            local_instances = self.compute_manager.driver.list_instances()
-            for instance in db_instances:
-
-                # If the instance is locked, then there is some active
-                # tasks working with this instance (and the BUILDING state
-                # and/or MIGRATING state) is completely fine.
-                if instance['uuid'] in self.locked_instances:
-                    continue
-
-                if instance['task_state'] == task_states.MIGRATING:
-
-                    # Set defaults.
-                    state = None
-                    host = self.host
-
-                    # Grab metadata.
-                    system_metadata = self._system_metadata_get(instance)
-                    src_host = system_metadata.get('gc_src_host', None)
-                    dst_host = system_metadata.get('gc_dst_host', None)
-
-                    if instance['name'] in local_instances:
-                        if self.host == src_host:
-                            # This is a rollback, it's here and no migration is
-                            # going on.  We simply update the database to
-                            # reflect this reality.
-                            state = vm_states.ACTIVE
-                            task = None
-
-                        elif self.host == dst_host:
-                            # This shouldn't really happen. The only case in which
-                            # it could happen is below, where we've been punted this
-                            # VM from the source host.
-                            state = vm_states.ACTIVE
-                            task = None
-
-                            # Try to ensure the networks are configured correctly.
-                            self.network_api.setup_networks_on_host(context, instance)
-                    else:
-                        if self.host == src_host:
-                            # The VM may have been moved, but the host did not change.
-                            # We update the host and let the destination take care of
-                            # the status.
-                            state = instance['vm_state']
-                            task = instance['task_state']
-                            host = dst_host
-
-
-                        elif self.host == dst_host:
-                            # This VM is not here, and there's no way it could be back
-                            # at its origin. We must mark this as an error.
-                            state = vm_states.ERROR
-                            task = None
+            self.metrics.flush(CONF.cobalt_metrics_file)
+        except:
+            _log_error("writing metrics")
 
-                    if state:
-                        self._instance_update(context, instance['uuid'], vm_state=state,
-                                              task_state=task, host=host)
+    @periodic_task.periodic_task
+    def _refresh_host(self, context):
+        now = time.time()
+        if now < self.next_refresh_host:
+            return
+        self.next_refresh_host = now + CONF.cobalt_refresh_host_interval + \
+                random.uniform(0, CONF.cobalt_refresh_host_jitter)
+        self._reconcile_host(context)
+
+    def _reconcile_migration(self, instance, local_instances):
+        """
+        Returns the updates that bring a migrating instance that no operation
+        is working on back in line with reality, or None if it is fine.
+        """
+        # Set defaults.
+        state = None
+        task = None
+        host = self.host
+        setup_networks = False
+
+        # Grab metadata.
+        system_metadata = self._system_metadata_get(instance)
+        src_host = system_metadata.get('gc_src_host', None)
+        dst_host = system_metadata.get('gc_dst_host', None)
+
+        if instance['name'] in local_instances:
+            if self.host == src_host:
+                # This is a rollback, it's here and no migration is
+                # going on.  We simply update the database to
+                # reflect this reality.
+                state = vm_states.ACTIVE
+                task = None
+
+            elif self.host == dst_host:
+                # This shouldn't really happen. The only case in which
+                # it could happen is below, where we've been punted this
+                # VM from the source host.
+                state = vm_states.ACTIVE
+                task = None
+
+                # Try to ensure the networks are configured correctly.
+                setup_networks = True
+        else:
+            if self.host == src_host:
+                # The VM may have been moved, but the host did not change.
+                # We update the host and let the destination take care of
+                # the status.
+                state = instance['vm_state']
+                task = instance['task_state']
+                host = dst_host
+
+            elif self.host == dst_host:
+                # This VM is not here, and there's no way it could be back
+                # at its origin. We must mark this as an error.
+                state = vm_states.ERROR
+                task = None
+
+        if not state:
+            return None
+        return ({'vm_state': state, 'task_state': task, 'host': host},
+                setup_networks)
 
-        finally:
-            self.cond.release()
+    def _reconcile_host(self, context):
+        """
+        Scans this host for instances stuck in the middle of a migration and
+        fixes up their state. The scan never holds the lock guard across
+        database or hypervisor calls, so operations proceed while it runs.
+        """
+        # Only migrating instances can have stalled, so only load those.
+        db_instances = instance_obj.InstanceList.get_by_filters(context,
+                            {'host': self.host,
+                             'task_state': task_states.MIGRATING},
+                            expected_attrs=['system_metadata'])
+        if len(db_instances) == 0:
+            return
+        local_instances = set(self.compute_manager.driver.list_instances())
+
+        # If the instance is locked, then there is some active
+        # tasks working with this instance (and the BUILDING state
+        # and/or MIGRATING state) is completely fine.
+        locked_instances = self.instance_locks.locked()
+
+        reconciled = []
+        for instance in db_instances:
+            if instance['uuid'] in locked_instances:
+                continue
+            updates = self._reconcile_migration(instance, local_instances)
+            if updates is not None:
+                reconciled.append((instance, updates))
+
+        batch_size = max(CONF.cobalt_refresh_host_batch_size, 1)
+        for i, (instance, (updates, setup_networks)) in enumerate(reconciled):
+            if i > 0 and i % batch_size == 0:
+                # Let the operations waiting on the database go first.
+                eventlet.sleep(0)
+
+            # An operation may have picked the instance up since the snapshot,
+            # in which case it now owns the state.
+            if not self._lock_instance(instance['uuid'], blocking=False):
+                continue
+            try:
+                if setup_networks:
+                    self.rpc_retry.call(self.network_api.setup_networks_on_host,
+                                        context, instance)
+                self._instance_update(context, instance['uuid'], **updates)
+            except:
+                _log_error("refresh host for instance %s" % instance['uuid'])
+            finally:
+                self._unlock_instance(instance['uuid'])
+
+    def get_stats(self, context):
+        """ Returns counters describing the operations on this host. """
+        stats = {'locks': self.instance_locks.get_stats(),
+                 'retries': {'conductor': dict(self.db_retry.stats),
+                             'rpc': dict(self.rpc_retry.stats)},
+                 'bless': dict(self.bless_stats),
+                 'volumes': dict(self.volume_stats),
+                 'admission': self.admission.get_stats(),
+                 'phases': self.metrics.snapshot(),
+                 'notifications': self.notifications.get_stats()}
+        stats['launch_cache'] = dict(self.launch_contexts.stats,
+                                     size=len(self.launch_contexts))
+        domain_templates = getattr(self.vms_conn, 'domain_templates', None)
+        if domain_templates != None:
+            stats['domain_templates'] = dict(domain_templates.stats,
+                                             size=len(domain_templates))
+        if self.port_pool != None:
+            stats['port_pool'] = self.port_pool.get_stats()
+        if self.warm_pool != None:
+            stats['warm_pool'] = self.warm_pool.get_stats()
+        return stats
 
     def _get_migration_address(self, dest):
-        if CONF.cobalt_outgoing_migration_address != None:
-            return CONF.cobalt_outgoing_migration_address
+        address = CONF.cobalt_outgoing_migration_address
+        if address != None:
+            if '=' not in address:
+                return address
+            # A per-destination map, destinations not in it are routed.
+            for entry in address.split(','):
+                (host, _sep, host_address) = entry.strip().partition('=')
+                if host.strip() == dest:
+                    return host_address.strip()
 
         # Figure out the interface to reach 'dest'.
         # This is used to construct our out-of-band network parameter below.
-        dest_ip = socket.gethostbyname(dest)
-        iproute = subprocess.Popen(["ip", "route", "get", dest_ip], stdout=subprocess.PIPE)
-        (stdout, stderr) = iproute.communicate()
-        lines = stdout.split("\n")
-        if len(lines) < 1:
-            raise exception.NovaException(_("No route to destination."))
-            _log_error("no route to destination")
+        return self.routes.device_for(dest)
 
-        try:
-            (destip, devstr, devname, srcstr, srcip) = lines[0].split()
-        except:
-            _log_error("garbled route output: %s" % lines[0])
-            raise
-
-        # Check that this is not local.
-        if devname == "lo":
-            raise exception.NovaException(_("Can't migrate to the same host."))
-
-        # Return the device name.
-        return devname
-
-    def _extract_list(self, metadata, key):
-        return_list = metadata.get(key, '').split(',')
-        if len(return_list) == 1 and return_list[0] == '':
-            return_list = []
-        return return_list
+    def _load_manifest(self, instance_ref):
+        return manifest.load(self._system_metadata_get(instance_ref))
 
     def _extract_image_refs(self, instance_ref):
-        return self._extract_list(self._system_metadata_get(instance_ref),
-                                  'images')
+        return self._load_manifest(instance_ref).image_refs()
 
     def _extract_lvm_info(self, instance_ref):
-        lvms = self._extract_list(self._system_metadata_get(instance_ref),
-                                  'logical_volumes')
-        lvm_info = {}
-        for key, value in map(lambda x: x.split(':'), lvms):
-            lvm_info[key] = value
-        return lvm_info
+        return self._load_manifest(instance_ref).lvm_info()
 
     def _extract_requested_networks(self, instance_ref):
-        networks = self._extract_list(self._system_metadata_get(instance_ref),
-                                      'attached_networks')
+        return self._requested_networks(
+                    self._load_manifest(instance_ref).network_ids())
+
+    def _requested_networks(self, networks):
         if len(networks) == 0:
             return None
         if self._is_quantum_v2():
@@ -415,6 +788,177 @@ class CobaltManager(manager.SchedulerDependentManager):
 
         return self.have_quantum
 
+    def _get_port_pool(self):
+        if CONF.cobalt_port_pool_size <= 0 or not self._is_quantum_v2():
+            return None
+        if self.port_pool == None:
+            from nova.network import quantumv2
+            self.port_pool = portpool.PortPool(self.host,
+                        lambda context: quantumv2.get_client(context, admin=True),
+                        size=CONF.cobalt_port_pool_size,
+                        max_ports=CONF.cobalt_port_pool_max_ports,
+                        idle_timeout=CONF.cobalt_port_pool_idle_timeout)
+        return self.port_pool
+
+    def _claim_pooled_ports(self, context, instance_ref, requested_networks):
+        """
+        Fills in pooled ports for the requested networks. Returns the requested
+        networks and the ids of the ports that were claimed.
+        """
+        pool = self._get_port_pool()
+        if pool == None or not requested_networks:
+            return requested_networks, []
+
+        networks = []
+        claimed = []
+        for (network_id, fixed_ip, port_id) in requested_networks:
+            if port_id == None and fixed_ip == None:
+                port_id = pool.claim(instance_ref['project_id'], network_id)
+                if port_id != None:
+                    claimed.append(port_id)
+            networks.append([network_id, fixed_ip, port_id])
+
+        # Replace what was taken (or create the ports that were missed).
+        eventlet.spawn_n(self._refill_port_pool, context)
+        return networks, claimed
+
+    def _refill_pool(self, context, name, pool, prepare=None):
+        """
+        Tops up the pool, if there is one. prepare is first called with the
+        context and the pool to bring the pool in line with this host.
+        """
+        if pool == None:
+            return
+        try:
+            if prepare != None:
+                prepare(context, pool)
+            pool.refill(context)
+        except:
+            _log_error("refilling the %s" % name)
+
+    @periodic_task.periodic_task
+    def _refill_port_pool(self, context):
+        self._refill_pool(context, "port pool", self._get_port_pool(),
+                          self._reclaim_pooled_ports)
+
+    def _reclaim_pooled_ports(self, context, pool):
+        """ Takes back the ports pooled here before the service restarted. """
+        if not(self.port_pool_reclaimed):
+            pool.reclaim(context)
+            self.port_pool_reclaimed = True
+
+    def _get_warm_pool(self):
+        if self.warm_pool == None:
+            sizes = admission.parse_limits(CONF.cobalt_warm_pool)
+            if len(sizes) == 0:
+                return None
+            self.warm_pool = warmpool.WarmPool(self._launch_pooled_instance,
+                        self._delete_pooled_instance,
+                        sizes,
+                        max_instances=CONF.cobalt_warm_pool_max_instances,
+                        idle_timeout=CONF.cobalt_warm_pool_idle_timeout)
+        return self.warm_pool
+
+    def _launch_pooled_instance(self, context, live_image):
+        """
+        Launches a clone of the live-image on this host for the warm pool. The
+        clone belongs to the project of the live-image, so that its network
+        and quota are those of the launches that will claim it.
+        """
+        live_image_ref = self.conductor_api.instance_get_by_uuid(context, live_image)
+        pool_context = nova_context.RequestContext(live_image_ref['user_id'],
+                                                   live_image_ref['project_id'],
+                                                   is_admin=True)
+        instance = self.cobalt_api.launch_instance(pool_context, live_image,
+                        params={'name': '%s-pool' % live_image_ref['display_name'],
+                                'availability_zone': ':%s' % self.host},
+                        warm_pool=True)
+        return instance['uuid']
+
+    def _delete_pooled_instance(self, context, instance_uuid, pooled=True):
+        if pooled:
+            # Take the clone out of the pool first, so no launch claims it
+            # while it is being deleted.
+            self.conductor_api.instance_update(context, instance_uuid,
+                                               task_state=None,
+                                               expected_task_state=warmpool.POOLED)
+        compute_api = self.cobalt_api.compute_api
+        compute_api.delete(context, compute_api.get(context, instance_uuid,
+                                                    want_objects=True))
+
+    @periodic_task.periodic_task
+    def _refill_warm_pool(self, context):
+        self._refill_pool(context, "warm pool", self._get_warm_pool(),
+                          self._sync_warm_pool)
+
+    def _sync_warm_pool(self, context, pool):
+        """ Tells the pool which clones are paused on this host. """
+        pooled = instance_obj.InstanceList.get_by_filters(context,
+                        {'host': self.host,
+                         'task_state': warmpool.POOLED},
+                        expected_attrs=['system_metadata'])
+        pool.sync([(self._system_metadata_get(instance).get('launched_from'),
+                    instance['uuid']) for instance in pooled])
+
+    def _build_launch_context(self, context, source_instance_ref):
+        artifact_manifest = self._load_manifest(source_instance_ref)
+        return launch.LaunchContext(source_instance_ref['name'],
+                                    artifact_manifest.image_refs(),
+                                    artifact_manifest.lvm_info(),
+                                    self._requested_networks(artifact_manifest.network_ids()),
+                                    self._generate_vms_policy_template(context,
+                                                                       source_instance_ref),
+                                    artifact_manifest.images())
+
+    def _build_manifest(self, context, image_refs, lvms, descriptions=None,
+                        describe=True):
+        """
+        Returns the manifest of the artifacts of a new live-image. The images
+        that are not already described are described if describe is set.
+        """
+        descriptions = dict(descriptions or {})
+        undescribed = [image_ref for image_ref in image_refs
+                       if image_ref not in descriptions]
+        try:
+            if describe and undescribed:
+                descriptions.update(self.vms_conn.describe_artifacts(context,
+                                                                     undescribed))
+        except:
+            # The manifest is still usable, launches just have to ask the
+            # image service about the artifacts themselves.
+            _log_error("describing artifacts")
+        artifact_manifest = manifest.Manifest()
+        for image_ref in image_refs:
+            artifact_manifest.add(manifest.IMAGE, image_ref,
+                                  **descriptions.get(image_ref, {}))
+        for lvm in lvms:
+            name, size = lvm.split(':')
+            artifact_manifest.add(manifest.LOGICAL_VOLUME, name, size=size)
+        return artifact_manifest
+
+    def _get_launch_context(self, context, instance_ref):
+        """
+        Returns the launch context of the live-image that instance_ref is
+        launched from, looking the live-image up only on a cache miss.
+        """
+        blessed_uuid = self._system_metadata_get(instance_ref).get('launched_from', None)
+        launch_context = None
+        if blessed_uuid != None:
+            launch_context = self.launch_contexts.get(blessed_uuid)
+        if launch_context == None:
+            source_instance_ref = self._get_source_instance(context, instance_ref)
+            launch_context = self._build_launch_context(context, source_instance_ref)
+            if blessed_uuid != None:
+                self.launch_contexts.put(blessed_uuid, launch_context)
+        return launch_context
+
+    def invalidate_launch_context(self, context, instance_uuid=None):
+        """
+        Forgets what was cached about launching the blessed instance, which is
+        being discarded or changed.
+        """
+        self.launch_contexts.invalidate(instance_uuid)
+
     def _get_source_instance(self, context, instance_ref):
         """
         Returns an instance reference for the source instance of instance_ref. In other words:
@@ -435,14 +979,39 @@ class CobaltManager(manager.SchedulerDependentManager):
                                                      source_instance_uuid)
         return None
 
-    def _notify(self, context, instance_ref, operation, network_info=None):
+    def _lean_usage_info(self, instance_ref):
+        """ The identity and state of the instance, without the usage. """
+        return {'instance_id': instance_ref['uuid'],
+                'tenant_id': instance_ref['project_id'],
+                'user_id': instance_ref['user_id'],
+                'display_name': instance_ref['display_name'],
+                'host': instance_ref['host'],
+                'state': instance_ref['vm_state'],
+                'state_description': instance_ref['task_state']}
+
+    def _emit_notification(self, context, event_type, payload):
+        notifier.notify(context, 'cobalt.%s' % self.host, event_type,
+                        notifier.INFO, payload)
+
+    def _queue_notification(self, context, event_type, payload):
+        if CONF.cobalt_notification_queue_size > 0:
+            self.notifications.put((context, event_type, payload))
+        else:
+            self._emit_notification(context, event_type, payload)
+
+    def _notify(self, context, instance_ref, operation, network_info=None,
+                phases=None):
         try:
-            usage_info = notifications.info_from_instance(context, instance_ref,
-                                                          network_info=network_info,
-                                                          system_metadata=None)
-            notifier.notify(context, 'cobalt.%s' % self.host,
-                            'cobalt.instance.%s' % operation,
-                            notifier.INFO, usage_info)
+            if CONF.cobalt_notification_payload == 'lean':
+                usage_info = self._lean_usage_info(instance_ref)
+            else:
+                usage_info = notifications.info_from_instance(context, instance_ref,
+                                                              network_info=network_info,
+                                                              system_metadata=None)
+            if phases is not None:
+                usage_info['phases'] = phases
+            self._queue_notification(context, 'cobalt.instance.%s' % operation,
+                                     usage_info)
         except:
             # (amscanne): We do not put the instance into an error state during a notify exception.
             # It doesn't seem reasonable to do this, as the instance may still be up and running,
@@ -454,55 +1023,131 @@ class CobaltManager(manager.SchedulerDependentManager):
 
     def _snapshot_attached_volumes(self, context,  source_instance, instance):
         """
-        Creates a snaptshot of all of the attached volumes.
+        Creates a snaptshot of all of the attached volumes. The source instance
+        is paused while the snapshots are requested and stays paused until its
+        memory is blessed, so that the disks and the memory agree. Returns the
+        (block device mapping, snapshot) pairs and the time of the pause.
         """
 
         block_device_mappings = self.conductor_api.\
                 block_device_mapping_get_all_by_instance(context, instance)
         root_device_name = source_instance['root_device_name']
-        snapshots = []
 
-        paused = False
-        for bdm in block_device_mappings:
-            if bdm['no_device']:
-                continue
-
-            if not paused:
-                self.vms_conn.pause_instance(source_instance)
-                paused = True
-
-            volume_id = bdm.get('volume_id')
-            if volume_id:
-                # create snapshot based on volume_id
-                volume = self.volume_api.get(context, volume_id)
+        # Look up the volumes before pausing, they don't change with the guest.
+        volume_bdms = [bdm for bdm in block_device_mappings
+                       if not bdm['no_device'] and bdm.get('volume_id')]
+        if len(volume_bdms) == 0:
+            return [], None
+        volumes = []
+        for (volume, exc_info) in _map_concurrently(
+                lambda bdm: self.volume_api.get(context, bdm['volume_id']),
+                volume_bdms, CONF.cobalt_volume_operation_concurrency):
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            volumes.append(volume)
+
+        name = _('snapshot for %s') % instance['name']
+        def create_snapshot(volume):
+            return self.volume_api.create_snapshot_force(
+                context, volume, name, volume['display_description'])
+
+        paused_at = time.time()
+        self.vms_conn.pause_instance(source_instance)
+        results = _map_concurrently(create_snapshot, volumes,
+                                    CONF.cobalt_volume_operation_concurrency)
+        LOG.debug(_("Requested %d volume snapshots for %s in %.3fs"),
+                  len(volumes), source_instance['uuid'], time.time() - paused_at)
+
+        volume_snapshots = [(bdm, snapshot) for (bdm, (snapshot, exc_info))
+                            in zip(volume_bdms, results) if exc_info is None]
+        errors = [exc_info for (snapshot, exc_info) in results if exc_info is not None]
+        if len(errors) > 0:
+            self._delete_volume_snapshots(context, volume_snapshots)
+            self._unpause_source(source_instance, paused_at)
+            exc_info = errors[0]
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        return volume_snapshots, paused_at
+
+    def _delete_volume_snapshots(self, context, volume_snapshots):
+        """
+        Removes the snapshots that no blessed instance will own.
+        """
+        for bdm, snapshot in volume_snapshots:
+            try:
+                self.volume_api.delete_snapshot(context, snapshot)
+            except:
+                _log_error("removing snapshot %s" % snapshot['id'])
 
-                name = _('snapshot for %s') % instance['name']
-                snapshot = self.volume_api.create_snapshot_force(
-                    context, volume, name, volume['display_description'])
+    def _record_snapshot_bdms(self, context, volume_snapshots):
+        """
+        Points the blessed block device mappings at their snapshots.
+        """
+        for bdm, snapshot in volume_snapshots:
+            # Update the blessed device mapping to include the snapshot id.
+            # We also mark it for deletion and this will cascade to the
+            # volume booted when launching.
+            self.conductor_api.\
+                block_device_mapping_update(context.elevated(),
+                                            bdm['id'],
+                                            {'snapshot_id': snapshot['id'],
+                                             'delete_on_termination': True,
+                                             'volume_id': None})
+
+    def _unpause_source(self, instance, paused_at):
+        """
+        Resumes a source instance that was paused for a bless that will not
+        resume it.
+        """
+        try:
+            self.vms_conn.unpause_instance(instance)
+        except:
+            _log_error("unpausing %s" % instance['uuid'])
+        self._record_pause(instance, paused_at)
 
-                # Update the blessed device mapping to include the snapshot id.
-                # We also mark it for deletion and this will cascade to the
-                # volume booted when launching.
-                self.conductor_api.\
-                    block_device_mapping_update(context.elevated(),
-                                                bdm['id'],
-                                                {'snapshot_id': snapshot['id'],
-                                                 'delete_on_termination': True,
-                                                 'volume_id': None})
+    def _record_pause(self, instance, paused_at):
+        paused = time.time() - paused_at
+        self.bless_stats['paused'] += 1
+        self.bless_stats['pause_time'] += paused
+        self.bless_stats['max_pause_time'] = max(self.bless_stats['max_pause_time'], paused)
+        LOG.info(_("Instance %s was paused for %.3fs to snapshot its volumes"),
+                 instance['uuid'], paused)
 
     def _detach_volumes(self, context, instance):
         block_device_mappings = self.conductor_api.\
             block_device_mapping_get_all_by_instance(context, instance)
-        for bdm in block_device_mappings:
+        volume_ids = [bdm['volume_id'] for bdm in block_device_mappings
+                      if bdm.get('volume_id')]
+        if len(volume_ids) == 0:
+            return
+
+        # The connector describes this host, so it is the same for every volume.
+        connector = self.compute_manager.driver.get_volume_connector(instance)
+
+        def detach(volume_id):
+            start = time.time()
             try:
-                volume = self.volume_api.get(context, bdm['volume_id'])
-                connector = self.compute_manager.driver.get_volume_connector(instance)
+                volume = self.volume_api.get(context, volume_id)
                 self.volume_api.terminate_connection(context, volume, connector)
                 self.volume_api.detach(context, volume)
             except exception.DiskNotFound as exc:
                 LOG.warn(_('Ignoring DiskNotFound: %s') % exc, instance=instance)
             except exception.VolumeNotFound as exc:
                 LOG.warn(_('Ignoring VolumeNotFound: %s') % exc, instance=instance)
+            finally:
+                elapsed = time.time() - start
+                self.volume_stats['detached'] += 1
+                self.volume_stats['detach_time'] += elapsed
+                self.volume_stats['max_detach_time'] = \
+                        max(self.volume_stats['max_detach_time'], elapsed)
+                LOG.debug(_("Detaching volume %s took %.3fs"), volume_id, elapsed,
+                          instance=instance)
+
+        results = _map_concurrently(detach, volume_ids,
+                                    CONF.cobalt_volume_operation_concurrency)
+        for (result, exc_info) in results:
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
 
     def _discard_blessed_snapshots(self, context, instance):
         """Removes the snapshots created for the blessed instance."""
@@ -522,6 +1167,8 @@ class CobaltManager(manager.SchedulerDependentManager):
                 except:
                     LOG.warn(_("Failed to remove blessed snapshot %s") %(snapshot_id))
 
+    @_admitted('bless')
+    @_timed('bless')
     @_lock_call
     def bless_instance(self, context, instance_uuid=None, instance_ref=None,
                        migration_url=None, migration_network_info=None):
@@ -541,9 +1188,14 @@ class CobaltManager(manager.SchedulerDependentManager):
             assert source_instance_ref is not None
             migration = False
 
+        volume_snapshots = []
+        paused_at = None
         if not(migration):
             try:
-                self._snapshot_attached_volumes(context, source_instance_ref, instance_ref)
+                with metrics.phase('snapshot_volumes'):
+                    volume_snapshots, paused_at = \
+                        self._snapshot_attached_volumes(context, source_instance_ref,
+                                                        instance_ref)
             except:
                 _log_error("snapshot volumes")
                 raise
@@ -552,25 +1204,41 @@ class CobaltManager(manager.SchedulerDependentManager):
         try:
             # Lock the source instance if blessing
             if not(migration):
-                self._instance_update(context, source_instance_ref['uuid'],
-                                      task_state='blessing')
-                LOG.debug("Locking source instance %s (fn:%s)" %
-                                (source_instance_ref['uuid'], "bless_instance"))
-                self.compute_manager.compute_api.lock(context, source_instance_ref)
-                source_locked = True
+                try:
+                    self._instance_update(context, source_instance_ref['uuid'],
+                                          task_state='blessing')
+                    LOG.debug("Locking source instance %s (fn:%s)" %
+                                    (source_instance_ref['uuid'], "bless_instance"))
+                    self.compute_manager.compute_api.lock(context, source_instance_ref)
+                    source_locked = True
+                except:
+                    if paused_at is not None:
+                        self._unpause_source(source_instance_ref, paused_at)
+                    raise
 
             # Create a new 'blessed' VM with the given name.
             # NOTE: If this is a migration, then a successful bless will mean that
             # the VM no longer exists. This requires us to *relaunch* it below in
             # the case of a rollback later on.
-            name, migration_url, blessed_files, lvms = self.vms_conn.bless(context,
-                                                source_instance_ref['name'],
-                                                instance_ref,
-                                                migration_url=migration_url)
+            blessed = False
+            try:
+                name, migration_url, blessed_files, lvms = self.vms_conn.bless(context,
+                                                    source_instance_ref['name'],
+                                                    instance_ref,
+                                                    migration_url=migration_url)
+                blessed = True
+            finally:
+                if paused_at is not None:
+                    if blessed:
+                        # The bless resumes the source instance.
+                        self._record_pause(source_instance_ref, paused_at)
+                    else:
+                        self._unpause_source(source_instance_ref, paused_at)
         except Exception, e:
             _log_error("bless")
 
             if not(migration):
+                self._delete_volume_snapshots(context, volume_snapshots)
                 self._instance_update(context, instance_uuid,
                                       vm_state=vm_states.ERROR, task_state=None)
             raise e
@@ -590,9 +1258,11 @@ class CobaltManager(manager.SchedulerDependentManager):
             # We set the image_refs to an empty array first in case the
             # post_bless() fails and we need to cleanup artifacts.
             image_refs = []
+            # The snapshot bookkeeping is kept out of the pause above.
+            self._record_snapshot_bdms(context, volume_snapshots)
             vms_policy_template = self._generate_vms_policy_template(context,
                                                             instance_ref)
-            image_refs = self.vms_conn.post_bless(context,
+            image_refs, descriptions = self.vms_conn.post_bless(context,
                                     instance_ref,
                                     blessed_files,
                                     vms_policy_template=vms_policy_template)
@@ -602,24 +1272,34 @@ class CobaltManager(manager.SchedulerDependentManager):
             # we simply clean up all system_metadata and attempt to mark the VM
             # as in the ERROR state. This may fail also, but at least we
             # attempt to leave as little around as possible.
-            system_metadata = self._system_metadata_get(instance_ref)
-            system_metadata['images'] = ','.join(image_refs)
-            system_metadata['logical_volumes'] = ','.join(lvms)
+            with metrics.phase('manifest'):
+                # A migration does not wait on the image service for what
+                # the upload did not return.
+                artifact_manifest = self._build_manifest(context, image_refs, lvms,
+                                                         descriptions,
+                                                         describe=not(migration))
             if not(migration):
                 # Record the networks that we attached to this instance so that when launching
                 # only these networks will be attached,
-                network_info = self._instance_network_info(context,
-                                                           source_instance_ref,
-                                                           True)
-                system_metadata['attached_networks'] = ','.join(
-                                [vif['network']['id'] for vif in network_info])
+                with metrics.phase('network_info'):
+                    network_info = self._instance_network_info(context,
+                                                               source_instance_ref,
+                                                               True)
+                for vif in network_info:
+                    artifact_manifest.add(manifest.NETWORK, vif['network']['id'])
+            system_metadata = self._system_metadata_get(instance_ref)
+            manifest.store(artifact_manifest, system_metadata)
 
             if not(migration):
-                self._notify(context, instance_ref, "bless.end")
+                self._notify(context, instance_ref, "bless.end",
+                             phases=metrics.current().breakdown())
+                self.launch_contexts.invalidate(instance_uuid)
                 self._instance_update(context, instance_uuid,
                                       vm_state="blessed", task_state=None,
                                       launched_at=timeutils.utcnow(),
                                       system_metadata=system_metadata)
+                eventlet.spawn_n(self._prefetch_blessed_instance, context,
+                                 instance_uuid)
             else:
                 self._instance_update(context, instance_uuid,
                                       system_metadata=system_metadata)
@@ -655,6 +1335,7 @@ class CobaltManager(manager.SchedulerDependentManager):
             self.vms_conn.discard(context, instance_ref['name'], image_refs=image_refs)
 
             if not(migration):
+                self._delete_volume_snapshots(context, volume_snapshots)
                 self._instance_update(context, instance_uuid,
                                       vm_state=vm_states.ERROR, task_state=None)
 
@@ -667,17 +1348,64 @@ class CobaltManager(manager.SchedulerDependentManager):
         # Return the memory URL (will be None for a normal bless).
         return migration_url
 
+    def _prefetch_blessed_instance(self, context, instance_uuid):
+        """
+        Asks the hosts chosen by the prefetch policy to warm their image cache
+        with the new live-image. This is purely an optimization, so it runs
+        after the bless in a greenthread of its own and failures are logged
+        and otherwise ignored.
+        """
+        if CONF.cobalt_prefetch_policy == 'none' or \
+           not(CONF.cobalt_use_image_service):
+            return
+        try:
+            hosts = self.cobalt_api.prefetch_instance(context, instance_uuid)
+            LOG.debug(_("Prefetching instance %s onto hosts %s"),
+                      instance_uuid, hosts)
+        except:
+            _log_error("prefetch")
+
+    def prefetch_instance(self, context, instance_uuid=None):
+        """ Places the artifacts of the live-image into this host's image cache. """
+        context = context.elevated()
+        # The download does not hold the lock, which would keep the discards
+        # and launches of the live-image waiting on it.
+        artifact_manifest = self._prefetch_manifest(context, instance_uuid=instance_uuid)
+        self.vms_conn.prefetch_images(context,
+                                      image_refs=artifact_manifest.image_refs(),
+                                      artifacts=artifact_manifest.images())
+
+    @_lock_call
+    def _prefetch_manifest(self, context, instance_uuid=None, instance_ref=None):
+        return self._load_manifest(instance_ref)
+
+    def _stage_artifacts(self, context, image_refs, artifacts):
+        try:
+            self.vms_conn.prefetch_images(context, image_refs=image_refs,
+                                          artifacts=artifacts)
+        except greenlet.GreenletExit:
+            # The launch failed.
+            pass
+        except:
+            # The launch downloads whatever is missing itself.
+            _log_error("staging artifacts")
+
     def _migrate_floating_ips(self, context, instance, src, dest):
 
         migration = {'source_compute': src,
                      'dest_compute': dest}
-        self.network_api.migrate_instance_start(context, instance, migration)
-        self.network_api.migrate_instance_finish(context, instance, migration)
+        self.rpc_retry.call(self.network_api.migrate_instance_start,
+                            context, instance, migration)
+        self.rpc_retry.call(self.network_api.migrate_instance_finish,
+                            context, instance, migration)
 
+    @_admitted('migrate_out')
+    @_timed('migrate_out')
     @_lock_call
     def migrate_instance(self, context, instance_uuid=None, instance_ref=None, dest=None):
         """
         Migrates an instance, dealing with special streaming cases as necessary.
+        Returns False if the instance was relaunched here instead.
         """
 
         context = context.elevated()
@@ -699,14 +1427,13 @@ class CobaltManager(manager.SchedulerDependentManager):
 
         # Get a reference to both the destination and source queues
         co_dest_queue = rpc.queue_get_for(context, CONF.cobalt_topic, dest)
-        compute_dest_queue = rpc.queue_get_for(context, CONF.compute_topic, dest)
         compute_source_queue = rpc.queue_get_for(context, CONF.compute_topic, self.host)
 
         # Figure out the migration address.
         migration_address = self._get_migration_address(dest)
 
         # Grab the network info.
-        network_info = self.network_api.get_instance_nw_info(context, instance_ref)
+        network_info = self._retry_get_nw_info(context, instance_ref)
 
         # Update the system_metadata for migration.
         system_metadata = self._system_metadata_get(instance_ref)
@@ -715,58 +1442,59 @@ class CobaltManager(manager.SchedulerDependentManager):
         self._instance_update(context, instance_uuid,
                               system_metadata=system_metadata)
 
-        # Prepare the destination for live migration.
-        # NOTE(dscannell): The instance's host needs to change for the pre_live_migration
-        # call in order for the iptable rules for the DHCP server to be correctly setup
-        # to allow the destination host to respond to the instance. Its set back to the
-        # source after this call. Also note, that this does not update the database so
-        # no other processes should be affected.
-        instance_ref['host'] = dest
-        rpc.call(context, compute_dest_queue,
-                 {"method": "pre_live_migration",
-                  "version": "2.2",
-                  "args": {'instance': instance_ref,
-                           'block_migration': False,
-                           'disk': None}},
-                 timeout=CONF.cobalt_compute_timeout)
-        instance_ref['host'] = self.host
+        # Prepare the destination for live migration while this host blesses
+        # the instance. The preparation is waited on before the remote launch.
+        prepare = eventlet.spawn(
+                metrics.current().wrap('prepare_destination', self.rpc_retry.call),
+                rpc.call, context, co_dest_queue,
+                {"method": "prepare_migration",
+                 "args": {'instance_ref': instance_ref,
+                          'migration_network_info': network_info}},
+                timeout=CONF.cobalt_compute_timeout)
 
         # Bless this instance for migration.
-        migration_url = self.bless_instance(context,
+        try:
+            migration_url = self.bless_instance(context,
                                             instance_ref=instance_ref,
                                             migration_url="mcdist://%s" % migration_address,
                                             migration_network_info=network_info)
+        except:
+            ei = sys.exc_info()
+            self._cancel_migration(context, co_dest_queue, instance_ref, prepare)
+            raise ei[0], ei[1], ei[2]
 
-        # Run our premigration hook.
-        self.vms_conn.pre_migration(context, instance_ref, network_info, migration_url)
-
-        # Migrate floating ips
         try:
-            self._migrate_floating_ips(context, instance_ref, self.host, dest)
+            # Run our premigration hook.
+            with metrics.phase('pre_migration'):
+                self.vms_conn.pre_migration(context, instance_ref, network_info,
+                                            migration_url)
+
+            # Migrate floating ips
+            try:
+                with metrics.phase('floating_ips'):
+                    self._migrate_floating_ips(context, instance_ref, self.host, dest)
+            except:
+                _log_error("migrating floating ips.")
+                raise
         except:
-            _log_error("migrating floating ips.")
-            raise
+            ei = sys.exc_info()
+            self._cancel_migration(context, co_dest_queue, instance_ref, prepare)
+            raise ei[0], ei[1], ei[2]
 
         try:
             # Launch on the different host. With the non-null migration_url,
             # the launch will assume that all the files are the same places are
             # before (and not in special launch locations).
-            #
-            # FIXME: Currently we fix a timeout for this operation at 30 minutes.
-            # This is a long, long time. Ideally, this should be a function of the
-            # disk size or some other parameter. But we will get a response if an
-            # exception occurs in the remote thread, so the worse case here is
-            # really just the machine dying or the service dying unexpectedly.
-            rpc.call(context, co_dest_queue,
-                    {"method": "launch_instance",
-                     "args": {'instance_ref': instance_ref,
-                              'migration_url': migration_url,
-                              'migration_network_info': network_info}},
-                    timeout=1800)
+            with metrics.phase('prepare_wait'):
+                prepare.wait()
+            with metrics.phase('remote_launch'):
+                self._remote_launch(context, co_dest_queue, instance_ref,
+                                    migration_url, network_info)
             changed_hosts = True
 
         except:
             _log_error("remote launch")
+            self._cancel_migration(context, co_dest_queue, instance_ref, prepare)
 
             # Try relaunching on the local host. Everything should still be setup
             # for this to happen smoothly, and the _launch_instance function will
@@ -793,7 +1521,9 @@ class CobaltManager(manager.SchedulerDependentManager):
         # and we were probably migrating off this machine for
         # maintenance reasons anyways.
         try:
-            self.vms_conn.post_migration(context, instance_ref, network_info, migration_url)
+            with metrics.phase('post_migration'):
+                self.vms_conn.post_migration(context, instance_ref, network_info,
+                                             migration_url)
         except:
             _log_error("post migration")
 
@@ -806,12 +1536,14 @@ class CobaltManager(manager.SchedulerDependentManager):
             # it does exactly was we need but we use the source host (self.host)
             # instead of the destination.
             try:
-                # Ensure that the networks have been configured on the destination host.
-                self.network_api.setup_networks_on_host(context, instance_ref, host=dest)
-                rpc.call(context, compute_source_queue,
-                    {"method": "rollback_live_migration_at_destination",
-                     "version": "2.2",
-                     "args": {'instance': instance_ref}})
+                with metrics.phase('cleanup'):
+                    # Ensure that the networks have been configured on the destination host.
+                    self.rpc_retry.call(self.network_api.setup_networks_on_host,
+                                        context, instance_ref, host=dest)
+                    self.rpc_retry.call(rpc.call, context, compute_source_queue,
+                        {"method": "rollback_live_migration_at_destination",
+                         "version": "2.2",
+                         "args": {'instance': instance_ref}})
             except:
                 _log_error("post migration cleanup")
 
@@ -823,8 +1555,297 @@ class CobaltManager(manager.SchedulerDependentManager):
         # an error -- just not one that should kill the VM).
         image_refs = self._extract_image_refs(instance_ref)
 
-        self.vms_conn.discard(context, instance_ref["name"], image_refs=image_refs)
+        with metrics.phase('vms_discard'):
+            self.vms_conn.discard(context, instance_ref["name"], image_refs=image_refs)
+
+        return changed_hosts
+
+    def _cancel_migration(self, context, queue, instance_ref, prepare):
+        """
+        Tells the destination to remove what it prepared for a migration that
+        is not going to be launched there, once the preparation is done.
+        """
+        try:
+            prepare.wait()
+        except:
+            _log_error("preparing the destination")
+        try:
+            rpc.cast(context, queue,
+                     {"method": "cancel_migration",
+                      "args": {'instance_uuid': instance_ref['uuid']}})
+        except:
+            _log_error("cancelling the migration on the destination")
+
+    def _migration_deadline(self, instance_ref):
+        """
+        Returns the size of the artifacts of a migrating instance and the
+        number of seconds its destination gets, given the observed throughput.
+        """
+        artifact_manifest = self._load_manifest(instance_ref)
+        size = sum([int(artifact.get('size', None) or 0)
+                    for artifact in artifact_manifest.images()])
+        # Leave room for the throughput to drop.
+        return size, CONF.cobalt_migration_base_timeout + \
+                     3 * size / self.migration_throughput
+
+    def _remote_launch(self, context, queue, instance_ref, migration_url,
+                       network_info):
+        """
+        Launches the migrating instance on the destination, giving up once
+        its heartbeats stop or it takes longer than the deadline.
+        """
+        instance_uuid = instance_ref['uuid']
+        size, deadline = self._migration_deadline(instance_ref)
+        watch = migrationwatch.MigrationWatch(deadline,
+                                              CONF.cobalt_migration_stall_timeout)
+        self.migration_watches[instance_uuid] = watch
+        try:
+            # The call itself only times out if the destination committed to
+            # the migration and then died.
+            remote_launch = eventlet.spawn(rpc.call, context, queue,
+                               {"method": "launch_instance",
+                                "args": {'instance_ref': instance_ref,
+                                         'migration_url': migration_url,
+                                         'migration_network_info': network_info,
+                                         'heartbeat_host': self.host}},
+                               timeout=CONF.cobalt_compute_timeout)
+            while True:
+                done = False
+                with eventlet.Timeout(CONF.cobalt_migration_heartbeat_interval, False):
+                    remote_launch.wait()
+                    done = True
+                if done:
+                    break
+                reason = watch.check()
+                if reason is not None:
+                    # The destination does not start the instance once it
+                    # learns that the migration was abandoned.
+                    watch.abandoned = True
+                    remote_launch.kill()
+                    raise exception.NovaException(
+                        _("Gave up on the migration of %s to %s after %d "
+                          "heartbeats: %s") % (instance_uuid, queue,
+                                               watch.beats, reason))
+        finally:
+            del self.migration_watches[instance_uuid]
+
+        elapsed = metrics.monotonic() - watch.start
+        if size > 0 and elapsed > 0:
+            self.migration_throughput = 0.7 * self.migration_throughput + \
+                                        0.3 * size / elapsed
+
+    def migration_heartbeat(self, context, instance_uuid=None, final=False):
+        """
+        Called by the destination of an outgoing migration while it launches
+        the instance. Returns False if the migration has been given up on.
+        """
+        watch = self.migration_watches.get(instance_uuid, None)
+        if watch is None:
+            return False
+        return watch.beat(final=final)
+
+    def _send_heartbeats(self, context, instance_uuid, source_host):
+        queue = rpc.queue_get_for(context, CONF.cobalt_topic, source_host)
+        while True:
+            eventlet.sleep(CONF.cobalt_migration_heartbeat_interval)
+            try:
+                rpc.cast(context, queue,
+                         {"method": "migration_heartbeat",
+                          "args": {'instance_uuid': instance_uuid}})
+            except:
+                _log_error("migration heartbeat")
+
+    def _confirm_migration(self, context, instance_uuid, source_host):
+        """ Returns whether the source host still waits on the migration. """
+        try:
+            # Not retried: a destination that cannot reach the source host
+            # must not start the instance.
+            return rpc.call(context,
+                        rpc.queue_get_for(context, CONF.cobalt_topic, source_host),
+                        {"method": "migration_heartbeat",
+                         "args": {'instance_uuid': instance_uuid,
+                                  'final': True}},
+                        timeout=CONF.cobalt_migration_stall_timeout) == True
+        except:
+            _log_error("confirming the migration")
+            return False
+
+    @_timed('prepare_migration')
+    @_lock_call
+    def prepare_migration(self, context, instance_uuid=None, instance_ref=None,
+                          migration_network_info=None):
+        """
+        Readies this host for an incoming migration of the instance while the
+        source host is still blessing it. This is not held back by admission
+        control: the source waits on it, and the launch that follows is
+        admitted as migrate_in.
+        """
+        context = context.elevated()
+        network_info = network_model.NetworkInfo.hydrate(migration_network_info)
+
+        def setup_compute():
+            # NOTE(dscannell): The instance's host needs to change for the
+            # pre_live_migration call in order for the iptable rules for the DHCP
+            # server to be correctly setup to allow the destination host to
+            # respond to the instance. This does not update the database so no
+            # other processes should be affected.
+            instance_ref['host'] = self.host
+            self.rpc_retry.call(rpc.call, context,
+                rpc.queue_get_for(context, CONF.compute_topic, self.host),
+                {"method": "pre_live_migration",
+                 "version": "2.2",
+                 "args": {'instance': instance_ref,
+                          'block_migration': False,
+                          'disk': None}},
+                timeout=CONF.cobalt_compute_timeout)
+
+        def prepare_domain():
+            bdms = self.conductor_api.\
+                block_device_mapping_get_all_by_instance(context, instance_ref)
+            if [bdm for bdm in bdms if bdm['volume_id']]:
+                # The volumes are only detached from the source by the bless.
+                return
+            try:
+                block_device_info = self.compute_manager._prep_block_device(
+                                        context, instance_ref, bdms)
+                self.vms_conn.prepare_migration(context, instance_ref, network_info,
+                                                block_device_info=block_device_info)
+            except:
+                # The launch sets up the domain itself.
+                _log_error("preparing the domain")
+
+        timer = metrics.current()
+        pipeline = launch.LaunchPipeline()
+        pipeline.add('compute', timer.wrap('compute', setup_compute))
+        pipeline.add('domain', timer.wrap('domain', prepare_domain))
+        pipeline.wait()
+
+    @_lock_call
+    def cancel_migration(self, context, instance_uuid=None, instance_ref=None):
+        """
+        Removes what prepare_migration set up for a migration of the instance
+        that the source host gave up on. Like prepare_migration, this is not
+        held back by admission control.
+        """
+        if instance_ref['host'] == self.host:
+            # The instance was launched here after all.
+            return
+        self.vms_conn.cancel_migration(context, instance_ref)
+
+    def _evacuate_instance(self, context, instance_uuid, dest):
+        instance = instance_obj.Instance.get_by_uuid(context, instance_uuid)
+        if instance['host'] != self.host:
+            # An earlier attempt got it off this host before failing.
+            return
+
+        self._instance_update(context, instance_uuid,
+                              task_state=task_states.MIGRATING)
+        try:
+            # Queue here rather than in the background, the evacuation needs
+            # the outcome of the migration.
+            self.admission.admit('migrate_out')
+            try:
+                if not self.migrate_instance(context, instance_uuid=instance_uuid,
+                                             dest=dest):
+                    raise exception.NovaException(
+                            _("The migration to %s was rolled back.") % dest)
+            finally:
+                self.admission.release()
+        except:
+            ei = sys.exc_info()
+            try:
+                # Let the instance be migrated again if it is still running
+                # here. Anything else is left for _refresh_host to sort out.
+                instance = instance_obj.Instance.get_by_uuid(context, instance_uuid)
+                if instance['host'] == self.host and \
+                   instance['task_state'] == task_states.MIGRATING and \
+                   instance['name'] in self.compute_manager.driver.list_instances():
+                    self._instance_update(context, instance_uuid, task_state=None)
+            except:
+                _log_error("resetting the task state of %s" % instance_uuid)
+            raise ei[0], ei[1], ei[2]
+
+    def evacuate_host(self, context, dests=None):
+        """
+        Migrates every active instance off this host, in waves of concurrent
+        migrations spread over the destinations. Failed migrations are retried
+        in later waves. Returns the destination of every migrated instance and
+        the last error of every instance that could not be migrated.
+        """
+        context = context.elevated()
+        # The host's name is locked like an instance's uuid, so that only one
+        # evacuation of the host runs at a time.
+        if not self._lock_instance(self.host, blocking=False):
+            raise exception.NovaException(_("Host %s is already being evacuated.")
+                                          % self.host)
+        self.evacuating = True
+        try:
+            if not dests:
+                dests = self.cobalt_api.list_evacuation_destinations(context,
+                                                                     self.host)
+            dests = [dest for dest in dests if dest != self.host]
+            if len(dests) == 0:
+                raise exception.NovaException(_("There are no available hosts to "
+                                                "evacuate host %s to.") % self.host)
+
+            instances = instance_obj.InstanceList.get_by_filters(context,
+                                {'host': self.host, 'vm_state': vm_states.ACTIVE})
+            pending = [instance['uuid'] for instance in instances
+                       if instance['task_state'] is None]
+            LOG.info(_("Evacuating %d instances from %s to %s"),
+                     len(pending), self.host, ', '.join(dests))
+            self._queue_notification(context, 'cobalt.host.evacuate.start',
+                                     {'host': self.host, 'dests': dests,
+                                      'instances': pending})
+
+            start = time.time()
+            size = evacuation.wave_size(CONF.cobalt_evacuate_wave_size,
+                                        CONF.cobalt_evacuate_bandwidth,
+                                        CONF.cobalt_migration_bandwidth)
+            placed = {}
+            failed = {}
+            attempts = {}
+            migrated = {}
+            errors = {}
+            waves = 0
+            while len(pending) > 0:
+                wave, pending = evacuation.plan_wave(pending, dests, placed, size,
+                                    CONF.cobalt_evacuate_per_destination, failed)
+                waves += 1
+                LOG.info(_("Evacuation wave %d: migrating %d instances, %d waiting"),
+                         waves, len(wave), len(pending))
+                def migrate(assignment):
+                    self._evacuate_instance(context, *assignment)
+                results = _map_concurrently(migrate, wave, len(wave))
+
+                for ((instance_uuid, dest), (_result, exc_info)) in zip(wave, results):
+                    if exc_info is None:
+                        migrated[instance_uuid] = dest
+                        errors.pop(instance_uuid, None)
+                        continue
+                    LOG.warn(_("Failed to evacuate instance %s to %s: %s"),
+                             instance_uuid, dest, exc_info[1])
+                    placed[dest] -= 1
+                    failed.setdefault(instance_uuid, set()).add(dest)
+                    errors[instance_uuid] = str(exc_info[1])
+                    attempts[instance_uuid] = attempts.get(instance_uuid, 0) + 1
+                    if attempts[instance_uuid] <= CONF.cobalt_evacuate_retries:
+                        pending.append(instance_uuid)
+
+            result = {'migrated': migrated, 'failed': errors}
+            LOG.info(_("Evacuated %d instances from %s in %d waves and %.1fs, "
+                       "%d failed"), len(migrated), self.host, waves,
+                     time.time() - start, len(errors))
+            self._queue_notification(context, 'cobalt.host.evacuate.end',
+                                     dict(result, host=self.host, waves=waves,
+                                          duration=round(time.time() - start, 3)))
+            return result
+        finally:
+            self.evacuating = False
+            self._unlock_instance(self.host)
 
+    @_admitted('discard')
+    @_timed('discard')
     @_lock_call
     def discard_instance(self, context, instance_uuid=None, instance_ref=None):
         """ Discards an instance so that no further instances maybe be launched from it. """
@@ -833,23 +1854,36 @@ class CobaltManager(manager.SchedulerDependentManager):
         self._notify(context, instance_ref, "discard.start")
 
         # Try to discard the created snapshots
-        self._discard_blessed_snapshots(context, instance_ref)
+        with metrics.phase('snapshots'):
+            self._discard_blessed_snapshots(context, instance_ref)
         # Call discard in the backend.
-        self.vms_conn.discard(context, instance_ref['name'],
-                              image_refs=self._extract_image_refs(instance_ref))
+        with metrics.phase('vms_discard'):
+            self.vms_conn.discard(context, instance_ref['name'],
+                                  image_refs=self._extract_image_refs(instance_ref))
 
         # Remove the instance.
-        self._instance_update(context,
-                              instance_uuid,
-                              vm_state=vm_states.DELETED,
-                              task_state=None,
-                              terminated_at=timeutils.utcnow())
-        self.conductor_api.instance_destroy(context, instance_ref)
-        self._notify(context, instance_ref, "discard.end")
-
-    @_retry_rpc
+        with metrics.phase('destroy'):
+            self._instance_update(context,
+                                  instance_uuid,
+                                  vm_state=vm_states.DELETED,
+                                  task_state=None,
+                                  terminated_at=timeutils.utcnow())
+            self.conductor_api.instance_destroy(context, instance_ref)
+        self._notify(context, instance_ref, "discard.end",
+                     phases=metrics.current().breakdown())
+
+        # Other hosts may have cached how to launch this instance.
+        self.launch_contexts.invalidate(instance_uuid)
+        try:
+            rpc.fanout_cast(context, CONF.cobalt_topic,
+                            {"method": "invalidate_launch_context",
+                             "args": {'instance_uuid': instance_uuid}})
+        except:
+            _log_error("invalidating launch contexts")
+
     def _retry_get_nw_info(self, context, instance_ref):
-        return self.network_api.get_instance_nw_info(context, instance_ref)
+        return self.rpc_retry.call(self.network_api.get_instance_nw_info,
+                                   context, instance_ref)
 
     def _instance_network_info(self, context, instance_ref, already_allocated, requested_networks=None):
         """
@@ -861,7 +1895,7 @@ class CobaltManager(manager.SchedulerDependentManager):
         network_info = None
 
         if already_allocated:
-            network_info = self.network_api.get_instance_nw_info(context, instance_ref)
+            network_info = self._retry_get_nw_info(context, instance_ref)
 
         else:
             # We need to allocate a new network info for the instance.
@@ -893,6 +1927,7 @@ class CobaltManager(manager.SchedulerDependentManager):
                       instance_ref['name'], network_info)
             except:
                 _log_error("network allocation")
+                raise
 
         return network_info
 
@@ -907,22 +1942,80 @@ class CobaltManager(manager.SchedulerDependentManager):
                         for (key, value) in policy_attrs])
 
 
-    def _generate_vms_policy_name(self, context, instance, source_instance):
-        template = self._generate_vms_policy_template(context, source_instance)
-        return template %({'uuid': instance['uuid'],
-                           'tenant':instance['project_id']})
+    def _resume_pooled_instance(self, context, instance_ref):
+        """
+        Hands a pooled clone to the launch that claimed it. The API has already
+        given it the user, name, user data and key of the launch, which the
+        guest reads from the metadata service once it runs.
+        """
+        live_image = self._system_metadata_get(instance_ref).get('launched_from')
+        pool = self._get_warm_pool()
+        if pool != None:
+            pool.claimed(live_image, instance_ref['uuid'])
+        self._notify(context, instance_ref, "launch.start")
+
+        timer = metrics.current()
+        try:
+            with metrics.phase('network'):
+                # The host entries carry the new hostname.
+                self.rpc_retry.call(self.network_api.setup_networks_on_host,
+                                    context, instance_ref, self.host)
+                network_info = self._retry_get_nw_info(context, instance_ref)
+            with metrics.phase('resume'):
+                self.vms_conn.unpause_instance(instance_ref)
+            self._notify(context, instance_ref, "launch.end", network_info=network_info,
+                         phases=timer.breakdown())
+        except Exception, e:
+            _log_error("resuming pooled instance")
+            self._instance_update(context, instance_ref['uuid'],
+                                  vm_state=vm_states.ERROR,
+                                  task_state=None)
+            raise e
+
+        # Replace the clone that was taken.
+        if pool != None:
+            eventlet.spawn_n(self._refill_warm_pool, context)
+
+        try:
+            power_state = self.compute_manager._get_power_state(context, instance_ref)
+            self._instance_update(context, instance_ref['uuid'],
+                                  power_state=power_state,
+                                  vm_state=vm_states.ACTIVE,
+                                  task_state=None,
+                                  launched_at=timeutils.utcnow())
+        except:
+            _log_error("post launch update")
 
+    @_heartbeats
+    @_admitted(_launch_operation)
+    @_timed(_launch_operation)
     @_lock_call
     def launch_instance(self, context, instance_uuid=None, instance_ref=None,
-                        params=None, migration_url=None, migration_network_info=None):
+                        params=None, migration_url=None, migration_network_info=None,
+                        heartbeat_host=None, warm_pool=False):
         """
         Construct the launched instance, with uuid instance_uuid. If migration_url is not none then
-        the instance will be launched using the memory server at the migration_url
+        the instance will be launched using the memory server at the migration_url, and
+        heartbeats are sent to heartbeat_host, the source of the migration. A clone
+        launched for the warm_pool is left paused, and a claimed one is resumed.
         """
 
         context = context.elevated()
         if params == None:
             params = {}
+        if instance_ref['task_state'] == warmpool.CLAIMED:
+            return self._resume_pooled_instance(context, instance_ref)
+        pool = None
+        if not(migration_url):
+            live_image = self._system_metadata_get(instance_ref).get('launched_from')
+            pool = self._get_warm_pool()
+            if pool != None and not(warm_pool):
+                pool.touch(live_image)
+        # The intermediate task states are only written out along with the
+        # next checkpoint (the networking update, an error or the final state).
+        instance_updates = updatebuffer.InstanceUpdateBuffer(self._instance_update,
+                                                             context,
+                                                             instance_ref['uuid'])
 
         # note(dscannell): The target is in pages so we need to convert the value
         # If target is set as None, or not defined, then we default to "0".
@@ -938,61 +2031,66 @@ class CobaltManager(manager.SchedulerDependentManager):
             # Update the instance state to be migrating. This will be set to
             # active again once it is completed in do_launch() as per all
             # normal launched instances.
-            source_instance_ref = instance_ref
+            with metrics.phase('launch_context'):
+                launch_context = self._build_launch_context(context, instance_ref)
 
         else:
-            self._notify(context, instance_ref, "launch.start")
+            if not(warm_pool):
+                self._notify(context, instance_ref, "launch.start")
 
             # Create a new launched instance.
-            source_instance_ref = self._get_source_instance(context,
-                                                            instance_ref)
-
-        try:
-            # NOTE(dscannell): This will construct the block_device_info object
-            # that gets passed to build/attached the volumes to the launched
-            # instance. Note that this method will also create full volumes our
-            # of any snapshot referenced by the instance's block_device_mapping.
-            bdms = self.conductor_api.\
-                block_device_mapping_get_all_by_instance(context, instance_ref)
-            block_device_info = self.compute_manager._prep_block_device(context,
-                                                                        instance_ref,
-                                                                        bdms)
-        except:
-            # Since this creates volumes there are host of issues that can go wrong
-            # (e.g. cinder is down, quotas have been reached, snapshot deleted, etc).
-            _log_error("setting up block device mapping")
-            if not(migration_url):
-                self._instance_update(context, instance_ref['uuid'],
-                                      vm_state=vm_states.ERROR,
-                                      task_state=None)
-            raise
+            with metrics.phase('launch_context'):
+                launch_context = self._get_launch_context(context, instance_ref)
 
         # Extract the image ids from the source instance.
-        image_refs = self._extract_image_refs(source_instance_ref)
-        lvm_info = self._extract_lvm_info(source_instance_ref)
-        requested_networks = self._extract_requested_networks(source_instance_ref)
-
-        if migration_network_info != None:
-            # (dscannell): Since this migration_network_info came over the wire we need
-            # to hydrate it back into a full NetworkInfo object.
-            network_info = network_model.NetworkInfo.hydrate(migration_network_info)
-        else:
-            network_info = self._instance_network_info(context, instance_ref,
-                                                       migration_url != None,
-                                                       requested_networks=requested_networks)
-            if network_info == None:
-                # An error would have occured acquiring the instance network info. We should
-                # mark the instances as error and return because there is nothing else we can do.
-                self._instance_update(context, instance_ref['uuid'],
-                                      vm_state=vm_states.ERROR,
-                                      task_state=None)
-                return
-
-            # Update the task state to spawning from networking.
-            self._instance_update(context, instance_ref['uuid'],
-                                  task_state=task_states.SPAWNING)
+        image_refs = launch_context.image_refs
+        lvm_info = launch_context.lvm_info
+        requested_networks = launch_context.requested_networks
+
+        staging = None
+        if not(migration_url):
+            # Start pulling down the artifacts now, the launch picks up the
+            # downloads that are still in flight.
+            staging = eventlet.spawn(self._stage_artifacts, context, image_refs,
+                                     launch_context.artifacts)
+
+        def prep_block_devices():
+            try:
+                # NOTE(dscannell): This will construct the block_device_info object
+                # that gets passed to build/attached the volumes to the launched
+                # instance. Note that this method will also create full volumes our
+                # of any snapshot referenced by the instance's block_device_mapping.
+                bdms = self.conductor_api.\
+                    block_device_mapping_get_all_by_instance(context, instance_ref)
+                return self.compute_manager._prep_block_device(context,
+                                                               instance_ref,
+                                                               bdms)
+            except:
+                # Since this creates volumes there are host of issues that can go wrong
+                # (e.g. cinder is down, quotas have been reached, snapshot deleted, etc).
+                _log_error("setting up block device mapping")
+                raise
 
-        try:
+        def allocate_network():
+            networks = requested_networks
+            claimed = []
+            if migration_url == None:
+                networks, claimed = self._claim_pooled_ports(context, instance_ref,
+                                                             requested_networks)
+            try:
+                return self._instance_network_info(context, instance_ref,
+                                                   migration_url != None,
+                                                   requested_networks=networks)
+            except:
+                ei = sys.exc_info()
+                if len(claimed) > 0:
+                    try:
+                        self.port_pool.release(context, claimed)
+                    except:
+                        _log_error("releasing pooled ports")
+                raise ei[0], ei[1], ei[2]
+
+        def setup_compute():
             # The main goal is to have the nova-compute process take ownership of setting up
             # the networking for the launched instance. This ensures that later changes to the
             # iptables can be handled directly by nova-compute. The method "pre_live_migration"
@@ -1007,20 +2105,50 @@ class CobaltManager(manager.SchedulerDependentManager):
             #
             # NOTE(amscanne): This will happen prior to launching in the migration code, so
             # we don't need to bother with this call in that case.
-            if not(migration_url):
-                rpc.call(context,
-                    rpc.queue_get_for(context, CONF.compute_topic, self.host),
-                    {"method": "pre_live_migration",
-                     "version": "2.2",
-                     "args": {'instance': instance_ref,
-                              'block_migration': False,
-                              'disk': None}},
-                    timeout=CONF.cobalt_compute_timeout)
-
-            vms_policy = self._generate_vms_policy_name(context, instance_ref,
-                                                        source_instance_ref)
+            self.rpc_retry.call(rpc.call, context,
+                rpc.queue_get_for(context, CONF.compute_topic, self.host),
+                {"method": "pre_live_migration",
+                 "version": "2.2",
+                 "args": {'instance': instance_ref,
+                          'block_migration': False,
+                          'disk': None}},
+                timeout=CONF.cobalt_compute_timeout)
+
+        # The block devices and the network are independent of each other, and
+        # nova-compute only needs the network to be allocated.
+        timer = metrics.current()
+        pipeline = launch.LaunchPipeline()
+        pipeline.add('block_devices', timer.wrap('block_devices', prep_block_devices))
+        if migration_network_info != None:
+            # (dscannell): Since this migration_network_info came over the wire we need
+            # to hydrate it back into a full NetworkInfo object.
+            network_info = network_model.NetworkInfo.hydrate(migration_network_info)
+        else:
+            pipeline.add('network', timer.wrap('network', allocate_network))
+        if not(migration_url):
+            pipeline.add('compute', timer.wrap('compute', setup_compute),
+                         requires=['network'])
+
+        try:
+            with metrics.phase('prepare'):
+                results = pipeline.wait()
+            block_device_info = results['block_devices']
+            if migration_network_info == None:
+                network_info = results['network']
+                # Update the task state to spawning from networking.
+                instance_updates.update(task_state=task_states.SPAWNING)
+
+            vms_policy = launch_context.policy_template % \
+                            ({'uuid': instance_ref['uuid'],
+                              'tenant': instance_ref['project_id']})
+            if heartbeat_host and \
+               not self._confirm_migration(context, instance_ref['uuid'],
+                                           heartbeat_host):
+                raise exception.NovaException(_("The source host gave up on "
+                                                "the migration of %s.") %
+                                              instance_ref['uuid'])
             self.vms_conn.launch(context,
-                                 source_instance_ref['name'],
+                                 launch_context.name,
                                  instance_ref,
                                  network_info,
                                  target=target,
@@ -1029,19 +2157,30 @@ class CobaltManager(manager.SchedulerDependentManager):
                                  params=params,
                                  vms_policy=vms_policy,
                                  block_device_info=block_device_info,
-                                 lvm_info=lvm_info)
-
-            if not(migration_url):
-                self._notify(context, instance_ref, "launch.end", network_info=network_info)
+                                 lvm_info=lvm_info,
+                                 artifacts=launch_context.artifacts)
+
+            if warm_pool:
+                with metrics.phase('pause'):
+                    self.vms_conn.pause_instance(instance_ref)
+            elif not(migration_url):
+                self._notify(context, instance_ref, "launch.end", network_info=network_info,
+                             phases=timer.breakdown())
         except Exception, e:
             _log_error("launch")
+            if staging is not None:
+                # Nothing is going to use what it is still downloading.
+                staging.kill()
             if not(migration_url):
-                self._instance_update(context,
-                                      instance_uuid,
-                                      vm_state=vm_states.ERROR,
-                                      host=self.host,
-                                      node=self.nodename,
-                                      task_state=None)
+                instance_updates.flush(vm_state=vm_states.ERROR,
+                                       host=self.host,
+                                       node=self.nodename,
+                                       task_state=None)
+            if warm_pool and pool != None:
+                pool.launched(live_image, instance_ref['uuid'], succeeded=False)
+                # Failed clones would otherwise pile up in the project.
+                eventlet.spawn_n(self._delete_pooled_instance, context,
+                                 instance_ref['uuid'], pooled=False)
             raise e
 
         try:
@@ -1052,11 +2191,14 @@ class CobaltManager(manager.SchedulerDependentManager):
                              'host': self.host,
                              'node': self.nodename,
                              'task_state': None}
-            if not(migration_url):
+            if warm_pool:
+                update_params['vm_state'] = vm_states.PAUSED
+                update_params['task_state'] = warmpool.POOLED
+            elif not(migration_url):
                 update_params['launched_at'] = timeutils.utcnow()
-            self._instance_update(context,
-                                  instance_uuid,
-                                  **update_params)
+            instance_updates.flush(**update_params)
+            if warm_pool and pool != None:
+                pool.launched(live_image, instance_ref['uuid'])
 
         except:
             # NOTE(amscanne): In this case, we do not throw an exception.
@@ -1086,9 +2228,15 @@ class CobaltManager(manager.SchedulerDependentManager):
         # artifacts and we need to then upload them to the image service if that is what we are
         # using.
         image_ids = self.vms_conn.import_instance(context, instance_ref, image_id)
-        image_ids_str = ','.join(image_ids)
+        imported_manifest = self._build_manifest(context, image_ids, [])
         system_metadata = self._system_metadata_get(instance_ref)
-        system_metadata['images'] = image_ids_str
+        # Keep whatever else the instance already recorded.
+        artifact_manifest = manifest.load(system_metadata)
+        imported_manifest.artifacts += [artifact for artifact
+                                        in artifact_manifest.artifacts
+                                        if artifact['role'] != manifest.IMAGE]
+        manifest.store(imported_manifest, system_metadata)
+        self.launch_contexts.invalidate(instance_uuid)
         self._instance_update(context, instance_uuid, vm_state='blessed',
                               system_metadata=system_metadata)
 
@@ -0,0 +1,149 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+The artifact manifest of a live-image: one versioned document that records
+every artifact a launch needs, with its size, checksum and locations.
+
+The manifest is kept in the system_metadata of the blessed instance. Values
+there are limited to 255 characters, so the JSON is split across numbered
+keys. The legacy comma-joined keys (images, logical_volumes and
+attached_networks) are still written for older hosts, and are read whenever
+an instance has no manifest or one that this host does not understand.
+"""
+
+import json
+
+from nova.openstack.common import log as logging
+from nova.openstack.common.gettextutils import _
+
+LOG = logging.getLogger('nova.cobalt.manifest')
+
+VERSION = 1
+
+# system_metadata keys and their maximum value length.
+KEY = 'manifest'
+CHUNK_SIZE = 255
+
+# Artifact roles.
+IMAGE = 'image'
+LOGICAL_VOLUME = 'logical_volume'
+NETWORK = 'network'
+
+def _split(value):
+    values = value.split(',')
+    if len(values) == 1 and values[0] == '':
+        return []
+    return values
+
+class Manifest(object):
+
+    def __init__(self, artifacts=None, version=VERSION):
+        self.version = version
+        self.artifacts = artifacts if artifacts is not None else []
+
+    def add(self, role, ref, size=None, checksum=None, codec=None, name=None,
+            glance_id=None, path=None, peers=None):
+        """
+        Records an artifact. The ref is what the artifact is known by in the
+        legacy keys: an image id or path, a logical volume or a network id.
+        """
+        self.artifacts.append({'role': role,
+                               'ref': ref,
+                               'size': size,
+                               'checksum': checksum,
+                               'codec': codec,
+                               'name': name,
+                               'locations': {'glance': glance_id,
+                                             'path': path,
+                                             'peers': peers or []}})
+
+    def get(self, role):
+        return [artifact for artifact in self.artifacts
+                if artifact['role'] == role]
+
+    def image_refs(self):
+        return [artifact['ref'] for artifact in self.get(IMAGE)]
+
+    def images(self):
+        """ Returns {image ref: artifact} for the image artifacts. """
+        return dict([(artifact['ref'], artifact) for artifact in self.get(IMAGE)])
+
+    def lvm_info(self):
+        return dict([(artifact['ref'], str(artifact['size']))
+                     for artifact in self.get(LOGICAL_VOLUME)])
+
+    def network_ids(self):
+        return [artifact['ref'] for artifact in self.get(NETWORK)]
+
+    def to_json(self):
+        return json.dumps({'version': self.version, 'artifacts': self.artifacts},
+                          separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data):
+        document = json.loads(data)
+        return cls(document['artifacts'], version=document['version'])
+
+def from_legacy(system_metadata):
+    """ Builds a manifest out of the comma-joined keys. """
+    manifest = Manifest()
+    for image_ref in _split(system_metadata.get('images', '')):
+        manifest.add(IMAGE, image_ref)
+    for lvm in _split(system_metadata.get('logical_volumes', '')):
+        name, size = lvm.split(':')
+        manifest.add(LOGICAL_VOLUME, name, size=size)
+    for network_id in _split(system_metadata.get('attached_networks', '')):
+        manifest.add(NETWORK, network_id)
+    return manifest
+
+def load(system_metadata):
+    """
+    Returns the manifest recorded in system_metadata, falling back to the
+    legacy keys if there is none or it can't be used.
+    """
+    count = system_metadata.get(KEY, None)
+    if count is None:
+        return from_legacy(system_metadata)
+    try:
+        data = ''.join([system_metadata['%s.%d' % (KEY, i)]
+                        for i in range(int(count))])
+        manifest = Manifest.from_json(data)
+    except (KeyError, ValueError, TypeError):
+        LOG.warn(_("Ignoring a damaged artifact manifest."))
+        return from_legacy(system_metadata)
+    if manifest.version > VERSION:
+        LOG.warn(_("Ignoring an artifact manifest of version %s."),
+                 manifest.version)
+        return from_legacy(system_metadata)
+    return manifest
+
+def store(manifest, system_metadata):
+    """ Records the manifest, and the legacy keys, in system_metadata. """
+    for key in system_metadata.keys():
+        if key.startswith(KEY + '.'):
+            del system_metadata[key]
+    data = manifest.to_json()
+    chunks = [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+    for i, chunk in enumerate(chunks):
+        system_metadata['%s.%d' % (KEY, i)] = chunk
+    system_metadata[KEY] = str(len(chunks))
+
+    system_metadata['images'] = ','.join(manifest.image_refs())
+    system_metadata['logical_volumes'] = ','.join(
+        ['%s:%s' % (artifact['ref'], artifact['size'])
+         for artifact in manifest.get(LOGICAL_VOLUME)])
+    if len(manifest.get(NETWORK)) > 0:
+        system_metadata['attached_networks'] = ','.join(manifest.network_ids())
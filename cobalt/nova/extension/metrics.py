@@ -0,0 +1,195 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Splits operations into named phases and keeps histograms of how long each
+phase takes.
+
+The timer of an operation is bound to the greenthread running it, so code
+further down (e.g. vmsconn) can mark phases without having the timer passed
+in. Work handed to other greenthreads is timed with PhaseTimer.wrap.
+"""
+
+import contextlib
+import ctypes
+import json
+import os
+import tempfile
+import time
+
+from eventlet import corolocal
+
+# From linux/time.h.
+CLOCK_MONOTONIC = 1
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+try:
+    _clock_gettime = ctypes.CDLL('librt.so.1', use_errno=True).clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+except (OSError, AttributeError):
+    _clock_gettime = None
+
+def monotonic():
+    """ Seconds from an arbitrary point that do not jump with the wall clock. """
+    if _clock_gettime is None:
+        return time.time()
+    ts = _timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+        return time.time()
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+class PhaseTimer(object):
+    """
+    The time an operation spent in each of its phases. Phases that run
+    concurrently, or that are entered more than once, add up.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.start = monotonic()
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, monotonic() - start)
+
+    def wrap(self, name, fn):
+        """ Returns fn timed as the named phase, for running elsewhere. """
+        def wrapped_fn(*args, **kwargs):
+            with self.phase(name):
+                return fn(*args, **kwargs)
+        return wrapped_fn
+
+    def elapsed(self):
+        return monotonic() - self.start
+
+    def breakdown(self):
+        """ Returns {phase: seconds}, along with the total. """
+        breakdown = dict([(name, round(seconds, 6))
+                          for name, seconds in self.phases.items()])
+        breakdown['total'] = round(self.elapsed(), 6)
+        return breakdown
+
+_local = corolocal.local()
+
+def current():
+    """
+    Returns the timer of the operation running in this greenthread. Outside
+    of an operation a timer that nobody records is returned.
+    """
+    timer = getattr(_local, 'timer', None)
+    if timer is None:
+        return PhaseTimer(None)
+    return timer
+
+@contextlib.contextmanager
+def timing(timer):
+    """ Makes timer the current one for the duration of the block. """
+    previous = getattr(_local, 'timer', None)
+    _local.timer = timer
+    try:
+        yield timer
+    finally:
+        _local.timer = previous
+
+def phase(name):
+    """ Times the block as a phase of the current operation. """
+    return current().phase(name)
+
+# The upper bounds of the histogram buckets, in milliseconds.
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000,
+           20000, 50000, 100000, 200000, 500000, 1000000]
+
+class Histogram(object):
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        milliseconds = seconds * 1000
+        index = len(BUCKETS)
+        for i, bound in enumerate(BUCKETS):
+            if milliseconds <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self):
+        buckets = {}
+        for i, count in enumerate(self.counts):
+            if count > 0:
+                if i < len(BUCKETS):
+                    buckets['le_%dms' % BUCKETS[i]] = count
+                else:
+                    buckets['inf'] = count
+        return {'count': self.count,
+                'sum': round(self.sum, 6),
+                'max': round(self.max, 6),
+                'buckets': buckets}
+
+class MetricsSink(object):
+    """ Aggregates the phase timings of operations into histograms. """
+
+    def __init__(self):
+        # Maps operation to {phase: Histogram}.
+        self.histograms = {}
+        self.failures = {}
+
+    def record(self, timer, failed=False):
+        histograms = self.histograms.setdefault(timer.operation, {})
+        for name, seconds in timer.breakdown().items():
+            histograms.setdefault(name, Histogram()).record(seconds)
+        if failed:
+            self.failures[timer.operation] = \
+                    self.failures.get(timer.operation, 0) + 1
+
+    def snapshot(self):
+        snapshot = {}
+        for operation, histograms in self.histograms.items():
+            snapshot[operation] = {
+                'failed': self.failures.get(operation, 0),
+                'phases': dict([(name, histogram.to_dict())
+                                for name, histogram in histograms.items()])}
+        return snapshot
+
+    def flush(self, path):
+        """ Writes the snapshot to path, replacing it atomically. """
+        directory = os.path.dirname(path) or '.'
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            temp_file = os.fdopen(fd, 'w')
+            try:
+                json.dump(self.snapshot(), temp_file, indent=1, sort_keys=True)
+            finally:
+                temp_file.close()
+            os.rename(temp_path, path)
+        except:
+            os.unlink(temp_path)
+            raise
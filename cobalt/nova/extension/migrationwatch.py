@@ -0,0 +1,64 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Lets the source host of a migration tell a destination that is still
+launching the instance apart from one that has stalled or died.
+"""
+
+from nova.openstack.common.gettextutils import _
+
+from cobalt.nova.extension import metrics
+
+class MigrationWatch(object):
+    """
+    Follows the launch of an outgoing migration on its destination through
+    the heartbeats the destination sends. The migration has stalled once no
+    heartbeat came for stall_timeout seconds, and is late once it has taken
+    longer than deadline seconds.
+    """
+
+    def __init__(self, deadline, stall_timeout=30):
+        self.start = metrics.monotonic()
+        self.last_beat = self.start
+        self.deadline = deadline
+        self.stall_timeout = stall_timeout
+        self.beats = 0
+        self.abandoned = False
+        self.committed = False
+
+    def beat(self, final=False):
+        """
+        Records a heartbeat. Returns False once the migration has been given
+        up on. A final heartbeat commits the destination to the migration.
+        """
+        if self.abandoned:
+            return False
+        self.last_beat = metrics.monotonic()
+        self.beats += 1
+        if final:
+            self.committed = True
+        return True
+
+    def check(self):
+        """ Returns why the migration should be given up on, or None. """
+        if self.committed:
+            return None
+        now = metrics.monotonic()
+        if now - self.last_beat > self.stall_timeout:
+            return _("no heartbeat for %d seconds") % (now - self.last_beat)
+        if now - self.start > self.deadline:
+            return _("it took longer than %d seconds") % self.deadline
+        return None
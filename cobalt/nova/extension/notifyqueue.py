@@ -0,0 +1,96 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Emits the notifications of a host from a background greenthread, so that
+operations do not wait on the notification driver.
+"""
+
+import eventlet
+from eventlet import queue
+
+from nova.openstack.common import log as logging
+from nova.openstack.common.gettextutils import _
+
+LOG = logging.getLogger('nova.cobalt.notifyqueue')
+
+class NotificationQueue(object):
+    """
+    Emits (context, event_type, payload) notifications with emit from a
+    dedicated greenthread. Notifications are taken off the queue in batches
+    of up to batch_size, and when the queue is full the overflow policy
+    (drop_oldest, drop_newest or block) decides which notification is lost,
+    or makes the caller wait. The batch size and policy may be callables, so that they
+    follow configuration options.
+    """
+
+    def __init__(self, emit, size, batch_size=50, overflow='drop_oldest'):
+        self.emit = emit
+        self.queue = queue.Queue(size)
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.thread = None
+        self.stats = {'queued': 0,
+                      'emitted': 0,
+                      'failed': 0,
+                      'dropped': 0,
+                      'batches': 0}
+
+    def _value(self, value):
+        if callable(value):
+            return value()
+        return value
+
+    def put(self, notification):
+        if self.thread is None:
+            self.thread = eventlet.spawn(self._run)
+        overflow = self._value(self.overflow)
+        if overflow == 'block':
+            self.queue.put(notification)
+        else:
+            try:
+                self.queue.put_nowait(notification)
+            except queue.Full:
+                self.stats['dropped'] += 1
+                if overflow == 'drop_newest':
+                    LOG.warn(_("Notification queue full, dropping %s"),
+                             notification[1])
+                    return
+                dropped = self.queue.get_nowait()
+                LOG.warn(_("Notification queue full, dropping %s"), dropped[1])
+                self.queue.put_nowait(notification)
+        self.stats['queued'] += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < max(self._value(self.batch_size), 1):
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.stats['batches'] += 1
+            for (context, event_type, payload) in batch:
+                try:
+                    self.emit(context, event_type, payload)
+                    self.stats['emitted'] += 1
+                except:
+                    self.stats['failed'] += 1
+                    LOG.exception(_("Error during notify %s") % event_type)
+            # Let the operations run before the next batch.
+            eventlet.sleep(0)
+
+    def get_stats(self):
+        return dict(self.stats, waiting=self.queue.qsize())
@@ -0,0 +1,146 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Keeps quantum ports created ahead of time for the networks that live-images
+are launched on, so that a launch claims a port instead of waiting for one to
+be created.
+"""
+
+import time
+
+from nova.openstack.common import log as logging
+from nova.openstack.common.gettextutils import _
+
+LOG = logging.getLogger('nova.cobalt.portpool')
+
+class PortPool(object):
+    """
+    A pool of unbound ports for each (tenant, network) that launches have
+    asked for. The ports are owned by 'cobalt:pool:<host>' until they are
+    claimed, which lets a restarted host find the ports it left behind.
+    Quantum only hands a port to an instance if it has no device_id, so the
+    owner is recorded in device_owner.
+    """
+
+    def __init__(self, host, client, size=4, max_ports=100, idle_timeout=3600):
+        self.host = host
+        self.client = client
+        self.size = size
+        self.max_ports = max_ports
+        self.idle_timeout = idle_timeout
+        self.device_owner = 'cobalt:pool:%s' % host
+        # Maps (tenant, network) to a list of port ids.
+        self.pools = {}
+        self.last_used = {}
+        self.refilling = False
+        self.stats = {'claimed': 0,
+                      'missed': 0,
+                      'created': 0,
+                      'deleted': 0,
+                      'adopted': 0}
+
+    def _count(self):
+        return sum([len(ports) for ports in self.pools.values()])
+
+    def claim(self, tenant, network):
+        """
+        Returns the id of a pooled port on the network, or None if there are
+        none. Either way the network is kept warm from now on.
+        """
+        key = (tenant, network)
+        self.last_used[key] = time.time()
+        ports = self.pools.setdefault(key, [])
+        if len(ports) == 0:
+            self.stats['missed'] += 1
+            return None
+        self.stats['claimed'] += 1
+        return ports.pop(0)
+
+    def release(self, context, port_ids):
+        """
+        Deletes ports that were claimed but not used. Quantum only unbinds the
+        ports it was given when an allocation fails, so they would leak.
+        """
+        for port_id in port_ids:
+            self._delete_port(context, port_id)
+
+    def _create_port(self, context, tenant, network):
+        port = self.client(context).create_port(
+                    {'port': {'tenant_id': tenant,
+                              'network_id': network,
+                              'device_owner': self.device_owner,
+                              'admin_state_up': True}})
+        self.stats['created'] += 1
+        return port['port']['id']
+
+    def _delete_port(self, context, port_id):
+        try:
+            self.client(context).delete_port(port_id)
+            self.stats['deleted'] += 1
+        except Exception:
+            LOG.exception(_("Failed to delete pooled port %s"), port_id)
+
+    def refill(self, context):
+        """
+        Drops the networks that have not been launched on lately and tops the
+        others up, within the limit on the total number of pooled ports.
+        """
+        if self.refilling:
+            return
+        self.refilling = True
+        try:
+            now = time.time()
+            for key in self.pools.keys():
+                if now - self.last_used.get(key, 0) > self.idle_timeout:
+                    for port_id in self.pools.pop(key):
+                        self._delete_port(context, port_id)
+                    self.last_used.pop(key, None)
+
+            for (tenant, network), ports in self.pools.items():
+                while len(ports) < self.size and self._count() < self.max_ports:
+                    try:
+                        ports.append(self._create_port(context, tenant, network))
+                    except Exception:
+                        LOG.exception(_("Failed to create a port on network %s"),
+                                      network)
+                        break
+        finally:
+            self.refilling = False
+
+    def reclaim(self, context):
+        """
+        Adopts the ports this host pooled before it was restarted, and
+        deletes the ones that the pool has no room for.
+        """
+        pooled = set()
+        for ports in self.pools.values():
+            pooled.update(ports)
+        ports = self.client(context).list_ports(device_owner=self.device_owner)
+        for port in ports.get('ports', []):
+            if port['id'] in pooled or port.get('device_id'):
+                continue
+            key = (port['tenant_id'], port['network_id'])
+            pool = self.pools.get(key, [])
+            if len(pool) < self.size and self._count() < self.max_ports:
+                self.pools[key] = pool
+                self.last_used.setdefault(key, time.time())
+                pool.append(port['id'])
+                self.stats['adopted'] += 1
+            else:
+                self._delete_port(context, port['id'])
+
+    def get_stats(self):
+        return dict(self.stats, pooled=self._count(), networks=len(self.pools))
@@ -0,0 +1,210 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Profiles cobalt-compute while it runs, for a number of seconds or of
+operations. It is started on SIGUSR1 (see bin/cobalt-compute) or when the
+service starts, and costs nothing until then.
+
+The sampling profiler records the stack of the thread running the
+greenthreads from a separate OS thread, and writes it in the folded format
+that flamegraph.pl reads. The cprofile mode records every call, and writes
+pstats output.
+"""
+
+import collections
+import cProfile
+import os
+import sys
+import time
+
+import eventlet
+from eventlet import patcher
+
+from nova.openstack.common import log as logging
+from nova.openstack.common.gettextutils import _
+from oslo.config import cfg
+
+LOG = logging.getLogger('nova.cobalt.profiler')
+CONF = cfg.CONF
+
+profiler_opts = [
+               cfg.StrOpt('cobalt_profile_mode',
+               default='sample',
+               help='How cobalt-compute is profiled: sample, to sample the '
+                    'running stack, or cprofile, to record every call.'),
+
+               cfg.BoolOpt('cobalt_profile_on_start',
+               default=False,
+               help='Profile cobalt-compute as soon as it starts. Otherwise '
+                    'a profile is started and stopped by sending SIGUSR1.'),
+
+               cfg.IntOpt('cobalt_profile_duration',
+               default=60,
+               help='The number of seconds after which a profile stops.'),
+
+               cfg.IntOpt('cobalt_profile_operations',
+               default=0,
+               help='The number of operations after which a profile stops, '
+                    'or 0 to only stop after cobalt_profile_duration.'),
+
+               cfg.FloatOpt('cobalt_profile_interval',
+               default=0.005,
+               help='The number of seconds between two samples.'),
+
+               cfg.StrOpt('cobalt_profile_dir',
+               default='$state_path/cobalt-profiles',
+               help='The directory that profiles are written to.')]
+CONF.register_opts(profiler_opts)
+
+# The sampler must really sleep, in its own thread.
+_thread = patcher.original('thread')
+_threading = patcher.original('threading')
+_sleep = patcher.original('time').sleep
+
+def _frame_name(frame):
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                           code.co_firstlineno)
+
+class _Sampler(object):
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.defaultdict(int)
+        self.running = True
+        self.thread = _threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id, None)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+            _sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def write(self, path):
+        output = open(path, 'w')
+        try:
+            for stack, count in sorted(self.stacks.items()):
+                output.write('%s %d\n' % (stack, count))
+        finally:
+            output.close()
+
+class Profiler(object):
+
+    def __init__(self):
+        self.active = False
+        self.mode = None
+        self.sampler = None
+        self.profile = None
+        self.operations = 0
+        self.max_operations = 0
+        self.deadline = None
+        self.path = None
+
+    def start(self, mode=None, duration=None, operations=None):
+        """
+        Starts profiling. This must be called from the thread that runs the
+        greenthreads.
+        """
+        if self.active:
+            return
+        self.mode = mode or CONF.cobalt_profile_mode
+        if duration is None:
+            duration = CONF.cobalt_profile_duration
+        if operations is None:
+            operations = CONF.cobalt_profile_operations
+
+        directory = CONF.cobalt_profile_dir
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        extension = self.mode == 'cprofile' and 'pstats' or 'folded'
+        self.path = os.path.join(directory, 'cobalt-compute-%d-%d.%s' %
+                                 (os.getpid(), int(time.time()), extension))
+
+        if self.mode == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.sampler = _Sampler(_thread.get_ident(),
+                                    CONF.cobalt_profile_interval)
+            self.sampler.thread.start()
+
+        self.operations = 0
+        self.max_operations = operations
+        if duration > 0:
+            self.deadline = eventlet.spawn_after(duration, self.stop)
+        self.active = True
+        LOG.info(_("Started a %s profile, writing it to %s"), self.mode, self.path)
+
+    def stop(self):
+        """ Stops profiling and writes out the profile. """
+        if not self.active:
+            return
+        self.active = False
+        if self.deadline is not None:
+            self.deadline.cancel()
+            self.deadline = None
+        try:
+            if self.profile is not None:
+                self.profile.disable()
+                self.profile.dump_stats(self.path)
+            else:
+                self.sampler.stop()
+                self.sampler.write(self.path)
+            LOG.info(_("Wrote a %s profile to %s"), self.mode, self.path)
+        except Exception:
+            LOG.exception(_("Failed to write the profile %s"), self.path)
+        finally:
+            self.profile = None
+            self.sampler = None
+
+    def operation_done(self):
+        self.operations += 1
+        if self.max_operations > 0 and self.operations >= self.max_operations:
+            self.stop()
+
+_profiler = Profiler()
+
+def get_profiler():
+    return _profiler
+
+def toggle():
+    """
+    Starts profiling, or stops the profile that is running. This is called
+    from a signal handler, so it never raises.
+    """
+    try:
+        if _profiler.active:
+            _profiler.stop()
+        else:
+            _profiler.start()
+    except Exception:
+        LOG.exception(_("Failed to toggle profiling"))
+
+def operation_done():
+    """ Counts an operation towards the end of the profile, if any. """
+    if _profiler.active:
+        _profiler.operation_done()
@@ -0,0 +1,95 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Retries operations that fail because of transient errors (a database restart,
+a lost RPC reply, ...) with exponential backoff and a total deadline.
+"""
+
+import random
+import time
+
+from nova.openstack.common import log as logging
+from nova.openstack.common.gettextutils import _
+
+LOG = logging.getLogger('nova.cobalt.retry')
+
+class RetryPolicy(object):
+    """
+    Calls a function until it succeeds, it raises a fatal or unknown error, or
+    the deadline passes. The delay before a retry is drawn uniformly between
+    zero and an exponentially growing bound (full jitter), so that the hosts
+    recovering from the same outage do not retry in lockstep.
+
+    The deadline and the delays may be numbers or callables returning numbers,
+    which lets them follow configuration changes.
+    """
+
+    def __init__(self, name, transient=(Exception,), fatal=(), deadline=60,
+                 initial_delay=0.5, max_delay=10.0):
+        self.name = name
+        self.transient = transient
+        self.fatal = fatal
+        self.deadline = deadline
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.stats = {'calls': 0,
+                      'retries': 0,
+                      'fatal': 0,
+                      'exhausted': 0}
+
+    def _value(self, value):
+        if callable(value):
+            return value()
+        return value
+
+    def _delay(self, attempt):
+        bound = min(self._value(self.max_delay),
+                    self._value(self.initial_delay) * (2 ** attempt))
+        return random.uniform(0, bound)
+
+    def call(self, fn, *args, **kwargs):
+        self.stats['calls'] += 1
+        start = time.time()
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except self.fatal:
+                self.stats['fatal'] += 1
+                raise
+            except self.transient, e:
+                delay = self._delay(attempt)
+                elapsed = time.time() - start
+                if elapsed + delay > self._value(self.deadline):
+                    self.stats['exhausted'] += 1
+                    LOG.warn(_("%s: giving up on %s after %d attempts and %.1f seconds"),
+                             self.name, getattr(fn, '__name__', fn), attempt + 1, elapsed)
+                    raise
+                LOG.debug(_("%s: %s failed (%s), retry %d in %.2f seconds"),
+                          self.name, getattr(fn, '__name__', fn), e, attempt + 1, delay)
+            attempt += 1
+            self.stats['retries'] += 1
+            time.sleep(delay)
+
+    def __call__(self, fn):
+        """ Use the policy as a decorator. """
+        def wrapped_fn(*args, **kwargs):
+            return self.call(fn, *args, **kwargs)
+
+        wrapped_fn.__name__ = fn.__name__
+        wrapped_fn.__doc__ = fn.__doc__
+
+        return wrapped_fn
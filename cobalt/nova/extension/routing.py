@@ -0,0 +1,145 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Resolves the interface used to reach a host from the kernel's IPv4 routing
+table, without forking `ip route` for every lookup.
+"""
+
+import fcntl
+import socket
+import struct
+import time
+
+from nova import exception
+from nova.openstack.common import log as logging
+from nova.openstack.common.gettextutils import _
+
+LOG = logging.getLogger('nova.cobalt.routing')
+
+ROUTE_FILE = '/proc/net/route'
+
+# From linux/route.h and linux/sockios.h.
+RTF_UP = 0x0001
+SIOCGIFADDR = 0x8915
+
+def _address_to_int(address):
+    """ Converts a dotted quad to an integer in the byte order of /proc. """
+    return struct.unpack('=I', socket.inet_aton(address))[0]
+
+def _interface_address(device):
+    """ Returns the IPv4 address of the device, or None if it has none. """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        result = fcntl.ioctl(sock.fileno(), SIOCGIFADDR,
+                             struct.pack('256s', device[:15]))
+        return socket.inet_ntoa(result[20:24])
+    except IOError:
+        return None
+    finally:
+        sock.close()
+
+class Route(object):
+
+    def __init__(self, device, destination, mask, metric):
+        self.device = device
+        self.destination = destination
+        self.mask = mask
+        self.metric = metric
+        self.prefix = bin(mask).count('1')
+
+    def matches(self, address):
+        return (address & self.mask) == self.destination
+
+def parse_routes(content):
+    """ Returns the routes that are up in the /proc/net/route content. """
+    routes = []
+    for line in content.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 8:
+            continue
+        try:
+            flags = int(fields[3], 16)
+            route = Route(fields[0], int(fields[1], 16), int(fields[7], 16),
+                          int(fields[6]))
+        except ValueError:
+            LOG.warn(_("Ignoring garbled route: %s"), line)
+            continue
+        if flags & RTF_UP:
+            routes.append(route)
+    return routes
+
+class RouteTable(object):
+    """
+    Caches the device used for each destination until the routing table
+    changes, and the addresses of host names for dns_ttl seconds.
+    """
+
+    def __init__(self, route_file=ROUTE_FILE, dns_ttl=300,
+                 interface_address=_interface_address):
+        self.route_file = route_file
+        self.dns_ttl = dns_ttl
+        self.interface_address = interface_address
+        self.content = None
+        self.routes = []
+        self.devices = {}
+        self.addresses = {}
+
+    def _refresh(self):
+        # Reading the table is cheap, it's the forks and lookups we avoid.
+        route_file = open(self.route_file)
+        try:
+            content = route_file.read()
+        finally:
+            route_file.close()
+        if content != self.content:
+            self.content = content
+            self.routes = parse_routes(content)
+            self.devices = {}
+
+    def _resolve(self, host):
+        now = time.time()
+        cached = self.addresses.get(host, None)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        address = socket.gethostbyname(host)
+        self.addresses[host] = (address, now + self.dns_ttl)
+        return address
+
+    def _find_device(self, address):
+        value = _address_to_int(address)
+        best = None
+        for route in self.routes:
+            if not route.matches(value):
+                continue
+            if best is None or route.prefix > best.prefix or \
+               (route.prefix == best.prefix and route.metric < best.metric):
+                best = route
+        if best is None:
+            raise exception.NovaException(_("No route to destination."))
+        if address.startswith('127.') or best.device == 'lo' or \
+           self.interface_address(best.device) == address:
+            raise exception.NovaException(_("Can't migrate to the same host."))
+        return best.device
+
+    def device_for(self, host):
+        """ Returns the name of the device that traffic to host leaves by. """
+        address = self._resolve(host)
+        self._refresh()
+        device = self.devices.get(address, None)
+        if device is None:
+            device = self._find_device(address)
+            self.devices[address] = device
+        return device
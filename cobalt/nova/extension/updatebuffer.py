@@ -0,0 +1,48 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Coalesces the database updates an operation makes to an instance, so that
+the operation pays for one conductor call per checkpoint instead of one per
+state change.
+"""
+
+class InstanceUpdateBuffer(object):
+    """
+    Collects the updates an operation makes to an instance and writes them
+    with a single call to update (which takes the context, the instance uuid
+    and the updated fields) when the operation reaches a checkpoint. Later
+    values for a field replace earlier ones.
+    """
+
+    def __init__(self, update, context, instance_uuid):
+        self.update_fn = update
+        self.context = context
+        self.instance_uuid = instance_uuid
+        self.updates = {}
+
+    def update(self, **kwargs):
+        self.updates.update(kwargs)
+
+    def flush(self, **kwargs):
+        self.update(**kwargs)
+        if not self.updates:
+            return None
+        updates = self.updates
+        self.updates = {}
+        return self.update_fn(self.context, self.instance_uuid, **updates)
+
+    def discard(self):
+        self.updates = {}
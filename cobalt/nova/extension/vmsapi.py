@@ -119,6 +119,9 @@ class VmsApi(object):
     def pause(self, instance_name):
         return tpool.execute(commands.pause, instance_name)
 
+    def unpause(self, instance_name):
+        return tpool.execute(commands.unpause, instance_name)
+
     def export(self, *args, **kwargs):
         raise exception.NovaException('Export is not supported on this version of VMS')
 
@@ -17,16 +17,22 @@
 Interfaces that configure vms and perform hypervisor specific operations.
 """
 
+import copy
 import hashlib
 import os
 import pwd
+import shutil
 import tempfile
+import time
 import uuid
 import inspect
 
+from eventlet import event
+from eventlet import tpool
 from glanceclient.exc import HTTPForbidden
 
 import nova
+from nova import context as nova_context
 from nova import exception
 
 from nova.virt import images
@@ -56,25 +62,46 @@ vmsconn_opts = [
                cfg.BoolOpt('cobalt_clean_unused_symlinks',
                default=True,
                help='Cobalt should clean up symlinks that is creates and'
-                    'are discovered to be unused.')]
+                    'are discovered to be unused.'),
+
+               cfg.BoolOpt('cobalt_verify_artifact_checksums',
+               default=False,
+               help='Check downloaded artifacts against the checksums '
+                    'recorded in the artifact manifest of the live-image.'),
+
+               cfg.StrOpt('cobalt_migration_sync',
+               default='files',
+               help='How the disks of a migrating instance are flushed before '
+                    'it moves: files (fdatasync each file and device of the '
+                    'instance), filesystem (syncfs the file systems holding '
+                    'them) or global (sync the whole host).'),
+
+               cfg.IntOpt('cobalt_domain_template_cache_size',
+               default=64,
+               help='The number of live-images for which this host keeps the '
+                    'disk layout and libvirt XML of a clone, which the domains '
+                    'of further clones are made from. 0 disables the cache.')]
 CONF.register_opts(vmsconn_opts)
 
 import vms.utilities as utilities
+from . import domaintemplate
+from . import fileops
+from . import flush
+from . import metrics
 from . import vmsapi as vms_api
 
-def run_as(cmd, uid):
-    sudo_cmd = ['sudo', '-u', '#%d' % uid]
-    sudo_cmd += cmd
-    utilities.check_command(sudo_cmd)
+# The source host gives up on the launch of a migration after this many
+# seconds, so a domain prepared for an incoming migration is stale by then.
+PREPARED_DOMAIN_TTL = 1800
 
-def mkdir_as(path, uid):
-    run_as([ 'mkdir', '-p', path], uid)
+def file_ops(uid, gid=None):
+    """ Returns a batch of file operations to be run as the user uid. """
+    return fileops.FileOps(uid, gid, run_command=utilities.check_command)
 
-def touch_as(path, uid):
-    run_as(['touch', path], uid)
-
-def symlink_as(target, link, uid):
-    run_as(['ln', '-s', target, link], uid)
+def mkdir_as(path, uid, gid=None):
+    ops = file_ops(uid, gid)
+    ops.mkdir(path)
+    ops.run()
 
 def get_vms_connection(connection_type):
     # Configure the logger regardless of the type of connection that will be used.
@@ -124,8 +151,10 @@ class VmsConnection:
         instance the name new_instance_name.
         """
         new_instance_name = new_instance_ref['name']
-        result = self.vmsapi.bless(instance_name, new_instance_name,
-                                   mem_url=migration_url, migration=migration_url and True)
+        with metrics.phase('vms_bless'):
+            result = self.vmsapi.bless(instance_name, new_instance_name,
+                                       mem_url=migration_url,
+                                       migration=migration_url and True)
 
         self._chmod_blessed_files(result.blessed_files)
 
@@ -137,11 +166,17 @@ class VmsConnection:
 
     @_log_call
     def post_bless(self, context, new_instance_ref, blessed_files, vms_policy_template=None):
+        """
+        Returns the image refs of the blessed files and their descriptions
+        (see describe_artifacts), uploading them to the image service if it
+        is used.
+        """
         if CONF.cobalt_use_image_service:
-            return self._upload_files(context, new_instance_ref, blessed_files,
-                                      vms_policy_template=vms_policy_template)
+            with metrics.phase('upload'):
+                return self._upload_files(context, new_instance_ref, blessed_files,
+                                          vms_policy_template=vms_policy_template)
         else:
-            return blessed_files
+            return blessed_files, self.describe_artifacts(context, blessed_files)
 
     @_log_call
     def bless_cleanup(self, blessed_files):
@@ -169,11 +204,39 @@ class VmsConnection:
     def _delete_images(self, context, image_refs):
         pass
 
+    @_log_call
+    def describe_artifacts(self, context, image_refs):
+        """
+        Returns {image ref: description} for the artifacts of a live-image,
+        where each description holds the keyword arguments of
+        manifest.Manifest.add that can be determined.
+        """
+        descriptions = {}
+        for image_ref in image_refs:
+            if CONF.cobalt_use_image_service:
+                descriptions[image_ref] = self._describe_image(
+                        image_ref, self.image_service.show(context, image_ref))
+            else:
+                descriptions[image_ref] = {
+                    'size': os.path.getsize(image_ref),
+                    'codec': 'raw',
+                    'name': os.path.basename(image_ref),
+                    'path': image_ref}
+        return descriptions
+
+    def _describe_image(self, image_ref, image):
+        """ Returns the description of an artifact from its image metadata. """
+        return {'size': image.get('size'),
+                'checksum': image.get('checksum'),
+                'codec': image.get('disk_format'),
+                'name': image['properties'].get('file_name', image['name']),
+                'glance_id': image_ref}
+
     @_log_call
     def launch(self, context, instance_name, new_instance_ref,
                network_info, skip_image_service=False, target=0,
                migration_url=None, image_refs=[], params={}, vms_policy='',
-               block_device_info=None,lvm_info={}):
+               block_device_info=None,lvm_info={}, artifacts=None):
         """
         Launch a blessed instance
         """
@@ -182,20 +245,24 @@ class VmsConnection:
                                         skip_image_service=skip_image_service,
                                         image_refs=image_refs,
                                         block_device_info=block_device_info,
-                                        lvm_info=lvm_info)
+                                        lvm_info=lvm_info,
+                                        artifacts=artifacts)
 
         # Launch the new VM.
         vms_options = {'memory.policy':vms_policy}
-        result = self.vmsapi.launch(instance_name, new_name, target, path,
-                                    mem_url=migration_url, migration=(migration_url and True),
-                                    guest_params=params.get('guest',{}),
-                                    vms_options=vms_options)
+        with metrics.phase('vms_launch'):
+            result = self.vmsapi.launch(instance_name, new_name, target, path,
+                                        mem_url=migration_url,
+                                        migration=(migration_url and True),
+                                        guest_params=params.get('guest',{}),
+                                        vms_options=vms_options)
 
         # Take care of post-launch.
-        self.post_launch(context,
-                         new_instance_ref,
-                         network_info,
-                         migration=(migration_url and True))
+        with metrics.phase('post_launch'):
+            self.post_launch(context,
+                             new_instance_ref,
+                             network_info,
+                             migration=(migration_url and True))
         return result
 
     @_log_call
@@ -206,9 +273,19 @@ class VmsConnection:
                    migration=False,
                    skip_image_service=False,
                    image_refs=[],
-                   lvm_info={}):
+                   lvm_info={},
+                   artifacts=None):
         return (new_instance_ref['name'], None)
 
+    @_log_call
+    def prefetch_images(self, context, image_refs=[], artifacts=None):
+        """
+        Places the artifacts referenced by image_refs into the local image
+        cache ahead of any launch. Returns the list of local paths. The
+        artifacts are the manifest entries for image_refs, when known.
+        """
+        return []
+
     @_log_call
     def post_launch(self, context,
                     new_instance_ref,
@@ -217,6 +294,23 @@ class VmsConnection:
                     migration=False):
         pass
 
+    @_log_call
+    def prepare_migration(self, context, instance_ref, network_info,
+                          block_device_info=None):
+        """
+        Sets up what the launch of an incoming migration needs ahead of it,
+        while the source host blesses the instance.
+        """
+        pass
+
+    @_log_call
+    def cancel_migration(self, context, instance_ref):
+        """
+        Removes what prepare_migration set up for a migration that is no
+        longer coming to this host.
+        """
+        pass
+
     @_log_call
     def pre_migration(self, context, instance_ref, network_info, migration_url):
         pass
@@ -229,6 +323,10 @@ class VmsConnection:
     def pause_instance(self, instance_ref):
         self.vmsapi.pause(instance_ref['name'])
 
+    @_log_call
+    def unpause_instance(self, instance_ref):
+        self.vmsapi.unpause(instance_ref['name'])
+
     def pre_export(self, context, instance_ref, image_refs=[]):
         config = self.vmsapi.config()
         shared = config.SHARED
@@ -391,6 +489,22 @@ class LibvirtConnection(VmsConnection):
 
         self.determine_openstack_user()
 
+        # Maps download targets in the image cache to the event signalled
+        # once the download into that target finishes.
+        self.downloads = {}
+        # Maps the uuids of incoming migrations to the time their domain was
+        # prepared.
+        self.prepared_domains = {}
+        self.domain_templates = domaintemplate.DomainTemplateCache(
+                                    CONF.cobalt_domain_template_cache_size)
+
+        # (rui-lin) libvirt_xml parameter was removed from 2013.1 to 2013.1.1
+        # Check if the parameter is in argument list of _create_image to
+        # decide which method signature to use, and whether to write the xml
+        # file to disk afterwards.
+        self.create_image_takes_xml = \
+                'libvirt_xml' in inspect.getargspec(LibvirtDriver._create_image).args
+
         # Two libvirt drivers are created for the two different cases:
         #   migration: When doing a migration we attempt to keep everything
         #              the same as a regular boot. In this case we just use
@@ -404,6 +518,9 @@ class LibvirtConnection(VmsConnection):
         launch_libvirt_conn.image_backend = LaunchImageBackend(CONF.use_cow_images)
         self.libvirt_connections = {'migration': LibvirtDriver(virtapi, read_only=False),
                                     'launch': launch_libvirt_conn}
+        # The arguments of get_config also vary between releases.
+        self.vif_config_args = \
+                inspect.getargspec(launch_libvirt_conn.vif_driver.get_config).args
 
         vms_config = self.vmsapi.config()
         # It doesn't matter which libvirt connection we use because the uri
@@ -441,7 +558,93 @@ class LibvirtConnection(VmsConnection):
                        "Please configure the openstack_user flag correctly." % (openstack_user))
             raise e
 
-    def _stub_disks(self, libvirt_conn, instance, disk_mapping, block_device_info, lvm_info):
+    def _ensure_image_base_path(self):
+        image_base_path = os.path.join(CONF.instances_path, CONF.base_dir_name)
+        if not os.path.exists(image_base_path):
+            LOG.debug('Base path %s does not exist. It will be created now.', image_base_path)
+            mkdir_as(image_base_path, self.openstack_uid, self.openstack_gid)
+        return image_base_path
+
+    def _verify_checksum(self, path, checksum):
+        digest = hashlib.md5()
+        with open(path, 'rb') as artifact_file:
+            for data in iter(lambda: artifact_file.read(1024 * 1024), ''):
+                digest.update(data)
+        if digest.hexdigest() != checksum:
+            raise exception.NovaException(_("Artifact %s does not match its "
+                                            "checksum.") % (path))
+
+    def _download_images(self, context, image_refs, image_base_path, force=False,
+                         artifacts=None):
+        """
+        Downloads the images into image_base_path unless they are already
+        there (or force is set). Concurrent requests for the same target, e.g.
+        a prefetch racing the first launch on this host, share one download.
+        The image service is only asked about images missing from artifacts.
+        """
+        if artifacts is None:
+            artifacts = {}
+        targets = []
+        for image_ref in image_refs:
+            artifact = artifacts.get(image_ref, None) or {}
+            name = artifact.get('name', None)
+            if name is None:
+                image = self.image_service.show(context, image_ref)
+                # In previous versions name was the filename (*.gc, *.disk) so
+                # there was no file_name property. Now that name is more descriptive
+                # when uploaded to glance, file_name property is set; use if possible
+                name = image['properties'].get('file_name',image['name'])
+            target = os.path.join(image_base_path, name)
+            targets.append(target)
+
+            pending = self.downloads.get(target, None)
+            if pending is not None:
+                # Somebody else is already fetching this file, so we simply
+                # wait for them. A forced fetch still needs its own copy
+                # because the in-flight one may be stale.
+                LOG.debug("Waiting for in-flight download of %s." % (target))
+                pending.wait()
+                if not force and os.path.exists(target):
+                    continue
+
+            if force or not os.path.exists(target):
+                # If the path does not exist fetch the data from the image
+                # service. We download to a temporary location so we can make
+                # the file appear atomically from the right user.
+                done = event.Event()
+                self.downloads[target] = done
+                try:
+                    fd, temp_target = tempfile.mkstemp(dir=image_base_path)
+                    try:
+                        os.close(fd)
+                        self.image_service.download(context, image_ref, temp_target)
+                        if CONF.cobalt_verify_artifact_checksums and \
+                           artifact.get('checksum', None):
+                            self._verify_checksum(temp_target, artifact['checksum'])
+                        os.chown(temp_target, self.openstack_uid, self.openstack_gid)
+                        os.chmod(temp_target, 0644)
+                        os.rename(temp_target, target)
+                    except:
+                        os.unlink(temp_target)
+                        raise
+                finally:
+                    if self.downloads.get(target) is done:
+                        del self.downloads[target]
+                    done.send()
+        return targets
+
+    @_log_call
+    def prefetch_images(self, context, image_refs=[], artifacts=None):
+        if not CONF.cobalt_use_image_service:
+            # Without the image service the artifacts live on shared storage
+            # and there is nothing to place.
+            return []
+        image_base_path = self._ensure_image_base_path()
+        return self._download_images(context, image_refs, image_base_path,
+                                     artifacts=artifacts)
+
+    def _stub_disks(self, libvirt_conn, instance, disk_mapping, block_device_info,
+                    lvm_info, ops):
         # Note(dscannell): We want to stub out the disks that nova expects to
         # to exists and our calls _create_image will lazy create them. There
         # are essentially two disk we need to stub:
@@ -477,7 +680,7 @@ class LibvirtConnection(VmsConnection):
             nova_disk = libvirt_conn.image_backend.image(instance,
                                                          disk_name,
                                                          CONF.libvirt_images_type)
-            self._stub_disk(nova_disk, size=lvm_size)
+            self._stub_disk(nova_disk, ops, size=lvm_size)
             stubbed_disks[disk_name] = nova_disk
 
             if nova_disk.source_type == 'file' and \
@@ -489,13 +692,15 @@ class LibvirtConnection(VmsConnection):
                 #              basically create a symlink to the qcow2 to ensure
                 #              that rebooting, etc continue to work.
                 lvm_disk_file = imagebackend.Lvm(instance, disk_name)
-                symlink_as(str(nova_disk.path),
-                           str(lvm_disk_file.path),
-                           os.getuid())
+                os.symlink(str(nova_disk.path), str(lvm_disk_file.path))
 
         return stubbed_disks
 
-    def _stub_disk(self, nova_disk, size=None):
+    def _stub_disk(self, nova_disk, ops, size=None):
+        """
+        Stubs the disk. Disk files are only queued in ops, which the caller
+        runs along with its other file operations.
+        """
         disk_file = nova_disk.path
         source_type = nova_disk.source_type
 
@@ -503,9 +708,8 @@ class LibvirtConnection(VmsConnection):
         if source_type == 'file':
             # We need to make sure that the file & directory exists as the
             # openstack user
-            mkdir_as(disk_dir, self.openstack_uid)
-            touch_as(disk_file, self.openstack_uid)
-            os.chown(disk_file, self.openstack_uid, self.openstack_gid)
+            ops.mkdir(disk_dir)
+            ops.touch(disk_file)
 
         elif source_type == 'block':
             # Note(dscannell) it is a requirement for nova that the volume group already
@@ -535,12 +739,13 @@ class LibvirtConnection(VmsConnection):
                    migration=False,
                    skip_image_service=False,
                    image_refs=[],
-                   lvm_info={}):
+                   lvm_info={},
+                   artifacts=None):
 
-        image_base_path = os.path.join(CONF.instances_path, CONF.base_dir_name)
-        if not os.path.exists(image_base_path):
-            LOG.debug('Base path %s does not exist. It will be created now.', image_base_path)
-            mkdir_as(image_base_path, self.openstack_uid)
+        image_base_path = self._ensure_image_base_path()
+        # Claim the prepared domain before anything yields so that it is not
+        # cleaned up underneath the launch.
+        prepared_at = self.prepared_domains.pop(new_instance_ref['uuid'], None)
 
         artifact_path = None
         if not(skip_image_service) and CONF.cobalt_use_image_service:
@@ -548,33 +753,100 @@ class LibvirtConnection(VmsConnection):
             # We need to first download the descriptor and the disk files
             # from the image service.
             LOG.debug("Downloading images %s from the image service." % (image_refs))
+            # NOTE: We always fetch in the case of a migration, as the
+            # descriptor may have changed from its previous state. Migrating
+            # VMs are the only case where a descriptor for an instance will
+            # not be a fixed constant.
+            with metrics.phase('download'):
+                self._download_images(context, image_refs, image_base_path,
+                                      force=migration, artifacts=artifacts)
+        working_dir = os.path.join(CONF.instances_path, new_instance_ref['uuid'])
+        libvirt_file = os.path.join(working_dir, "libvirt.xml")
+        if migration and prepared_at is not None and \
+           prepared_at > time.time() - PREPARED_DOMAIN_TTL and \
+           not (block_device_info or {}).get('block_device_mapping'):
+            LOG.debug("Using the domain prepared for the migration of %s" %
+                      new_instance_ref['uuid'])
+        else:
+            template_key = self._domain_template_key(new_instance_ref, image_refs,
+                                                     block_device_info, migration)
+            self._prepare_domain(context, new_instance_ref, network_info,
+                                 block_device_info, migration, lvm_info,
+                                 image_base_path, template_key=template_key)
 
-            for image_ref in image_refs:
-                image = self.image_service.show(context, image_ref)
-                # In previous versions name was the filename (*.gc, *.disk) so
-                # there was no file_name property. Now that name is more descriptive
-                # when uploaded to glance, file_name property is set; use if possible
-                target = os.path.join(image_base_path,
-                                      image['properties'].get('file_name',image['name']))
-
-                if migration or not os.path.exists(target):
-                    # If the path does not exist fetch the data from the image
-                    # service.  NOTE: We always fetch in the case of a
-                    # migration, as the descriptor may have changed from its
-                    # previous state. Migrating VMs are the only case where a
-                    # descriptor for an instance will not be a fixed constant.
-                    # We download to a temporary location so we can make the
-                    # file appear atomically from the right user.
-                    fd, temp_target = tempfile.mkstemp(dir=image_base_path)
-                    try:
-                        os.close(fd)
-                        self.image_service.download(context, image_ref, temp_target)
-                        os.chown(temp_target, self.openstack_uid, self.openstack_gid)
-                        os.chmod(temp_target, 0644)
-                        os.rename(temp_target, target)
-                    except:
-                        os.unlink(temp_target)
-                        raise
+        # Return the libvirt file, this will be passed in as the name. This
+        # parameter is overloaded in the management interface as a libvirt
+        # special case.
+        return (libvirt_file, artifact_path)
+
+    def _domain_template_key(self, instance, image_refs, block_device_info, migration):
+        """
+        Returns the key of the domain template that the clone can be made from,
+        or None if its domain has to be generated. The clones of a live-image
+        only differ in the parts the template patches, unless volumes are
+        attached to them.
+        """
+        if migration or not(image_refs) or \
+           (block_device_info or {}).get('block_device_mapping'):
+            return None
+        return (tuple(image_refs), instance['instance_type_id'],
+                instance['root_device_name'], instance['config_drive'])
+
+    def _interfaces_xml(self, libvirt_conn, instance, network_info, flavor):
+        interfaces = []
+        for (network, mapping) in network_info:
+            if 'inst_type' in self.vif_config_args:
+                config = libvirt_conn.vif_driver.get_config(instance, network,
+                                                            mapping, None, flavor)
+            elif 'image_meta' in self.vif_config_args:
+                config = libvirt_conn.vif_driver.get_config(instance, network,
+                                                            mapping, None)
+            else:
+                config = libvirt_conn.vif_driver.get_config(instance, network,
+                                                            mapping)
+            interfaces.append(config.to_xml())
+        return interfaces
+
+    def _domain_xml(self, libvirt_conn, instance, network_info, disk_info,
+                    block_device_info, template_key, template):
+        """
+        Returns the libvirt XML of the instance, made from the template if
+        there is one and remembered as the template under template_key if not.
+        """
+        if template is not None:
+            try:
+                return template.clone_xml(instance['uuid'], instance['name'],
+                            self._interfaces_xml(libvirt_conn, instance,
+                                                 network_info, template.flavor))
+            except Exception:
+                LOG.exception(_("Failed to make the domain of %s from its "
+                                "template, generating it"), instance['uuid'])
+                self.domain_templates.invalidate(template_key)
+                template_key = None
+
+        xml = libvirt_conn.to_xml(instance, network_info, disk_info,
+                                  block_device_info=block_device_info)
+        if template_key is not None:
+            flavor = None
+            if 'inst_type' in self.vif_config_args:
+                flavor = libvirt_conn.virtapi.instance_type_get(
+                            nova_context.get_admin_context(read_deleted='yes'),
+                            instance['instance_type_id'])
+            self.domain_templates.put(template_key,
+                    domaintemplate.DomainTemplate(xml, instance['uuid'],
+                                                  instance['name'],
+                                                  copy.deepcopy(disk_info),
+                                                  flavor=flavor))
+        return xml
+
+    def _prepare_domain(self, context, new_instance_ref, network_info,
+                        block_device_info, migration, lvm_info, image_base_path,
+                        template_key=None):
+        """
+        Stubs the disks and writes out the libvirt.xml of the instance. The disk
+        layout and XML are taken from the domain template under template_key
+        when there is one.
+        """
         libvirt_conn_type = 'migration' if migration else 'launch'
         libvirt_conn = self.libvirt_connections[libvirt_conn_type]
         # (dscannell) Check to see if we need to convert the network_info
@@ -586,23 +858,31 @@ class LibvirtConnection(VmsConnection):
         # appears to be the root disk's image metadata. it checks the metadata
         # for the image format (e.g. iso, disk, etc). Right now we are passing
         # in None (default) but we need to double check this.
-        disk_info = blockinfo.get_disk_info(CONF.libvirt_type,
-                                            new_instance_ref,
-                                            block_device_info)
+        template = None
+        if template_key is not None:
+            template = self.domain_templates.get(template_key)
+        if template is not None:
+            disk_info = copy.deepcopy(template.disk_info)
+        else:
+            disk_info = blockinfo.get_disk_info(CONF.libvirt_type,
+                                                new_instance_ref,
+                                                block_device_info)
 
-        # We need to create the libvirt xml, and associated files. Pass back
-        # the path to the libvirt.xml file.
+        # We need to create the libvirt xml, and associated files.
         working_dir = os.path.join(CONF.instances_path, new_instance_ref['uuid'])
 
-        stubbed_disks = self._stub_disks(libvirt_conn,
-                                         new_instance_ref,
-                                         disk_info['mapping'],
-                                         block_device_info,
-                                         lvm_info)
+        # The files are all created as the openstack user in one go.
+        ops = file_ops(self.openstack_uid, self.openstack_gid)
+        with metrics.phase('stub_disks'):
+            stubbed_disks = self._stub_disks(libvirt_conn,
+                                             new_instance_ref,
+                                             disk_info['mapping'],
+                                             block_device_info,
+                                             lvm_info,
+                                             ops)
 
-        libvirt_file = os.path.join(working_dir, "libvirt.xml")
         # Make sure that our working directory exists.
-        mkdir_as(working_dir, self.openstack_uid)
+        ops.mkdir(working_dir)
 
         # (dscannell) We want to disable any injection. We do this by making a
         # copy of the instance and clearing out some entries. Since OpenStack
@@ -628,34 +908,38 @@ class LibvirtConnection(VmsConnection):
         disk_images = {'image_id': new_instance_ref['uuid'],
                        'kernel_id': new_instance_ref['kernel_id'],
                        'ramdisk_id': new_instance_ref['ramdisk_id']}
-        touch_as(os.path.join(image_base_path,
-                              get_cache_fname(disk_images, 'image_id')),
-                 self.openstack_uid)
+        ops.touch(os.path.join(image_base_path,
+                               get_cache_fname(disk_images, 'image_id')))
+        with metrics.phase('stub_disks'):
+            ops.run()
 
         # (dscannell) This was taken from the core nova project as part of the
         # boot path for normal instances. We basically want to mimic this
         # functionality.
-        # (rui-lin) libvirt_xml parameter was removed from 2013.1 to 2013.1.1
-        # Check if the parameter is in argument list of _create_image to
-        # decide which method signature to use, and whether to write the xml
-        # file to disk afterwards.
-        if 'libvirt_xml' in inspect.getargspec(libvirt_conn._create_image).args:
-            xml = libvirt_conn.to_xml(instance_dict, network_info, disk_info,
-                                      block_device_info=block_device_info)
-            libvirt_conn._create_image(context, instance_dict, xml,
-                                       disk_info['mapping'],
-                                       network_info=network_info,
-                                       block_device_info=block_device_info,
-                                       disk_images=disk_images)
+        if self.create_image_takes_xml:
+            with metrics.phase('libvirt_xml'):
+                xml = self._domain_xml(libvirt_conn, instance_dict, network_info,
+                                       disk_info, block_device_info,
+                                       template_key, template)
+            with metrics.phase('create_image'):
+                libvirt_conn._create_image(context, instance_dict, xml,
+                                           disk_info['mapping'],
+                                           network_info=network_info,
+                                           block_device_info=block_device_info,
+                                           disk_images=disk_images)
         else:
-            libvirt_conn._create_image(context, instance_dict,
-                                       disk_info['mapping'],
-                                       network_info=network_info,
-                                       block_device_info=block_device_info,
-                                       disk_images=disk_images)
-            xml = libvirt_conn.to_xml(instance_dict, network_info, disk_info,
-                                      block_device_info=block_device_info,
-                                      write_to_disk=True)
+            with metrics.phase('create_image'):
+                libvirt_conn._create_image(context, instance_dict,
+                                           disk_info['mapping'],
+                                           network_info=network_info,
+                                           block_device_info=block_device_info,
+                                           disk_images=disk_images)
+            with metrics.phase('libvirt_xml'):
+                xml = self._domain_xml(libvirt_conn, instance_dict, network_info,
+                                       disk_info, block_device_info,
+                                       template_key, template)
+                libvirt_utils.write_to_file(os.path.join(working_dir, 'libvirt.xml'),
+                                            xml)
 
         if not(migration):
             for disk_name, disk_file in stubbed_disks.iteritems():
@@ -672,10 +956,33 @@ class LibvirtConnection(VmsConnection):
                          (os.path.join(root, path), self.openstack_uid))
                 os.chown(os.path.join(root, path), self.openstack_uid, self.openstack_gid)
 
-        # Return the libvirt file, this will be passed in as the name. This
-        # parameter is overloaded in the management interface as a libvirt
-        # special case.
-        return (libvirt_file, artifact_path)
+    @_log_call
+    def prepare_migration(self, context, instance_ref, network_info,
+                          block_device_info=None):
+        if CONF.libvirt_images_type == 'lvm':
+            # The sizes of the volumes are only known once the bless is done.
+            return
+        image_base_path = self._ensure_image_base_path()
+        self._prepare_domain(context, instance_ref, network_info,
+                             block_device_info, True, {}, image_base_path)
+        self.prepared_domains[instance_ref['uuid']] = time.time()
+
+    @_log_call
+    def cancel_migration(self, context, instance_ref):
+        if self.prepared_domains.pop(instance_ref['uuid'], None) is not None:
+            self._remove_prepared_domain(instance_ref['uuid'])
+
+    def _remove_prepared_domain(self, instance_uuid):
+        """
+        Removes the working directory and the _base stub of a domain that was
+        prepared for a migration.
+        """
+        shutil.rmtree(os.path.join(CONF.instances_path, instance_uuid),
+                      ignore_errors=True)
+        stub = os.path.join(CONF.instances_path, CONF.base_dir_name,
+                            get_cache_fname({'image_id': instance_uuid}, 'image_id'))
+        if os.path.exists(stub):
+            os.remove(stub)
 
     @_log_call
     def post_launch(self, context,
@@ -692,9 +999,22 @@ class LibvirtConnection(VmsConnection):
     @_log_call
     def pre_migration(self, context, instance_ref, network_info, migration_url):
         # Make sure that the disk reflects all current state for this VM.
-        # It's times like these that I wish there was a way to do this on a
-        # per-file basis, but we have no choice here but to sync() globally.
-        utilities.call_command(["sync"])
+        working_dir = os.path.join(CONF.instances_path, instance_ref['uuid'])
+        mode = CONF.cobalt_migration_sync
+        start = metrics.monotonic()
+        with metrics.phase('sync'):
+            flushed = None
+            if mode != 'global' and os.path.isdir(working_dir):
+                try:
+                    flushed = tpool.execute(flush.flush_instance, working_dir, mode)
+                except Exception:
+                    LOG.exception(_("Failed to flush the disks of instance %s, "
+                                    "syncing the host instead") % instance_ref['uuid'])
+            if flushed is None:
+                utilities.call_command(["sync"])
+        LOG.debug("Flushed %s for the migration of %s in %.3fs" %
+                  (flushed is None and 'the host' or '%d paths' % flushed,
+                   instance_ref['uuid'], metrics.monotonic() - start))
 
     @_log_call
     def post_migration(self, context, instance_ref, network_info, migration_url):
@@ -730,6 +1050,7 @@ class LibvirtConnection(VmsConnection):
         blessed_image_refs = []
         descriptor_ref = None
         other_images = []
+        images = {}
         for blessed_file in blessed_files:
             image_name, image_id = self._friendly_upload(context, instance_ref, blessed_file)
 
@@ -756,7 +1077,8 @@ class LibvirtConnection(VmsConnection):
             properties = self.image_service.show(context, image_id)['properties']
             properties.update({'image_type': image_type,
                                'file_name': os.path.basename(blessed_file)})
-            self.image_service.update(context, image_id, {'properties': properties})
+            images[image_id] = self.image_service.update(context, image_id,
+                                                         {'properties': properties})
 
         properties = self.image_service.show(context, descriptor_ref)['properties']
         properties.update({'live_image': True,
@@ -769,8 +1091,12 @@ class LibvirtConnection(VmsConnection):
             properties['live_image_data_%s' %(image_name)] = image_id
         if vms_policy_template != None:
             properties['vms_policy_template'] = vms_policy_template
-        self.image_service.update(context, descriptor_ref, {'properties': properties})
-        return blessed_image_refs
+        images[descriptor_ref] = self.image_service.update(context, descriptor_ref,
+                                                           {'properties': properties})
+        # The image service already returned what the manifest records.
+        descriptions = dict([(image_ref, self._describe_image(image_ref, image))
+                             for image_ref, image in images.items() if image])
+        return blessed_image_refs, descriptions
 
     @_log_call
     def _delete_images(self, context, image_refs):
@@ -822,3 +1148,10 @@ class LibvirtConnection(VmsConnection):
         """
         if CONF.libvirt_images_type == 'lvm':
             self._clean_lvm_symlinks()
+
+        # Remove the domains prepared for migrations that never arrived.
+        expired = time.time() - PREPARED_DOMAIN_TTL
+        for instance_uuid, prepared_at in self.prepared_domains.items():
+            if prepared_at < expired:
+                del self.prepared_domains[instance_uuid]
+                self._remove_prepared_domain(instance_uuid)
@@ -0,0 +1,166 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Keeps clones of live-images launched ahead of time and paused on a host, so
+that a launch only has to hand one to its owner and resume it.
+
+A pooled clone is an ordinary launched instance in the task state POOLED. A
+launch request claims it by moving it to CLAIMED, which only one request can
+do, and the host resumes it when the launch reaches it.
+"""
+
+import time
+
+from nova.openstack.common import log as logging
+from nova.openstack.common.gettextutils import _
+
+LOG = logging.getLogger('nova.cobalt.warmpool')
+
+POOLED = 'pooled'
+CLAIMED = 'claimed'
+
+# The number of seconds after which a pooled launch that never finished is
+# no longer counted towards the pool.
+PENDING_TIMEOUT = 600
+
+class WarmPool(object):
+    """
+    The paused clones of each live-image that this host keeps, up to sizes
+    (a dict of live-image uuid to number of clones) and max_instances in
+    total. A live-image that has not been launched for idle_timeout seconds
+    has its clones deleted and is not refilled until it is launched again.
+
+    The clones are launched and deleted with the given callables, which take
+    the context and the live-image or clone uuid.
+    """
+
+    def __init__(self, launch, delete, sizes, max_instances=20, idle_timeout=3600):
+        self.launch = launch
+        self.delete = delete
+        self.sizes = sizes
+        self.max_instances = max_instances
+        self.idle_timeout = idle_timeout
+        # Maps live-images to the uuids of their paused clones.
+        self.ready = {}
+        # Maps the uuids of clones being launched to (live-image, started).
+        self.pending = {}
+        self.last_used = {}
+        self.idle = set()
+        self.refilling = False
+        self.stats = {'launched': 0,
+                      'failed': 0,
+                      'claimed': 0,
+                      'evicted': 0}
+
+    def _count(self):
+        return sum([len(clones) for clones in self.ready.values()]) + \
+               len(self.pending)
+
+    def _count_for(self, live_image):
+        return len(self.ready.get(live_image, [])) + \
+               len([1 for (image, _started) in self.pending.values()
+                    if image == live_image])
+
+    def touch(self, live_image):
+        """ Records a launch of the live-image, which keeps its clones. """
+        self.last_used[live_image] = time.time()
+        self.idle.discard(live_image)
+
+    def launched(self, live_image, uuid, succeeded=True):
+        """ Records the end of the launch of a clone for the pool. """
+        self.pending.pop(uuid, None)
+        if succeeded:
+            self.stats['launched'] += 1
+            clones = self.ready.setdefault(live_image, [])
+            if uuid not in clones:
+                clones.append(uuid)
+        else:
+            self.stats['failed'] += 1
+
+    def claimed(self, live_image, uuid):
+        """ Records that a launch took the clone out of the pool. """
+        self.touch(live_image)
+        clones = self.ready.get(live_image, [])
+        if uuid in clones:
+            clones.remove(uuid)
+        self.stats['claimed'] += 1
+
+    def sync(self, pooled):
+        """
+        Replaces the paused clones with the (live-image, uuid) pairs found on
+        the host, which drops the clones that were claimed or deleted behind
+        the pool's back and adopts the ones left by a restart.
+        """
+        ready = {}
+        for (live_image, uuid) in pooled:
+            self.pending.pop(uuid, None)
+            ready.setdefault(live_image, []).append(uuid)
+            self.last_used.setdefault(live_image, time.time())
+        self.ready = ready
+
+    def _evict(self, context, live_image):
+        for uuid in self.ready.pop(live_image, []):
+            try:
+                self.delete(context, uuid)
+                self.stats['evicted'] += 1
+            except Exception:
+                LOG.exception(_("Failed to delete pooled instance %s"), uuid)
+
+    def refill(self, context):
+        """
+        Deletes the clones of the live-images that are no longer pooled or
+        have not been launched lately and tops the others up, within the
+        limit on the total number of clones.
+        """
+        if self.refilling:
+            return
+        self.refilling = True
+        try:
+            now = time.time()
+            for (uuid, (live_image, started)) in self.pending.items():
+                if now - started > PENDING_TIMEOUT:
+                    LOG.warn(_("Pooled instance %s never finished launching"), uuid)
+                    self.launched(live_image, uuid, succeeded=False)
+
+            for live_image in self.ready.keys():
+                last_used = self.last_used.setdefault(live_image, now)
+                if live_image not in self.sizes or \
+                   (self.idle_timeout > 0 and now - last_used > self.idle_timeout):
+                    self._evict(context, live_image)
+                    self.idle.add(live_image)
+
+            for (live_image, size) in self.sizes.items():
+                self.last_used.setdefault(live_image, now)
+                if live_image in self.idle:
+                    continue
+                while self._count_for(live_image) < size and \
+                      self._count() < self.max_instances:
+                    try:
+                        uuid = self.launch(context, live_image)
+                    except Exception:
+                        self.stats['failed'] += 1
+                        LOG.exception(_("Failed to launch a pooled instance of %s"),
+                                      live_image)
+                        break
+                    self.pending[uuid] = (live_image, time.time())
+        finally:
+            self.refilling = False
+
+    def get_stats(self):
+        return dict(self.stats,
+                    pooled=sum([len(clones) for clones in self.ready.values()]),
+                    pending=len(self.pending),
+                    idle=len(self.idle))
@@ -14,12 +14,51 @@
 #    under the License.
 
 import errno
+import httplib
 import os
+import re
+import urlparse
+
+import eventlet
 
 from nova.image import glance
 from nova.openstack.common import log as logging
+from oslo.config import cfg
 
 LOG = logging.getLogger('nova.cobalt.image')
+CONF = cfg.CONF
+
+image_opts = [
+               cfg.IntOpt('cobalt_download_part_size',
+               default=64 * 1024 * 1024,
+               help='The size in bytes of each byte range fetched when '
+                    'downloading a large artifact in parallel.'),
+
+               cfg.IntOpt('cobalt_download_concurrency',
+               default=4,
+               help='The number of byte ranges of a large artifact that are '
+                    'fetched at the same time. Set to 1 to always download '
+                    'artifacts as a single stream.'),
+
+               cfg.IntOpt('cobalt_download_parallel_threshold',
+               default=256 * 1024 * 1024,
+               help='Artifacts smaller than this many bytes are downloaded '
+                    'as a single stream.'),
+
+               cfg.StrOpt('cobalt_download_url_template',
+               default=None,
+               help='A URL template, e.g. '
+                    'http://glance:9292/v1/images/%(image_id)s, from which '
+                    'artifact data can be fetched with HTTP range requests. '
+                    'By default the direct_url of the image is used when the '
+                    'image service exposes one.')]
+CONF.register_opts(image_opts)
+
+# The amount of data read from a socket in one go.
+CHUNK_SIZE = 64 * 1024
+
+class RangeNotSupported(Exception):
+    pass
 
 class ImageService(object):
 
@@ -43,7 +82,7 @@ class ImageService(object):
         return image_ref['id']
 
     def upload(self, context, image_id, content_path, is_protected=True):
-        """ Uploads the contents to the image id """
+        """ Uploads the contents to the image id and returns its metadata """
         # Send up the file data to the newly created image.
         metadata = {'is_public': False,
                     'protected': is_protected,
@@ -58,7 +97,7 @@ class ImageService(object):
         # Upload that image to the image service
         LOG.debug(_("Uploading image %s") %(content_path))
         with open(content_path) as image_file:
-            self.image_service.update(context,
+            return self.image_service.update(context,
                 image_id,
                 metadata,
                 image_file)
@@ -74,10 +113,125 @@ class ImageService(object):
             image = metadata
 
         LOG.debug(_("Updating image %s: %s" %(image_id, image)))
-        self.image_service.update(context, image_id, image)
+        return self.image_service.update(context, image_id, image)
+
+    def _ranged_source(self, context, image_id):
+        """
+        Returns the (url, size) to fetch the image from with range requests,
+        or (None, None) if the image should be downloaded as a single stream.
+        """
+        if CONF.cobalt_download_concurrency <= 1:
+            return (None, None)
+
+        image = self.show(context, image_id)
+        size = image.get('size', None)
+        if size is None or size < max(CONF.cobalt_download_parallel_threshold, 1):
+            return (None, None)
+
+        url = image.get('direct_url', None)
+        if CONF.cobalt_download_url_template is not None:
+            url = CONF.cobalt_download_url_template % {'image_id': image_id}
+        if url is None or urlparse.urlparse(url).scheme not in ('http', 'https'):
+            return (None, None)
+
+        return (url, size)
+
+    def _fetch_range(self, context, url, start, end, image_file=None):
+        """
+        Fetches the bytes [start, end] of url. The data is written into
+        image_file at offset start, or returned if no file is given.
+        """
+        parsed = urlparse.urlparse(url)
+        if parsed.scheme == 'https':
+            conn = httplib.HTTPSConnection(parsed.netloc)
+        else:
+            conn = httplib.HTTPConnection(parsed.netloc)
+
+        path = parsed.path
+        if parsed.query:
+            path += '?' + parsed.query
+        headers = {'Range': 'bytes=%d-%d' % (start, end)}
+        if getattr(context, 'auth_token', None):
+            headers['X-Auth-Token'] = context.auth_token
+
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            if response.status != httplib.PARTIAL_CONTENT:
+                raise RangeNotSupported(_("Range request for %s returned %s") %
+                                        (url, response.status))
+
+            content_range = re.match('bytes (\d+)-(\d+)/(\d+|\*)',
+                                     response.getheader('content-range', ''))
+            if content_range is None or int(content_range.group(1)) != start:
+                raise RangeNotSupported(_("Unexpected content range for %s: %s") %
+                                        (url, response.getheader('content-range')))
+
+            if image_file is None:
+                return (response.read(), content_range.group(3))
+
+            image_file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = response.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    raise IOError(_("Short read of %s at offset %d") %
+                                  (url, end - remaining + 1))
+                image_file.write(data)
+                remaining -= len(data)
+        finally:
+            conn.close()
+
+    def _ranged_download(self, context, url, size, location):
+        # Make sure the source honours range requests before committing to
+        # them, otherwise every part would carry the whole image.
+        data, total = self._fetch_range(context, url, 0, 0)
+        if total != '*' and int(total) != size:
+            raise RangeNotSupported(_("Size mismatch for %s: %s != %s") %
+                                    (url, total, size))
+
+        # Preallocate the file so that each part can be written straight to
+        # its offset.
+        with open(location, "wb") as image_file:
+            image_file.truncate(size)
+
+        part_size = max(CONF.cobalt_download_part_size, CHUNK_SIZE)
+        parts = [(start, min(start + part_size, size) - 1)
+                 for start in xrange(0, size, part_size)]
+
+        errors = []
+        def fetch_part(part):
+            if errors:
+                # Another part already failed, no point in continuing.
+                return
+            (start, end) = part
+            try:
+                with open(location, "r+b") as image_file:
+                    self._fetch_range(context, url, start, end, image_file)
+            except Exception, exc:
+                errors.append(exc)
+
+        LOG.debug(_("Downloading %s in %d parts of %d bytes"), url,
+                  len(parts), part_size)
+        pool = eventlet.GreenPool(CONF.cobalt_download_concurrency)
+        for part in parts:
+            pool.spawn_n(fetch_part, part)
+        # Wait for every part so that nothing writes into the file once we
+        # return, even on failure.
+        pool.waitall()
+        if errors:
+            raise errors[0]
 
     def download(self, context, image_id, location):
         try:
+            (url, size) = self._ranged_source(context, image_id)
+            if url is not None:
+                try:
+                    return self._ranged_download(context, url, size, location)
+                except Exception, exc:
+                    LOG.warn(_("Parallel download of image %s failed, falling "
+                               "back to a single stream: %s") % (image_id, exc))
+
             with open(location, "wb") as image_file:
                 metadata = self.image_service.download(context, image_id, image_file)
         except Exception, exc:
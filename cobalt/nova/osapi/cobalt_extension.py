@@ -146,6 +146,19 @@ class CobaltServerControllerExtension(wsgi.Controller):
     def _dep_migrate_instance(self, req, id, body):
         return self._migrate_instance(req=req, id=id, body=body)
 
+    @wsgi.action('co_prefetch')
+    @convert_exception
+    @authorize
+    def _prefetch_instance(self, req, id, body):
+        context = req.environ["nova.context"]
+        prefetch_data = body.get('co_prefetch', {})
+        hosts = self.cobalt_api.prefetch_instance(context, id,
+                            policy=prefetch_data.get('policy', None),
+                            num_hosts=prefetch_data.get('num_hosts', None),
+                            availability_zone=prefetch_data.get('availability_zone', None),
+                            hosts=prefetch_data.get('hosts', None))
+        return webob.Response(status_int=200, body=json.dumps(hosts))
+
     @wsgi.action('co_list_launched')
     @convert_exception
     @authorize
@@ -250,6 +263,19 @@ class CobaltPolicyController(wsgi.Controller):
         self.gridcentric_api.install_policy(context,
             body.get('policy_ini_string'), body.get('wait'))
 
+class CobaltEvacuateController(wsgi.Controller):
+    def __init__(self):
+        super(CobaltEvacuateController, self).__init__()
+        self.cobalt_api = API()
+
+    @convert_exception
+    @authorize
+    def create(self, req, body):
+        context = req.environ["nova.context"]
+        dests = self.cobalt_api.evacuate_host(context, body.get('host'),
+                                              body.get('dests', None))
+        return {'dests': dests}
+
 class CobaltImportController(wsgi.Controller):
 
     _view_builder_class = views_servers.ViewBuilder
@@ -298,6 +324,7 @@ class Cobalt_extension(object):
         bootcontroller = CobaltTargetBootController()
         importcontroller = CobaltImportController()
         policycontroller = CobaltPolicyController()
+        evacuatecontroller = CobaltEvacuateController()
         return [
             extensions.ResourceExtension('cobaltinfo', info_controller),
             extensions.ResourceExtension('gcinfo', info_controller),
@@ -306,7 +333,8 @@ class Cobalt_extension(object):
             extensions.ResourceExtension('gc-import-server', importcontroller),
             extensions.ResourceExtension('co-import-server', importcontroller),
             extensions.ResourceExtension('gcpolicy', policycontroller),
-            extensions.ResourceExtension('copolicy', policycontroller)
+            extensions.ResourceExtension('copolicy', policycontroller),
+            extensions.ResourceExtension('coevacuate', evacuatecontroller)
         ]
 
     def get_controller_extensions(self):
@@ -0,0 +1,110 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import eventlet
+from eventlet import event
+
+from cobalt.nova.extension import admission
+
+class AdmissionControlTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.started = []
+        self.finish = event.Event()
+
+    def _operation(self, control, operation):
+        control.admit(operation)
+        try:
+            self.started.append(operation)
+            self.finish.wait()
+        finally:
+            control.release()
+
+    def _spawn(self, control, *operations):
+        threads = [eventlet.spawn(self._operation, control, operation)
+                   for operation in operations]
+        eventlet.sleep(0)
+        return threads
+
+    def _finish_all(self, threads):
+        self.finish.send()
+        for thread in threads:
+            thread.wait()
+
+    def test_parse_limits(self):
+        self.assertEquals({'launch': 2, 'bless': 0},
+                          admission.parse_limits('launch=2, bless=0,garbage'))
+
+    def test_operation_limit(self):
+        control = admission.AdmissionControl(limits={'launch': 2})
+        threads = self._spawn(control, 'launch', 'launch', 'launch', 'bless')
+        self.assertEquals(['launch', 'launch', 'bless'], self.started)
+        self.assertEquals(1, control.get_stats()['launch']['waiting'])
+
+        self._finish_all(threads)
+        self.assertEquals(3, self.started.count('launch'))
+        stats = control.get_stats()['launch']
+        self.assertEquals(3, stats['admitted'])
+        self.assertEquals(1, stats['queued'])
+        self.assertEquals(0, stats['running'])
+
+    def test_priority(self):
+        control = admission.AdmissionControl(total=1)
+        threads = self._spawn(control, 'bless', 'launch', 'discard', 'migrate_out')
+        self.assertEquals(['bless'], self.started)
+
+        self.finish.send()
+        for thread in threads:
+            thread.wait()
+        self.assertEquals(['bless', 'migrate_out', 'discard', 'launch'], self.started)
+
+    def test_incoming_migrations_exempt_from_total(self):
+        control = admission.AdmissionControl(total=1)
+        threads = self._spawn(control, 'migrate_out', 'migrate_in', 'launch')
+        self.assertEquals(['migrate_out', 'migrate_in'], self.started)
+        self._finish_all(threads)
+
+    def test_reentrant(self):
+        control = admission.AdmissionControl(limits={'migrate_out': 1})
+        control.admit('migrate_out')
+        control.admit('bless')
+        control.release()
+        self.assertEquals(1, control.running['migrate_out'])
+        control.release()
+        self.assertEquals(0, control.running['migrate_out'])
+        self.assertEquals({}, control.holders)
+
+    def test_non_blocking(self):
+        control = admission.AdmissionControl(total=1)
+        threads = self._spawn(control, 'bless')
+        self.assertFalse(control.admit('launch', blocking=False))
+        self.assertEquals([], control.waiters)
+        self.assertEquals(1, control.get_stats()['launch']['deferred'])
+        self.assertEquals(0, control.get_stats()['launch']['queued'])
+
+        self._finish_all(threads)
+        self.assertTrue(control.admit('launch', blocking=False))
+        control.release()
+        self.assertEquals(0, control.total_running)
+
+    def test_killed_waiter(self):
+        control = admission.AdmissionControl(limits={'launch': 1})
+        threads = self._spawn(control, 'launch', 'launch')
+        threads[1].kill()
+        self.assertEquals([], control.waiters)
+        self._finish_all(threads[:1])
+        self.assertEquals(0, control.running['launch'])
@@ -28,6 +28,7 @@ from oslo.config import cfg
 
 import cobalt.nova.api as gc_api
 from cobalt.nova import image
+from cobalt.nova.extension import warmpool
 import cobalt.tests.utils as utils
 import base64
 
@@ -491,6 +492,32 @@ class CobaltApiTestCase(unittest.TestCase):
         user_data = launched_instance['user_data']
         self.assertEqual(user_data, '')
 
+    def test_launch_claims_pooled_instance(self):
+        instance_uuid = utils.create_instance(self.context)
+        blessed_instance = self.cobalt_api.bless_instance(self.context, instance_uuid)
+        blessed_instance_uuid = blessed_instance['uuid']
+        pooled_instance = self.cobalt_api.launch_instance(self.context,
+                                                          blessed_instance_uuid)
+        db.instance_update(self.context, pooled_instance['uuid'],
+                           {'task_state': warmpool.POOLED, 'host': 'poolhost'})
+
+        test_data_encoded = base64.b64encode("here is some test user data")
+        launched_instance = self.cobalt_api.launch_instance(self.context,
+                                blessed_instance_uuid,
+                                params={'name': 'claimed',
+                                        'user_data': test_data_encoded})
+        self.assertEquals(pooled_instance['uuid'], launched_instance['uuid'])
+        self.assertEquals(warmpool.CLAIMED, launched_instance['task_state'])
+        self.assertEquals('claimed', launched_instance['display_name'])
+        self.assertEquals(test_data_encoded, launched_instance['user_data'])
+        self.assertTrue(len(self.mock_rpc.cast_log['launch_instance']['cobalt.poolhost']
+                            [launched_instance['uuid']]) > 0)
+
+        # The pool is empty now, so the next launch creates an instance.
+        launched_instance = self.cobalt_api.launch_instance(self.context,
+                                                            blessed_instance_uuid)
+        self.assertNotEquals(pooled_instance['uuid'], launched_instance['uuid'])
+
     def test_list_blessed_nonexistent_uuid(self):
         try:
             # Use a random UUID that doesn't exist.
@@ -530,6 +557,24 @@ class CobaltApiTestCase(unittest.TestCase):
         self.assertEquals(vm_states.ACTIVE, instance_ref['vm_state'])
 
 
+    def test_evacuate_host(self):
+        dests = [utils.create_cobalt_service(self.context)['host'] for i in range(2)]
+        host = self.cobalt_service['host']
+
+        evacuated_to = self.cobalt_api.evacuate_host(self.context, host)
+
+        self.assertEquals(sorted(dests), sorted(evacuated_to))
+        cast = self.mock_rpc.cast_log['evacuate_host']['cobalt.%s' % host]['unknown'][-1]
+        self.assertEquals(evacuated_to, cast['args']['dests'])
+
+    def test_evacuate_host_to_itself(self):
+        host = self.cobalt_service['host']
+        try:
+            self.cobalt_api.evacuate_host(self.context, host, dests=[host])
+            self.fail("Should not be able to evacuate a host to itself.")
+        except exception.NovaException:
+            pass
+
     def test_migrate_inactive_instance(self):
         instance_uuid = utils.create_instance(self.context, {"vm_state":vm_states.BUILDING})
         # Create a service so that one can be found by the api.
@@ -686,3 +731,39 @@ class CobaltApiTestCase(unittest.TestCase):
         gc_hosts.sort()
 
         self.assertEquals(hosts_in_zone, gc_hosts)
+
+    def test_prefetch_instance_hosts(self):
+        instance_uuid = utils.create_instance(self.context)
+        blessed_instance = self.cobalt_api.bless_instance(self.context, instance_uuid)
+        blessed_instance_uuid = blessed_instance['uuid']
+
+        hosts = [utils.create_cobalt_service(self.context)['host'] for i in range(2)]
+        prefetched = self.cobalt_api.prefetch_instance(self.context,
+                                                       blessed_instance_uuid,
+                                                       hosts=hosts)
+
+        self.assertEquals(hosts, prefetched)
+        for host in hosts:
+            self.assertTrue(len(self.mock_rpc.cast_log['prefetch_instance']\
+                                ['cobalt.%s' % host][blessed_instance_uuid]) > 0)
+
+    def test_prefetch_instance_least_loaded(self):
+        instance_uuid = utils.create_instance(self.context)
+        blessed_instance = self.cobalt_api.bless_instance(self.context, instance_uuid)
+        for i in range(3):
+            utils.create_cobalt_service(self.context)
+
+        prefetched = self.cobalt_api.prefetch_instance(self.context,
+                                                       blessed_instance['uuid'],
+                                                       policy='least_loaded',
+                                                       num_hosts=2)
+        self.assertEquals(2, len(prefetched))
+
+    def test_prefetch_not_blessed_instance(self):
+        instance_uuid = utils.create_instance(self.context)
+        try:
+            self.cobalt_api.prefetch_instance(self.context, instance_uuid,
+                                              hosts=[self.cobalt_service['host']])
+            self.fail("Should not be able to prefetch a non-blessed instance.")
+        except exception.NovaException:
+            pass
@@ -0,0 +1,94 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from xml.etree import ElementTree
+
+from cobalt.nova.extension import domaintemplate
+
+UUID = '11111111-2222-3333-4444-555555555555'
+CLONE_UUID = '66666666-7777-8888-9999-000000000000'
+
+DOMAIN_XML = """<domain type="kvm">
+  <uuid>%(uuid)s</uuid>
+  <name>instance-0000000a</name>
+  <sysinfo type="smbios">
+    <system>
+      <entry name="uuid">%(uuid)s</entry>
+    </system>
+  </sysinfo>
+  <devices>
+    <disk type="file" device="disk">
+      <source file="/instances/%(uuid)s/disk"/>
+    </disk>
+    <interface type="bridge">
+      <mac address="fa:16:3e:00:00:01"/>
+      <filterref filter="nova-instance-instance-0000000a-fa163e000001"/>
+    </interface>
+    <serial type="file">
+      <source path="/instances/%(uuid)s/console.log"/>
+    </serial>
+  </devices>
+</domain>
+""" % {'uuid': UUID}
+
+INTERFACE_XML = """<interface type="bridge">
+  <mac address="fa:16:3e:00:00:02"/>
+</interface>"""
+
+class DomainTemplateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.template = domaintemplate.DomainTemplate(DOMAIN_XML, UUID,
+                                                      'instance-0000000a',
+                                                      {'mapping': {}})
+
+    def test_clone_xml(self):
+        domain = ElementTree.fromstring(
+                    self.template.clone_xml(CLONE_UUID, 'instance-0000000b',
+                                            [INTERFACE_XML]))
+        self.assertEquals(CLONE_UUID, domain.find('uuid').text)
+        self.assertEquals('instance-0000000b', domain.find('name').text)
+        self.assertEquals(CLONE_UUID, domain.find('sysinfo/system/entry').text)
+        self.assertEquals('/instances/%s/disk' % CLONE_UUID,
+                          domain.find('devices/disk/source').get('file'))
+        self.assertEquals('/instances/%s/console.log' % CLONE_UUID,
+                          domain.find('devices/serial/source').get('path'))
+
+        # The interface is replaced where it was.
+        self.assertEquals(['disk', 'interface', 'serial'],
+                          [device.tag for device in domain.find('devices')])
+        self.assertEquals('fa:16:3e:00:00:02',
+                          domain.find('devices/interface/mac').get('address'))
+        self.assertEquals(None, domain.find('devices/interface/filterref'))
+        self.assertFalse(UUID in self.template.clone_xml(CLONE_UUID, 'instance-0000000b',
+                                                         [INTERFACE_XML]))
+
+    def test_clone_xml_other_interfaces(self):
+        self.assertRaises(ValueError, self.template.clone_xml,
+                          CLONE_UUID, 'instance-0000000b', [])
+
+    def test_cache(self):
+        cache = domaintemplate.DomainTemplateCache(size=1)
+        self.assertEquals(None, cache.get('image1'))
+        cache.put('image1', self.template)
+        self.assertEquals(self.template, cache.get('image1'))
+        cache.put('image2', self.template)
+        self.assertEquals(None, cache.get('image1'))
+        self.assertEquals({'hits': 1, 'misses': 2}, cache.stats)
+
+        cache.invalidate('image2')
+        self.assertEquals(0, len(cache))
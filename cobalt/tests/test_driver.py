@@ -0,0 +1,80 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import eventlet
+
+from oslo.config import cfg
+
+from cobalt.nova.extension.driver import libvirt
+
+CONF = cfg.CONF
+
+class FakeIptablesManager(object):
+
+    def __init__(self):
+        self.deferred = False
+        self.applies = 0
+
+    def apply(self):
+        if not self.deferred:
+            self.applies += 1
+
+    def defer_apply_on(self):
+        self.deferred = True
+
+    def defer_apply_off(self):
+        self.deferred = False
+        self.applies += 1
+
+class FilterBatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.iptables = FakeIptablesManager()
+        self.batcher = libvirt._FilterBatcher(self.iptables)
+
+    def tearDown(self):
+        CONF.clear_override('cobalt_iptables_batch_window')
+
+    def _prepare_filter(self, delay):
+        eventlet.sleep(delay)
+        self.iptables.apply()
+        return delay
+
+    def test_burst_applied_once(self):
+        threads = [eventlet.spawn(self.batcher.run,
+                                  lambda i=i: self._prepare_filter(0.01 * (i % 3)))
+                   for i in range(20)]
+        results = [thread.wait() for thread in threads]
+
+        self.assertEquals([0.01 * (i % 3) for i in range(20)], results)
+        self.assertEquals(1, self.iptables.applies)
+
+    def test_batch_waits_for_slow_callers(self):
+        CONF.set_override('cobalt_iptables_batch_window', 0.01)
+        slow = eventlet.spawn(self.batcher.run, lambda: self._prepare_filter(0.05))
+        eventlet.sleep(0)
+        self.batcher.run(lambda: self._prepare_filter(0))
+
+        # The apply happened once the slow caller had prepared its rules.
+        self.assertEquals(1, self.iptables.applies)
+        self.assertEquals(0.05, slow.wait())
+
+    def test_batching_disabled(self):
+        CONF.set_override('cobalt_iptables_batch_window', 0)
+        self.batcher.run(lambda: self._prepare_filter(0))
+        self.batcher.run(lambda: self._prepare_filter(0))
+        self.assertEquals(2, self.iptables.applies)
@@ -0,0 +1,42 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from cobalt.nova.extension import evacuation
+
+class EvacuationTestCase(unittest.TestCase):
+
+    def test_wave_size(self):
+        self.assertEquals(8, evacuation.wave_size(8))
+        self.assertEquals(1, evacuation.wave_size(0))
+        self.assertEquals(2, evacuation.wave_size(8, 2500, 1000))
+        # A wave always migrates at least one instance.
+        self.assertEquals(1, evacuation.wave_size(8, 500, 1000))
+
+    def test_plan_wave(self):
+        placed = {'b': 1}
+        wave, remaining = evacuation.plan_wave(
+                ['1', '2', '3', '4'], ['a', 'b'], placed, 3, 2, {'1': set(['a'])})
+        self.assertEquals([('1', 'b'), ('2', 'a'), ('3', 'a')], wave)
+        self.assertEquals(['4'], remaining)
+        self.assertEquals({'a': 2, 'b': 2}, placed)
+
+    def test_plan_wave_per_destination(self):
+        placed = {}
+        wave, remaining = evacuation.plan_wave(['1', '2', '3'], ['a'], placed,
+                                               8, 2, {})
+        self.assertEquals([('1', 'a'), ('2', 'a')], wave)
+        self.assertEquals(['3'], remaining)
@@ -0,0 +1,71 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cobalt.nova.extension import fileops
+
+class FileOpsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.chmod(self.directory, 0777)
+        self.commands = []
+        self.in_process = fileops.in_process
+
+    def tearDown(self):
+        fileops.in_process = self.in_process
+        shutil.rmtree(self.directory)
+
+    def _queue(self, ops):
+        ops.mkdir(os.path.join(self.directory, 'a', 'b'))
+        ops.touch(os.path.join(self.directory, 'a', 'b', 'disk'))
+        ops.symlink(os.path.join(self.directory, 'a', 'b', 'disk'),
+                    os.path.join(self.directory, "disk link"))
+
+    def test_batched_sudo(self):
+        fileops.in_process = lambda: False
+        ops = fileops.FileOps(1000, 1000, run_command=self.commands.append)
+        self._queue(ops)
+        ops.run()
+        ops.run()
+
+        self.assertEquals(1, len(self.commands))
+        self.assertEquals(['sudo', '-u', '#1000', 'sh', '-c'], self.commands[0][:5])
+        self.assertEquals("mkdir -p %(dir)s/a/b && touch %(dir)s/a/b/disk && "
+                          "ln -s %(dir)s/a/b/disk '%(dir)s/disk link'" %
+                          {'dir': self.directory},
+                          self.commands[0][5])
+
+    def test_in_process(self):
+        if not fileops.in_process():
+            return
+        ops = fileops.FileOps(1000, 1000, run_command=self.commands.append)
+        self._queue(ops)
+        ops.run()
+
+        self.assertEquals([], self.commands)
+        disk = os.stat(os.path.join(self.directory, 'a', 'b', 'disk'))
+        self.assertEquals((1000, 1000), (disk.st_uid, disk.st_gid))
+        self.assertEquals(1000, os.stat(os.path.join(self.directory, 'a')).st_uid)
+        self.assertEquals(1000, os.lstat(os.path.join(self.directory, 'disk link')).st_uid)
+
+        # The credentials of the process are back to normal.
+        path = os.path.join(self.directory, 'mine')
+        open(path, 'w').close()
+        self.assertEquals(os.geteuid(), os.stat(path).st_uid)
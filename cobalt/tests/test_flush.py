@@ -0,0 +1,73 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cobalt.nova.extension import flush
+
+LIBVIRT_XML = """<domain type="kvm">
+  <devices>
+    <disk type="file" device="disk">
+      <source file="%(disk)s"/>
+    </disk>
+    <disk type="block" device="disk">
+      <source dev="%(missing)s"/>
+    </disk>
+    <disk type="network" device="disk">
+      <source protocol="rbd" name="pool/volume"/>
+    </disk>
+  </devices>
+</domain>
+"""
+
+class FlushTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.working_dir = os.path.join(self.directory, 'instance')
+        os.mkdir(self.working_dir)
+        self.disk = os.path.join(self.directory, 'disk')
+        open(self.disk, 'w').write('data')
+        os.symlink(self.disk, os.path.join(self.working_dir, 'disk'))
+        open(os.path.join(self.working_dir, 'console.log'), 'w').close()
+        open(os.path.join(self.working_dir, 'libvirt.xml'), 'w').write(
+                LIBVIRT_XML % {'disk': self.disk,
+                               'missing': os.path.join(self.directory, 'missing')})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_disk_paths(self):
+        self.assertEquals([self.disk, os.path.join(self.directory, 'missing')],
+                          flush.disk_paths(os.path.join(self.working_dir,
+                                                        'libvirt.xml')))
+
+    def test_instance_paths(self):
+        self.assertEquals(sorted([self.disk,
+                                  os.path.join(self.working_dir, 'console.log'),
+                                  os.path.join(self.working_dir, 'libvirt.xml')]),
+                          flush.instance_paths(self.working_dir))
+
+    def test_flush_files(self):
+        self.assertEquals(3, flush.flush_instance(self.working_dir, 'files'))
+
+    def test_flush_filesystem(self):
+        expected = 1
+        if flush._syncfs is None:
+            expected = 3
+        self.assertEquals(expected, flush.flush_instance(self.working_dir, 'filesystem'))
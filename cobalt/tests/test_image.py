@@ -0,0 +1,126 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import BaseHTTPServer
+import os
+import re
+import tempfile
+import threading
+import unittest
+
+from nova import context as nova_context
+
+from oslo.config import cfg
+
+from cobalt.nova import image
+
+CONF = cfg.CONF
+
+class RangeRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Serves the server's data, honouring Range headers if enabled. """
+
+    def do_GET(self):
+        data = self.server.data
+        self.server.requests.append(self.headers.get('range'))
+        match = re.match('bytes=(\d+)-(\d+)', self.headers.get('range', ''))
+        if match is not None and self.server.supports_range:
+            start, end = int(match.group(1)), int(match.group(2))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(data)))
+            body = data[start:end + 1]
+        else:
+            self.send_response(200)
+            body = data
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class FakeGlance(object):
+
+    def __init__(self, data, url):
+        self.data = data
+        self.url = url
+        self.streamed = 0
+
+    def show(self, context, image_id):
+        return {'id': image_id, 'size': len(self.data), 'direct_url': self.url,
+                'properties': {}}
+
+    def download(self, context, image_id, image_file):
+        self.streamed += 1
+        image_file.write(self.data)
+
+class CobaltImageServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = os.urandom(1024 * 1024 + 17)
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        self.server.data = self.data
+        self.server.requests = []
+        self.server.supports_range = True
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+        url = 'http://127.0.0.1:%d/image' % self.server.server_address[1]
+        self.glance = FakeGlance(self.data, url)
+        self.image_service = image.ImageService(image_service=self.glance)
+        self.context = nova_context.RequestContext('fake', 'fake', True)
+
+        CONF.set_override('cobalt_download_part_size', 64 * 1024)
+        CONF.set_override('cobalt_download_concurrency', 4)
+        CONF.set_override('cobalt_download_parallel_threshold', 256 * 1024)
+
+        fd, self.target = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if os.path.exists(self.target):
+            os.unlink(self.target)
+        CONF.clear_override('cobalt_download_part_size')
+        CONF.clear_override('cobalt_download_concurrency')
+        CONF.clear_override('cobalt_download_parallel_threshold')
+
+    def _downloaded(self):
+        with open(self.target, 'rb') as target:
+            return target.read()
+
+    def test_download_in_ranges(self):
+        self.image_service.download(self.context, 'image', self.target)
+
+        self.assertEquals(self.data, self._downloaded())
+        self.assertEquals(0, self.glance.streamed)
+        # One probe request plus one request per part.
+        self.assertEquals(1 + 17, len(self.server.requests))
+
+    def test_download_small_image_single_stream(self):
+        CONF.set_override('cobalt_download_parallel_threshold', 2 * len(self.data))
+        self.image_service.download(self.context, 'image', self.target)
+
+        self.assertEquals(self.data, self._downloaded())
+        self.assertEquals(1, self.glance.streamed)
+        self.assertEquals([], self.server.requests)
+
+    def test_download_without_range_support(self):
+        self.server.supports_range = False
+        self.image_service.download(self.context, 'image', self.target)
+
+        self.assertEquals(self.data, self._downloaded())
+        self.assertEquals(1, self.glance.streamed)
@@ -0,0 +1,97 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import eventlet
+
+from cobalt.nova.extension import launch
+
+class TestInducedException(Exception):
+    pass
+
+class LaunchPipelineTestCase(unittest.TestCase):
+
+    def test_launch_pipeline(self):
+        events = []
+        def step(name, delay):
+            def run():
+                events.append(name + '.start')
+                eventlet.sleep(delay)
+                events.append(name + '.end')
+                return name
+            return run
+
+        pipeline = launch.LaunchPipeline()
+        pipeline.add('slow', step('slow', 0.02))
+        pipeline.add('fast', step('fast', 0.01))
+        pipeline.add('after', step('after', 0), requires=['fast'])
+        results = pipeline.wait()
+
+        self.assertEquals({'slow': 'slow', 'fast': 'fast', 'after': 'after'}, results)
+        # The independent steps overlap and the dependent one waits.
+        self.assertEquals(['slow.start', 'fast.start'], events[:2])
+        self.assertTrue(events.index('after.start') > events.index('fast.end'))
+
+    def test_launch_pipeline_failure(self):
+        started = []
+        def fail():
+            eventlet.sleep(0)
+            raise TestInducedException()
+        def slow():
+            eventlet.sleep(0.01)
+            started.append('slow')
+
+        pipeline = launch.LaunchPipeline()
+        pipeline.add('fail', fail)
+        pipeline.add('slow', slow)
+        pipeline.add('dependent', lambda: started.append('dependent'), requires=['slow'])
+
+        self.assertRaises(TestInducedException, pipeline.wait)
+        # The running step completes, the one that had not started never does.
+        self.assertEquals(['slow'], started)
+
+class LaunchContextCacheTestCase(unittest.TestCase):
+
+    def _context(self, name):
+        return launch.LaunchContext(name, ['image1'], {'lvm1': 1},
+                                    [['network1', None, None]], 'policy',
+                                    {'image1': {'size': 1}})
+
+    def test_copies(self):
+        cache = launch.LaunchContextCache(size=2)
+        cache.put('blessed1', self._context('instance1'))
+
+        launch_context = cache.get('blessed1')
+        launch_context.image_refs.append('image2')
+        launch_context.requested_networks[0][1] = 'port1'
+        # A launch changing its context does not change the cached one.
+        launch_context = cache.get('blessed1')
+        self.assertEquals(['image1'], launch_context.image_refs)
+        self.assertEquals([['network1', None, None]],
+                          launch_context.requested_networks)
+        self.assertEquals({'hits': 2, 'misses': 0}, cache.stats)
+
+    def test_size(self):
+        size = [2]
+        cache = launch.LaunchContextCache(size=lambda: size[0])
+        for i in range(3):
+            cache.put('blessed%d' % i, self._context('instance%d' % i))
+        self.assertEquals(None, cache.get('blessed0'))
+        self.assertEquals('instance2', cache.get('blessed2').name)
+
+        size[0] = 0
+        cache.put('blessed3', self._context('instance3'))
+        self.assertEquals(0, len(cache))
@@ -19,6 +19,8 @@ import shutil
 
 from datetime import datetime
 
+import eventlet
+
 from nova import db
 from nova import context as nova_context
 from nova import exception
@@ -29,6 +31,9 @@ from nova.compute import task_states
 from oslo.config import cfg
 
 import cobalt.nova.extension.manager as co_manager
+import cobalt.nova.extension.manifest as co_manifest
+import cobalt.nova.extension.migrationwatch as co_migrationwatch
+import cobalt.nova.extension.warmpool as co_warmpool
 import cobalt.tests.utils as utils
 import cobalt.nova.extension.vmsconn as vmsconn
 
@@ -127,6 +132,160 @@ class CobaltManagerTestCase(unittest.TestCase):
 
         self.assertTrue(blessed_instance['disable_terminate'])
 
+    def test_bless_instance_manifest(self):
+        self.vmsconn.set_return_val("bless",
+                                    ("newname", "migration_url", ["file1", "file2"], []))
+        self.vmsconn.set_return_val("post_bless", ["file1_ref", "file2_ref"])
+        self.vmsconn.set_return_val("bless_cleanup", None)
+        self.vmsconn.set_return_val("launch", None)
+
+        blessed_uuid = utils.create_pre_blessed_instance(self.context)
+        self.cobalt.bless_instance(self.context, instance_uuid=blessed_uuid,
+                                   migration_url=None)
+        system_metadata = db.instance_system_metadata_get(self.context, blessed_uuid)
+        self.assertEquals({'size': 1, 'checksum': 'checksum'},
+            dict([(key, value) for key, value in
+                  co_manifest.load(system_metadata).images()['file2_ref'].items()
+                  if key in ('size', 'checksum')]))
+        # The upload already described the artifacts.
+        self.assertEquals([], self.vmsconn.described)
+
+        # The launch is handed what the manifest knows about the artifacts.
+        launched_uuid = utils.create_pre_launched_instance(self.context,
+                                                source_uuid=blessed_uuid)
+        self.cobalt.launch_instance(self.context, instance_uuid=launched_uuid)
+        launch_kwargs = self.vmsconn.params_passed[-1]['kwargs']
+        self.assertEquals(['file1_ref', 'file2_ref'], launch_kwargs['image_refs'])
+        self.assertEquals('checksum', launch_kwargs['artifacts']['file1_ref']['checksum'])
+
+    def test_bless_instance_volume_snapshots(self):
+        self.vmsconn.set_return_val("bless",
+                                    ("newname", "migration_url", ["file1"], []))
+        self.vmsconn.set_return_val("post_bless", ["file1_ref"])
+        self.vmsconn.set_return_val("bless_cleanup", None)
+
+        blessed_uuid = utils.create_pre_blessed_instance(self.context)
+        for volume_id in ['volume1', 'volume2']:
+            db.block_device_mapping_create(self.context,
+                    {'source_type': 'volume',
+                     'destination_type': 'volume',
+                     'volume_id': volume_id,
+                     'device_name': '/dev/vd%s' % volume_id[-1],
+                     'instance_uuid': blessed_uuid},
+                     legacy=False)
+
+        class FakeVolumeApi(object):
+            def get(self, context, volume_id):
+                return {'id': volume_id, 'display_description': ''}
+            def create_snapshot_force(self, context, volume, name, description):
+                return {'id': 'snapshot-%s' % volume['id']}
+        self.cobalt.volume_api = FakeVolumeApi()
+
+        self.cobalt.bless_instance(self.context, instance_uuid=blessed_uuid,
+                                   migration_url=None)
+
+        bdms = db.block_device_mapping_get_all_by_instance(self.context, blessed_uuid)
+        snapshot_ids = sorted([bdm['snapshot_id'] for bdm in bdms if bdm['snapshot_id']])
+        self.assertEquals(['snapshot-volume1', 'snapshot-volume2'], snapshot_ids)
+        self.assertEquals(1, len(self.vmsconn.paused))
+        self.assertEquals(1, self.cobalt.get_stats(self.context)['bless']['paused'])
+
+    def test_bless_instance_volume_snapshot_fails(self):
+        blessed_uuid = utils.create_pre_blessed_instance(self.context)
+        for volume_id in ['volume1', 'volume2']:
+            db.block_device_mapping_create(self.context,
+                    {'source_type': 'volume',
+                     'destination_type': 'volume',
+                     'volume_id': volume_id,
+                     'device_name': '/dev/vd%s' % volume_id[-1],
+                     'instance_uuid': blessed_uuid},
+                     legacy=False)
+
+        deleted = []
+        class FakeVolumeApi(object):
+            def get(self, context, volume_id):
+                return {'id': volume_id, 'display_description': ''}
+            def create_snapshot_force(self, context, volume, name, description):
+                if volume['id'] == 'volume2':
+                    raise utils.TestInducedException()
+                return {'id': 'snapshot-%s' % volume['id']}
+            def delete_snapshot(self, context, snapshot):
+                deleted.append(snapshot['id'])
+        self.cobalt.volume_api = FakeVolumeApi()
+
+        self.assertRaises(utils.TestInducedException, self.cobalt.bless_instance,
+                          self.context, instance_uuid=blessed_uuid, migration_url=None)
+
+        self.assertEquals(['snapshot-volume1'], deleted)
+        self.assertEquals(1, len(self.vmsconn.paused))
+        self.assertEquals(self.vmsconn.paused, self.vmsconn.unpaused)
+
+    def test_bless_instance_fails_after_volume_pause(self):
+        self.vmsconn.set_return_val("bless", utils.TestInducedException())
+
+        blessed_uuid = utils.create_pre_blessed_instance(self.context)
+        db.block_device_mapping_create(self.context,
+                {'source_type': 'volume',
+                 'destination_type': 'volume',
+                 'volume_id': 'volume1',
+                 'device_name': '/dev/vda',
+                 'instance_uuid': blessed_uuid},
+                 legacy=False)
+
+        deleted = []
+        class FakeVolumeApi(object):
+            def get(self, context, volume_id):
+                return {'id': volume_id, 'display_description': ''}
+            def create_snapshot_force(self, context, volume, name, description):
+                return {'id': 'snapshot-%s' % volume['id']}
+            def delete_snapshot(self, context, snapshot):
+                deleted.append(snapshot['id'])
+        self.cobalt.volume_api = FakeVolumeApi()
+
+        self.assertRaises(utils.TestInducedException, self.cobalt.bless_instance,
+                          self.context, instance_uuid=blessed_uuid, migration_url=None)
+
+        self.assertEquals(['snapshot-volume1'], deleted)
+        self.assertEquals(1, len(self.vmsconn.paused))
+        self.assertEquals(self.vmsconn.paused, self.vmsconn.unpaused)
+
+    def test_detach_volumes(self):
+        instance_uuid = utils.create_instance(self.context)
+        for volume_id in ['volume1', 'volume2', 'volume3']:
+            db.block_device_mapping_create(self.context,
+                    {'source_type': 'volume',
+                     'destination_type': 'volume',
+                     'volume_id': volume_id,
+                     'device_name': '/dev/vd%s' % volume_id[-1],
+                     'instance_uuid': instance_uuid},
+                     legacy=False)
+
+        detached = []
+        connectors = []
+        class FakeVolumeApi(object):
+            def get(self, context, volume_id):
+                if volume_id == 'volume2':
+                    raise exception.VolumeNotFound(volume_id=volume_id)
+                return {'id': volume_id}
+            def terminate_connection(self, context, volume, connector):
+                pass
+            def detach(self, context, volume):
+                detached.append(volume['id'])
+        self.cobalt.volume_api = FakeVolumeApi()
+        driver = self.cobalt.compute_manager.driver
+        get_volume_connector = driver.get_volume_connector
+        def counting_connector(instance):
+            connectors.append(instance['uuid'])
+            return get_volume_connector(instance)
+        driver.get_volume_connector = counting_connector
+
+        instance = db.instance_get_by_uuid(self.context, instance_uuid)
+        self.cobalt._detach_volumes(self.context, instance)
+
+        self.assertEquals(['volume1', 'volume3'], sorted(detached))
+        self.assertEquals([instance_uuid], connectors)
+        self.assertEquals(3, self.cobalt.get_stats(self.context)['volumes']['detached'])
+
     def test_bless_instance_exception(self):
         self.vmsconn.set_return_val("bless", utils.TestInducedException())
 
@@ -207,6 +366,148 @@ class CobaltManagerTestCase(unittest.TestCase):
                              % (blessed_uuid, launched_uuid),
             self.vmsconn.params_passed[0]['kwargs']['vms_policy'])
 
+    def test_launch_instance_warm_pool(self):
+        self.vmsconn.set_return_val("launch", None)
+        blessed_uuid = utils.create_blessed_instance(self.context)
+        launched_uuid = utils.create_pre_launched_instance(self.context,
+                                                source_uuid=blessed_uuid)
+
+        self.cobalt.launch_instance(self.context, instance_uuid=launched_uuid,
+                                    warm_pool=True)
+
+        launched_instance = db.instance_get_by_uuid(self.context, launched_uuid)
+        self.assertEquals(vm_states.PAUSED, launched_instance['vm_state'])
+        self.assertEquals(co_warmpool.POOLED, launched_instance['task_state'])
+        self.assertEquals(None, launched_instance['launched_at'])
+        self.assertEquals([launched_instance['name']], self.vmsconn.paused)
+
+    def test_launch_instance_claimed(self):
+        blessed_uuid = utils.create_blessed_instance(self.context)
+        launched_uuid = utils.create_pre_launched_instance(self.context,
+                                                source_uuid=blessed_uuid)
+        db.instance_update(self.context, launched_uuid,
+                           {'vm_state': vm_states.PAUSED,
+                            'task_state': co_warmpool.CLAIMED})
+
+        self.cobalt.network_api.setup_networks_on_host = \
+                lambda context, instance, host=None: None
+        self.cobalt._retry_get_nw_info = lambda context, instance: []
+
+        self.cobalt.launch_instance(self.context, instance_uuid=launched_uuid)
+
+        # The clone is resumed rather than launched again.
+        self.assertEquals([], self.vmsconn.params_passed)
+        launched_instance = db.instance_get_by_uuid(self.context, launched_uuid)
+        self.assertEquals([launched_instance['name']], self.vmsconn.unpaused)
+        self.assertEquals(vm_states.ACTIVE, launched_instance['vm_state'])
+        self.assertEquals(None, launched_instance['task_state'])
+        self.assertNotEquals(None, launched_instance['launched_at'])
+
+    def test_launch_instance_coalesces_updates(self):
+        self.vmsconn.set_return_val("launch", None)
+        blessed_uuid = utils.create_blessed_instance(self.context)
+        launched_uuid = utils.create_pre_launched_instance(self.context,
+                                                source_uuid=blessed_uuid)
+
+        updates = []
+        instance_update = self.cobalt._instance_update
+        def counting_update(context, instance_uuid, **kwargs):
+            updates.append(kwargs)
+            return instance_update(context, instance_uuid, **kwargs)
+        self.cobalt._instance_update = counting_update
+
+        self.cobalt.launch_instance(self.context, instance_uuid=launched_uuid)
+
+        # The networking checkpoint and the final state, with the spawning
+        # transition folded into the latter.
+        self.assertEquals(2, len(updates))
+        self.assertEquals(task_states.NETWORKING, updates[0]['task_state'])
+        self.assertEquals(vm_states.ACTIVE, updates[1]['vm_state'])
+        self.assertEquals(None, updates[1]['task_state'])
+
+    def test_launch_context_cached(self):
+        self.vmsconn.set_return_val("launch", None)
+        self.vmsconn.set_return_val("discard", None)
+        blessed_uuid = utils.create_blessed_instance(self.context)
+
+        lookups = []
+        get_source_instance = self.cobalt._get_source_instance
+        def counting_get_source_instance(context, instance_ref):
+            lookups.append(instance_ref['uuid'])
+            return get_source_instance(context, instance_ref)
+        self.cobalt._get_source_instance = counting_get_source_instance
+
+        for i in range(2):
+            launched_uuid = utils.create_pre_launched_instance(self.context,
+                                                    source_uuid=blessed_uuid)
+            self.cobalt.launch_instance(self.context, instance_uuid=launched_uuid)
+        self.assertEquals(1, len(lookups))
+        self.assertEquals(1, self.cobalt.launch_contexts.stats['hits'])
+
+        self.cobalt.discard_instance(self.context, instance_uuid=blessed_uuid)
+        self.assertEquals(0, len(self.cobalt.launch_contexts))
+        self.assertTrue(blessed_uuid in
+                        self.mock_rpc.cast_log['invalidate_launch_context'][CONF.cobalt_topic])
+
+    def test_launch_instance_phases(self):
+        self.vmsconn.set_return_val("launch", None)
+        launched_uuid = utils.create_pre_launched_instance(self.context)
+        self.cobalt.launch_instance(self.context, instance_uuid=launched_uuid)
+
+        phases = self.cobalt.metrics.snapshot()['launch']['phases']
+        for name in ['total', 'lock', 'launch_context', 'block_devices', 'network']:
+            self.assertEquals(1, phases[name]['count'])
+
+    def test_prepare_migration(self):
+        instance_uuid = utils.create_instance(self.context)
+
+        self.cobalt.prepare_migration(self.context, instance_uuid=instance_uuid,
+                                      migration_network_info=utils.fake_networkinfo())
+
+        self.assertEquals([instance_uuid], self.vmsconn.prepared)
+        queue = 'compute.%s' % self.cobalt.host
+        calls = self.mock_rpc.call_log['pre_live_migration'][queue]['unknown']
+        self.assertEquals(instance_uuid, calls[-1]['args']['instance']['uuid'])
+        self.assertEquals(self.cobalt.host, calls[-1]['args']['instance']['host'])
+
+    def test_cancel_migration(self):
+        instance_uuid = utils.create_instance(self.context, {'host': 'source'})
+        self.cobalt.cancel_migration(self.context, instance_uuid=instance_uuid)
+        self.assertEquals([instance_uuid], self.vmsconn.cancelled)
+
+        # An instance that was launched here is left alone.
+        instance_uuid = utils.create_instance(self.context, {'host': self.cobalt.host})
+        self.cobalt.cancel_migration(self.context, instance_uuid=instance_uuid)
+        self.assertEquals(1, len(self.vmsconn.cancelled))
+
+    def test_evacuate_host(self):
+        instance_uuids = [utils.create_instance(self.context, {'host': self.cobalt.host})
+                          for i in range(3)]
+        utils.create_instance(self.context, {'host': self.cobalt.host,
+                                             'vm_state': 'blessed'})
+        attempts = []
+        def evacuate_instance(context, instance_uuid, dest):
+            attempts.append((instance_uuid, dest))
+            if (instance_uuid, dest) == (instance_uuids[0], 'a'):
+                raise utils.TestInducedException()
+        self.cobalt._evacuate_instance = evacuate_instance
+
+        result = self.cobalt.evacuate_host(self.context, dests=['a', 'b'])
+
+        self.assertEquals({instance_uuids[0]: 'b',
+                           instance_uuids[1]: 'b',
+                           instance_uuids[2]: 'a'}, result['migrated'])
+        self.assertEquals({}, result['failed'])
+        self.assertEquals(4, len(attempts))
+        self.assertFalse(self.cobalt.evacuating)
+
+    def test_evacuate_host_without_destinations(self):
+        self.assertRaises(exception.NovaException, self.cobalt.evacuate_host,
+                          self.context, dests=[self.cobalt.host])
+        # The host can be evacuated again.
+        self.assertFalse(self.cobalt.evacuating)
+        self.assertFalse(self.cobalt.host in self.cobalt.instance_locks.locks)
+
     def test_launch_instance_images(self):
         self.vmsconn.set_return_val("launch", None)
         blessed_uuid = utils.create_blessed_instance(self.context,
@@ -223,6 +524,14 @@ class CobaltManagerTestCase(unittest.TestCase):
         # Ensure that image1 was passed to vmsconn.launch
         self.assertEquals(['image1'], self.vmsconn.params_passed[0]['kwargs']['image_refs'])
 
+    def test_prefetch_instance(self):
+        blessed_uuid = utils.create_blessed_instance(self.context,
+            instance={'system_metadata':{'images':'image1,image2'}})
+
+        self.cobalt.prefetch_instance(self.context, instance_uuid=blessed_uuid)
+
+        self.assertEquals([['image1', 'image2']], self.vmsconn.prefetched)
+
     def test_launch_instance_exception(self):
 
         self.vmsconn.set_return_val("launch", utils.TestInducedException())
@@ -258,6 +567,37 @@ class CobaltManagerTestCase(unittest.TestCase):
         self.assertEquals(self.cobalt.host, post_launch_instance['host'])
         self.assertEquals(self.cobalt.nodename, post_launch_instance['node'])
 
+    def test_launch_instance_migrate_abandoned(self):
+        # The mock rpc answers None to the final heartbeat, as a source host
+        # that gave up on the migration would answer False.
+        instance_uuid = utils.create_instance(self.context, {'vm_state': vm_states.ACTIVE})
+
+        try:
+            self.cobalt.launch_instance(self.context, instance_uuid=instance_uuid,
+                                        migration_url="migration_url",
+                                        heartbeat_host="source")
+            self.fail("The launch should not go ahead without the source host.")
+        except exception.NovaException:
+            pass
+
+        self.assertEquals([], self.vmsconn.params_passed)
+        queue = 'cobalt.source'
+        calls = self.mock_rpc.call_log['migration_heartbeat'][queue][instance_uuid]
+        self.assertTrue(calls[-1]['args']['final'])
+
+    def test_migration_heartbeat(self):
+        watch = co_migrationwatch.MigrationWatch(3600, CONF.cobalt_migration_stall_timeout)
+        self.cobalt.migration_watches['uuid'] = watch
+        self.assertTrue(self.cobalt.migration_heartbeat(self.context, instance_uuid='uuid'))
+        self.assertEquals(None, watch.check())
+
+        watch.last_beat -= CONF.cobalt_migration_stall_timeout + 1
+        self.assertNotEqual(None, watch.check())
+        watch.abandoned = True
+        self.assertFalse(self.cobalt.migration_heartbeat(self.context, instance_uuid='uuid',
+                                                         final=True))
+        self.assertFalse(self.cobalt.migration_heartbeat(self.context, instance_uuid='other'))
+
     def test_launch_instance_migrate_exception(self):
 
         self.vmsconn.set_return_val("launch", utils.TestInducedException())
@@ -309,7 +649,7 @@ class CobaltManagerTestCase(unittest.TestCase):
                                              {'task_state':task_states.MIGRATING,
                                               'host': host})
         self.cobalt.host = 'different-host'
-        self.cobalt._refresh_host(self.context)
+        self.cobalt._reconcile_host(self.context)
 
         instance = db.instance_get_by_uuid(self.context, instance_uuid)
         self.assertEquals(host, instance['host'])
@@ -324,7 +664,7 @@ class CobaltManagerTestCase(unittest.TestCase):
                                                       'host': host})
         self.cobalt.host = host
         self.cobalt._lock_instance(locked_instance_uuid)
-        self.cobalt._refresh_host(self.context)
+        self.cobalt._reconcile_host(self.context)
 
         instance = db.instance_get_by_uuid(self.context, locked_instance_uuid)
         self.assertEquals(host, instance['host'])
@@ -336,7 +676,7 @@ class CobaltManagerTestCase(unittest.TestCase):
         instance_uuid = utils.create_instance(self.context,
                                              {'host': host})
         self.cobalt.host = host
-        self.cobalt._refresh_host(self.context)
+        self.cobalt._reconcile_host(self.context)
 
         instance = db.instance_get_by_uuid(self.context, instance_uuid)
         self.assertEquals(host, instance['host'])
@@ -353,7 +693,7 @@ class CobaltManagerTestCase(unittest.TestCase):
                                                                   'gc_dst_host': dst_host}},
                                             driver=self.cobalt.compute_manager.driver)
         self.cobalt.host = src_host
-        self.cobalt._refresh_host(self.context)
+        self.cobalt._reconcile_host(self.context)
 
         instance = db.instance_get_by_uuid(self.context, instance_uuid)
         self.assertEquals(src_host, instance['host'])
@@ -370,7 +710,7 @@ class CobaltManagerTestCase(unittest.TestCase):
                                                                   'gc_dst_host': dst_host}},
                                             driver=self.cobalt.compute_manager.driver)
         self.cobalt.host = dst_host
-        self.cobalt._refresh_host(self.context)
+        self.cobalt._reconcile_host(self.context)
 
         instance = db.instance_get_by_uuid(self.context, instance_uuid)
         self.assertEquals(dst_host, instance['host'])
@@ -386,7 +726,7 @@ class CobaltManagerTestCase(unittest.TestCase):
                                               'system_metadata': {'gc_src_host': src_host,
                                                                   'gc_dst_host': dst_host}})
         self.cobalt.host = src_host
-        self.cobalt._refresh_host(self.context)
+        self.cobalt._reconcile_host(self.context)
 
         instance = db.instance_get_by_uuid(self.context, instance_uuid)
         self.assertEquals(dst_host, instance['host'])
@@ -402,13 +742,95 @@ class CobaltManagerTestCase(unittest.TestCase):
                                               'system_metadata': {'gc_src_host': src_host,
                                                                   'gc_dst_host': dst_host}})
         self.cobalt.host = dst_host
-        self.cobalt._refresh_host(self.context)
+        self.cobalt._reconcile_host(self.context)
 
         instance = db.instance_get_by_uuid(self.context, instance_uuid)
         self.assertEquals(dst_host, instance['host'])
         self.assertEquals(None, instance['task_state'])
         self.assertEquals(vm_states.ERROR, instance['vm_state'])
 
+    def test_refresh_host_jitter(self):
+        src_host = "src-test-host"
+        dst_host = "dst-test-host"
+        instance_uuid = utils.create_instance(self.context,
+                                             {'task_state':task_states.MIGRATING,
+                                              'host': dst_host,
+                                              'system_metadata': {'gc_src_host': src_host,
+                                                                  'gc_dst_host': dst_host}})
+        self.cobalt.host = dst_host
+
+        # The scan is skipped until the host's (jittered) start time is reached.
+        self.cobalt.next_refresh_host = float('inf')
+        self.cobalt._refresh_host(self.context)
+        instance = db.instance_get_by_uuid(self.context, instance_uuid)
+        self.assertEquals(task_states.MIGRATING, instance['task_state'])
+
+        self.cobalt.next_refresh_host = 0
+        self.cobalt._refresh_host(self.context)
+        instance = db.instance_get_by_uuid(self.context, instance_uuid)
+        self.assertEquals(vm_states.ERROR, instance['vm_state'])
+        self.assertTrue(self.cobalt.next_refresh_host > 0)
+
+    def test_lock_instance_non_blocking(self):
+        instance_uuid = utils.create_uuid()
+        self.cobalt._lock_instance(instance_uuid)
+        self.assertFalse(eventlet.spawn(self.cobalt._lock_instance, instance_uuid,
+                                        blocking=False).wait())
+        self.cobalt._unlock_instance(instance_uuid)
+        self.assertFalse(instance_uuid in self.cobalt.instance_locks.locks)
+
+    def test_lock_instance_reentrant(self):
+        instance_uuid = utils.create_uuid()
+        self.cobalt._lock_instance(instance_uuid)
+        self.cobalt._lock_instance(instance_uuid)
+
+        self.cobalt._unlock_instance(instance_uuid)
+        self.assertTrue(instance_uuid in self.cobalt.instance_locks.locks)
+        self.cobalt._unlock_instance(instance_uuid)
+        self.assertFalse(instance_uuid in self.cobalt.instance_locks.locks)
+
+    def test_lock_instance_fifo(self):
+        instance_uuid = utils.create_uuid()
+        acquired = []
+
+        def lock(i):
+            self.cobalt._lock_instance(instance_uuid)
+            acquired.append(i)
+            self.cobalt._unlock_instance(instance_uuid)
+
+        self.cobalt._lock_instance(instance_uuid)
+        threads = [eventlet.spawn(lock, i) for i in range(3)]
+        eventlet.sleep(0)
+        self.assertEquals([], acquired)
+
+        self.cobalt._unlock_instance(instance_uuid)
+        for thread in threads:
+            thread.wait()
+        self.assertEquals([0, 1, 2], acquired)
+        self.assertFalse(instance_uuid in self.cobalt.instance_locks.locks)
+        self.assertEquals(3, self.cobalt.get_stats(self.context)['locks']['contended'])
+
+    def test_lock_instance_timeout(self):
+        CONF.set_override('cobalt_lock_timeout', 1)
+        instance_uuid = utils.create_uuid()
+        self.cobalt._lock_instance(instance_uuid)
+        acquired = self.cobalt.get_stats(self.context)['locks']['acquired']
+        try:
+            eventlet.spawn(self.cobalt._lock_instance, instance_uuid).wait()
+            self.fail("Locking a held instance should have timed out.")
+        except exception.NovaException:
+            pass
+        finally:
+            CONF.clear_override('cobalt_lock_timeout')
+
+        self.assertEquals(0, len(self.cobalt.instance_locks.locks[instance_uuid].waiters))
+        # A wait that timed out did not acquire the lock.
+        stats = self.cobalt.get_stats(self.context)['locks']
+        self.assertEquals(acquired, stats['acquired'])
+        self.assertEquals(1, stats['timeouts'])
+        self.cobalt._unlock_instance(instance_uuid)
+        self.assertFalse(instance_uuid in self.cobalt.instance_locks.locks)
+
     def test_vms_policy_generation_custom_flavor(self):
         flavor = utils.create_flavor()
         instance_uuid = utils.create_instance(self.context, {'instance_type_id': flavor['id']})
@@ -0,0 +1,84 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from cobalt.nova.extension import manifest
+
+class ManifestTestCase(unittest.TestCase):
+
+    def _create_manifest(self, images=3):
+        artifact_manifest = manifest.Manifest()
+        for i in range(images):
+            artifact_manifest.add(manifest.IMAGE, 'image%d' % i, size=1024 * i,
+                                  checksum='%032x' % i, codec='raw',
+                                  name='file%d.disk' % i, glance_id='image%d' % i)
+        artifact_manifest.add(manifest.LOGICAL_VOLUME, 'lv0', size='10G')
+        artifact_manifest.add(manifest.NETWORK, 'net0')
+        return artifact_manifest
+
+    def test_store_and_load(self):
+        system_metadata = {}
+        manifest.store(self._create_manifest(images=10), system_metadata)
+
+        self.assertTrue(int(system_metadata['manifest']) > 1)
+        for key, value in system_metadata.items():
+            self.assertTrue(len(value) <= manifest.CHUNK_SIZE)
+
+        loaded = manifest.load(system_metadata)
+        self.assertEquals(['image%d' % i for i in range(10)], loaded.image_refs())
+        self.assertEquals('file3.disk', loaded.images()['image3']['name'])
+        self.assertEquals({'lv0': '10G'}, loaded.lvm_info())
+        self.assertEquals(['net0'], loaded.network_ids())
+
+    def test_legacy_keys_written(self):
+        system_metadata = {}
+        manifest.store(self._create_manifest(images=2), system_metadata)
+        self.assertEquals('image0,image1', system_metadata['images'])
+        self.assertEquals('lv0:10G', system_metadata['logical_volumes'])
+        self.assertEquals('net0', system_metadata['attached_networks'])
+
+    def test_store_drops_stale_chunks(self):
+        system_metadata = {}
+        manifest.store(self._create_manifest(images=10), system_metadata)
+        manifest.store(self._create_manifest(images=0), system_metadata)
+        chunks = [key for key in system_metadata if key.startswith('manifest.')]
+        self.assertEquals(int(system_metadata['manifest']), len(chunks))
+        self.assertEquals([], manifest.load(system_metadata).image_refs())
+
+    def test_legacy_fallback(self):
+        system_metadata = {'images': 'image0,image1',
+                           'logical_volumes': 'lv0:10G',
+                           'attached_networks': ''}
+        loaded = manifest.load(system_metadata)
+        self.assertEquals(['image0', 'image1'], loaded.image_refs())
+        self.assertEquals({'lv0': '10G'}, loaded.lvm_info())
+        self.assertEquals([], loaded.network_ids())
+        self.assertEquals(None, loaded.images()['image0']['checksum'])
+
+    def test_damaged_manifest(self):
+        system_metadata = {}
+        manifest.store(self._create_manifest(images=10), system_metadata)
+        del system_metadata['manifest.1']
+        self.assertEquals(['image%d' % i for i in range(10)],
+                          manifest.load(system_metadata).image_refs())
+
+    def test_newer_version(self):
+        system_metadata = {}
+        artifact_manifest = self._create_manifest()
+        artifact_manifest.version = manifest.VERSION + 1
+        manifest.store(artifact_manifest, system_metadata)
+        system_metadata['images'] = 'legacy'
+        self.assertEquals(['legacy'], manifest.load(system_metadata).image_refs())
@@ -0,0 +1,82 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import eventlet
+
+from cobalt.nova.extension import metrics
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_monotonic(self):
+        first = metrics.monotonic()
+        self.assertTrue(metrics.monotonic() >= first)
+
+    def _unwrapped(self):
+        with metrics.phase('lost'):
+            pass
+
+    def test_phases(self):
+        timer = metrics.PhaseTimer('launch')
+        with metrics.timing(timer):
+            with metrics.phase('download'):
+                eventlet.sleep(0.01)
+            with metrics.phase('download'):
+                eventlet.sleep(0.01)
+            # Work in another greenthread is only timed when wrapped.
+            eventlet.spawn(timer.wrap('network', eventlet.sleep), 0.01).wait()
+            eventlet.spawn(self._unwrapped).wait()
+
+        breakdown = timer.breakdown()
+        self.assertEquals(['download', 'network', 'total'], sorted(breakdown.keys()))
+        self.assertTrue(breakdown['download'] >= 0.02)
+        self.assertTrue(breakdown['total'] >= breakdown['download'] + breakdown['network'])
+        self.assertEquals(None, metrics.current().operation)
+
+    def test_histogram(self):
+        histogram = metrics.Histogram()
+        for seconds in [0.0005, 0.003, 0.004, 5000]:
+            histogram.record(seconds)
+        self.assertEquals({'count': 4,
+                           'sum': 5000.0075,
+                           'max': 5000,
+                           'buckets': {'le_1ms': 1, 'le_5ms': 2, 'inf': 1}},
+                          histogram.to_dict())
+
+    def test_sink_flush(self):
+        sink = metrics.MetricsSink()
+        timer = metrics.PhaseTimer('bless')
+        timer.add('upload', 1.5)
+        sink.record(timer)
+        sink.record(timer, failed=True)
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'metrics.json')
+            sink.flush(path)
+            written = json.load(open(path))
+            self.assertEquals(os.listdir(directory), ['metrics.json'])
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEquals(1, written['bless']['failed'])
+        self.assertEquals(2, written['bless']['phases']['upload']['count'])
+        self.assertEquals(3.0, written['bless']['phases']['upload']['sum'])
+        self.assertEquals(2, written['bless']['phases']['total']['count'])
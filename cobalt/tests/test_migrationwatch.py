@@ -0,0 +1,44 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from cobalt.nova.extension import migrationwatch
+
+class MigrationWatchTestCase(unittest.TestCase):
+
+    def test_stalled(self):
+        watch = migrationwatch.MigrationWatch(3600, stall_timeout=30)
+        self.assertEquals(None, watch.check())
+        watch.last_beat -= 31
+        self.assertNotEqual(None, watch.check())
+
+        self.assertTrue(watch.beat())
+        self.assertEquals(None, watch.check())
+        self.assertEquals(1, watch.beats)
+
+    def test_deadline(self):
+        watch = migrationwatch.MigrationWatch(60)
+        watch.start -= 61
+        self.assertNotEqual(None, watch.check())
+        # Once the destination has committed, it is no longer given up on.
+        watch.beat(final=True)
+        self.assertEquals(None, watch.check())
+
+    def test_abandoned(self):
+        watch = migrationwatch.MigrationWatch(60)
+        watch.abandoned = True
+        self.assertFalse(watch.beat(final=True))
+        self.assertFalse(watch.committed)
@@ -0,0 +1,62 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import eventlet
+
+from cobalt.nova.extension import notifyqueue
+
+class NotificationQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.emitted = []
+        self.overflow = 'drop_oldest'
+        self.notifications = notifyqueue.NotificationQueue(self._emit, 2,
+                                    overflow=lambda: self.overflow)
+
+    def _emit(self, context, event_type, payload):
+        if event_type == 'fail':
+            raise ValueError(event_type)
+        self.emitted.append(event_type)
+
+    def _put(self, *event_types):
+        for event_type in event_types:
+            self.notifications.put((None, event_type, {}))
+
+    def test_drop_oldest(self):
+        self._put('first', 'second', 'third')
+        # Nothing is emitted until the operation yields.
+        self.assertEquals([], self.emitted)
+        eventlet.sleep(0)
+
+        self.assertEquals(['second', 'third'], self.emitted)
+        stats = self.notifications.get_stats()
+        self.assertEquals(1, stats['dropped'])
+        self.assertEquals(0, stats['waiting'])
+
+    def test_drop_newest(self):
+        self.overflow = 'drop_newest'
+        self._put('first', 'second', 'third')
+        eventlet.sleep(0)
+        self.assertEquals(['first', 'second'], self.emitted)
+
+    def test_failure(self):
+        self._put('fail', 'first')
+        eventlet.sleep(0)
+        self.assertEquals(['first'], self.emitted)
+        stats = self.notifications.get_stats()
+        self.assertEquals(1, stats['failed'])
+        self.assertEquals(1, stats['emitted'])
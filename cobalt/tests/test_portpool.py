@@ -0,0 +1,96 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from cobalt.nova.extension import portpool
+
+class FakeQuantumClient(object):
+
+    def __init__(self):
+        self.ports = {}
+        self.next_id = 0
+
+    def create_port(self, body):
+        port = dict(body['port'])
+        port['id'] = 'port%d' % self.next_id
+        port['device_id'] = ''
+        self.next_id += 1
+        self.ports[port['id']] = port
+        return {'port': port}
+
+    def delete_port(self, port_id):
+        del self.ports[port_id]
+
+    def list_ports(self, device_owner=None):
+        return {'ports': [port for port in self.ports.values()
+                          if port['device_owner'] == device_owner]}
+
+class PortPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeQuantumClient()
+        self.pool = self._create_pool()
+
+    def _create_pool(self, **kwargs):
+        kwargs.setdefault('size', 2)
+        kwargs.setdefault('max_ports', 3)
+        return portpool.PortPool('host', lambda context: self.client, **kwargs)
+
+    def test_claim_after_refill(self):
+        self.assertEquals(None, self.pool.claim('tenant', 'net1'))
+        self.pool.refill(None)
+        self.assertEquals(2, len(self.client.ports))
+
+        port_id = self.pool.claim('tenant', 'net1')
+        self.assertTrue(port_id in self.client.ports)
+        self.assertEquals('cobalt:pool:host', self.client.ports[port_id]['device_owner'])
+        self.assertEquals(1, self.pool.stats['claimed'])
+        self.assertEquals(1, self.pool.stats['missed'])
+
+    def test_max_ports(self):
+        self.pool.claim('tenant', 'net1')
+        self.pool.claim('tenant', 'net2')
+        self.pool.refill(None)
+        self.assertEquals(3, len(self.client.ports))
+
+    def test_idle_networks_drained(self):
+        self.pool.claim('tenant', 'net1')
+        self.pool.refill(None)
+        self.pool.idle_timeout = -1
+        self.pool.refill(None)
+        self.assertEquals({}, self.client.ports)
+        self.assertEquals(None, self.pool.claim('tenant', 'net1'))
+
+    def test_release(self):
+        self.pool.claim('tenant', 'net1')
+        self.pool.refill(None)
+        port_id = self.pool.claim('tenant', 'net1')
+        self.pool.release(None, [port_id])
+        self.assertFalse(port_id in self.client.ports)
+
+    def test_reclaim_after_restart(self):
+        self.pool.claim('tenant', 'net1')
+        self.pool.refill(None)
+        self.client.create_port({'port': {'tenant_id': 'tenant',
+                                          'network_id': 'net1',
+                                          'device_owner': 'cobalt:pool:host'}})
+
+        restarted = self._create_pool()
+        restarted.reclaim(None)
+        # Two ports fit in the pool, the third is deleted.
+        self.assertEquals(2, restarted.stats['adopted'])
+        self.assertEquals(2, len(self.client.ports))
+        self.assertTrue(restarted.claim('tenant', 'net1') in self.client.ports)
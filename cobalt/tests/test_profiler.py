@@ -0,0 +1,77 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+import eventlet
+
+from oslo.config import cfg
+
+from cobalt.nova.extension import profiler
+
+CONF = cfg.CONF
+
+def busy_work(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        sum(range(100))
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        CONF.set_override('cobalt_profile_dir', self.directory)
+        CONF.set_override('cobalt_profile_interval', 0.001)
+        self.profiler = profiler.Profiler()
+
+    def tearDown(self):
+        self.profiler.stop()
+        CONF.clear_override('cobalt_profile_dir')
+        CONF.clear_override('cobalt_profile_interval')
+        shutil.rmtree(self.directory)
+
+    def test_sample_operations(self):
+        self.profiler.start(mode='sample', operations=2)
+        busy_work(0.05)
+        self.profiler.operation_done()
+        self.assertTrue(self.profiler.active)
+        self.profiler.operation_done()
+        self.assertFalse(self.profiler.active)
+
+        folded = open(self.profiler.path).read()
+        self.assertTrue(self.profiler.path.endswith('.folded'))
+        self.assertTrue('busy_work (test_profiler.py:' in folded)
+        for line in folded.splitlines():
+            self.assertTrue(int(line.rsplit(' ', 1)[1]) > 0)
+
+    def test_cprofile_duration(self):
+        self.profiler.start(mode='cprofile', duration=0.05)
+        busy_work(0.01)
+        eventlet.sleep(0.1)
+        self.assertFalse(self.profiler.active)
+
+        stats = pstats.Stats(self.profiler.path)
+        self.assertTrue([function for function in stats.stats
+                         if function[2] == 'busy_work'])
+
+    def test_inactive(self):
+        profiler.operation_done()
+        self.profiler.stop()
+        self.assertEquals([], os.listdir(self.directory))
@@ -0,0 +1,81 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from cobalt.nova.extension import retry
+
+class TransientError(Exception):
+    pass
+
+class FatalError(TransientError):
+    pass
+
+class FlakyCall(object):
+
+    def __init__(self, failures, error=TransientError):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self, value):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error()
+        return value
+
+class RetryPolicyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = retry.RetryPolicy('test', transient=(TransientError,),
+                                        fatal=(FatalError,), deadline=5,
+                                        initial_delay=0.001, max_delay=0.01)
+
+    def test_retry_until_success(self):
+        call = FlakyCall(3)
+        self.assertEquals('done', self.policy.call(call, 'done'))
+        self.assertEquals(4, call.calls)
+        self.assertEquals(3, self.policy.stats['retries'])
+        self.assertEquals(1, self.policy.stats['calls'])
+
+    def test_fatal_error_not_retried(self):
+        call = FlakyCall(3, error=FatalError)
+        self.assertRaises(FatalError, self.policy.call, call, 'done')
+        self.assertEquals(1, call.calls)
+        self.assertEquals(1, self.policy.stats['fatal'])
+
+    def test_unknown_error_not_retried(self):
+        call = FlakyCall(3, error=ValueError)
+        self.assertRaises(ValueError, self.policy.call, call, 'done')
+        self.assertEquals(1, call.calls)
+
+    def test_deadline(self):
+        self.policy.deadline = lambda: 0
+        call = FlakyCall(3)
+        self.assertRaises(TransientError, self.policy.call, call, 'done')
+        self.assertEquals(1, call.calls)
+        self.assertEquals(1, self.policy.stats['exhausted'])
+
+    def test_decorator(self):
+        call = FlakyCall(1)
+
+        @self.policy
+        def flaky(value):
+            """ Fails once. """
+            return call(value)
+
+        self.assertEquals('done', flaky('done'))
+        self.assertEquals(2, call.calls)
+        self.assertEquals('flaky', flaky.__name__)
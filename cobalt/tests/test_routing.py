@@ -0,0 +1,82 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import socket
+import struct
+import tempfile
+import unittest
+
+from nova import exception
+
+from cobalt.nova.extension import routing
+
+HEADER = "Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\t\tMTU\tWindow\tIRTT\n"
+
+def _hex(address):
+    return '%08X' % struct.unpack('=I', socket.inet_aton(address))[0]
+
+def _route(device, destination, mask, metric=0, flags=0x1):
+    return "%s\t%s\t00000000\t%04X\t0\t0\t%d\t%s\t0\t0\t0\n" % \
+            (device, _hex(destination), flags, metric, _hex(mask))
+
+class RouteTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.route_file = tempfile.mkstemp()
+        os.close(fd)
+        self.interfaces = {'eth0': '10.0.0.5', 'eth1': '192.168.1.5'}
+        self.table = routing.RouteTable(route_file=self.route_file,
+                                        interface_address=self.interfaces.get)
+        self._write_routes(_route('eth0', '0.0.0.0', '0.0.0.0', metric=100),
+                           _route('eth0', '10.0.0.0', '255.255.255.0'),
+                           _route('eth1', '192.168.1.0', '255.255.255.0'),
+                           _route('eth2', '192.168.1.0', '255.255.255.0', metric=10),
+                           _route('eth3', '172.16.0.0', '255.255.0.0', flags=0))
+
+    def tearDown(self):
+        os.unlink(self.route_file)
+
+    def _write_routes(self, *routes):
+        route_file = open(self.route_file, 'w')
+        route_file.write(HEADER + ''.join(routes))
+        route_file.close()
+
+    def test_longest_prefix(self):
+        self.assertEquals('eth0', self.table.device_for('10.0.0.7'))
+        self.assertEquals('eth0', self.table.device_for('8.8.8.8'))
+
+    def test_lowest_metric(self):
+        self.assertEquals('eth1', self.table.device_for('192.168.1.7'))
+
+    def test_routes_down_ignored(self):
+        self.assertEquals('eth0', self.table.device_for('172.16.0.1'))
+
+    def test_local_address(self):
+        self.assertRaises(exception.NovaException, self.table.device_for, '10.0.0.5')
+        self.assertRaises(exception.NovaException, self.table.device_for, '127.0.0.1')
+
+    def test_no_route(self):
+        self._write_routes(_route('eth0', '10.0.0.0', '255.255.255.0'))
+        self.assertRaises(exception.NovaException, self.table.device_for, '8.8.8.8')
+
+    def test_route_change_invalidates_cache(self):
+        self.assertEquals('eth0', self.table.device_for('192.168.2.1'))
+        self._write_routes(_route('eth1', '192.168.0.0', '255.255.0.0'))
+        self.assertEquals('eth1', self.table.device_for('192.168.2.1'))
+
+    def test_dns_cache(self):
+        self.table.addresses['dest-host'] = ('10.0.0.9', float('inf'))
+        self.assertEquals('eth0', self.table.device_for('dest-host'))
@@ -0,0 +1,111 @@
+# Copyright 2013 GridCentric Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+import unittest
+
+from cobalt.nova.extension import warmpool
+
+class FakeHost(object):
+
+    def __init__(self):
+        self.launched = []
+        self.deleted = []
+
+    def launch(self, context, live_image):
+        uuid = '%s-clone%d' % (live_image, len(self.launched))
+        self.launched.append(uuid)
+        return uuid
+
+    def delete(self, context, uuid):
+        self.deleted.append(uuid)
+
+class WarmPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.host = FakeHost()
+        self.pool = self._create_pool({'image1': 2, 'image2': 2})
+
+    def _create_pool(self, sizes, **kwargs):
+        kwargs.setdefault('max_instances', 3)
+        return warmpool.WarmPool(self.host.launch, self.host.delete, sizes, **kwargs)
+
+    def _finish_launches(self):
+        for (uuid, (live_image, _started)) in self.pool.pending.items():
+            self.pool.launched(live_image, uuid)
+
+    def test_refill_within_limits(self):
+        self.pool.refill(None)
+        self.assertEquals(3, len(self.host.launched))
+        self.assertEquals(3, self.pool.get_stats()['pending'])
+
+        # Launches that have not finished count towards the pool.
+        self.pool.refill(None)
+        self.assertEquals(3, len(self.host.launched))
+
+        self._finish_launches()
+        self.assertEquals(3, self.pool.get_stats()['pooled'])
+        self.assertEquals(0, self.pool.get_stats()['pending'])
+
+    def test_claimed_clones_are_replaced(self):
+        self.pool = self._create_pool({'image1': 2})
+        self.pool.refill(None)
+        self._finish_launches()
+        clone = self.pool.ready['image1'][0]
+
+        self.pool.claimed('image1', clone)
+        self.assertEquals(1, self.pool.stats['claimed'])
+        self.pool.refill(None)
+        self.assertEquals(3, len(self.host.launched))
+        self.assertEquals([], self.host.deleted)
+
+    def test_failed_launch(self):
+        self.pool = self._create_pool({'image1': 1})
+        self.pool.refill(None)
+        self.pool.launched('image1', self.host.launched[0], succeeded=False)
+        self.assertEquals(1, self.pool.stats['failed'])
+        self.assertEquals(0, self.pool.get_stats()['pooled'])
+
+        self.pool.refill(None)
+        self.assertEquals(2, len(self.host.launched))
+
+    def test_idle_eviction(self):
+        self.pool = self._create_pool({'image1': 1}, idle_timeout=60)
+        self.pool.refill(None)
+        self._finish_launches()
+        self.pool.last_used['image1'] = time.time() - 120
+
+        self.pool.refill(None)
+        self.assertEquals(self.host.launched, self.host.deleted)
+        self.assertEquals(1, self.pool.stats['evicted'])
+        self.assertEquals(1, self.pool.get_stats()['idle'])
+
+        # The pool stays empty until the live-image is launched again.
+        self.pool.refill(None)
+        self.assertEquals(1, len(self.host.launched))
+        self.pool.touch('image1')
+        self.pool.refill(None)
+        self.assertEquals(2, len(self.host.launched))
+
+    def test_sync(self):
+        self.pool.refill(None)
+        self.pool.sync([('image1', 'adopted'), ('image1', self.host.launched[0])])
+        self.assertEquals(['adopted', self.host.launched[0]], self.pool.ready['image1'])
+        self.assertEquals(2, self.pool.get_stats()['pending'])
+
+        # Clones of live-images that are no longer pooled are deleted.
+        self.pool.sync([('image3', 'stray')])
+        self.pool.refill(None)
+        self.assertEquals(['stray'], self.host.deleted)
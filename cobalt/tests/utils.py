@@ -64,9 +64,13 @@ class MockRpc(object):
     def cast(self, context, queue, kwargs):
         self.__add_to_log(self.cast_log, queue, kwargs)
 
+    def fanout_cast(self, context, topic, kwargs):
+        self.__add_to_log(self.cast_log, topic, kwargs)
+
 mock_rpc = MockRpc()
 rpc.call = mock_rpc.call
 rpc.cast = mock_rpc.cast
+rpc.fanout_cast = mock_rpc.fanout_cast
 
 class MockImageService(object):
     """
@@ -141,6 +145,12 @@ class MockVmsConn(object):
     def __init__(self):
         self.return_vals = {}
         self.params_passed = []
+        self.prefetched = []
+        self.prepared = []
+        self.cancelled = []
+        self.described = []
+        self.paused = []
+        self.unpaused = []
 
     def set_return_val(self, method, value):
         values = self.return_vals.get(method, [])
@@ -165,7 +175,9 @@ class MockVmsConn(object):
 
     def post_bless(self, *args, **kwargs):
         self.params_passed.append({'args': args, 'kwargs': kwargs})
-        return self.pop_return_value("post_bless")
+        image_refs = self.pop_return_value("post_bless")
+        return image_refs, dict([(image_ref, {'size': 1, 'checksum': 'checksum'})
+                                 for image_ref in image_refs])
 
     def bless_cleanup(self, *args, **kwargs):
         self.params_passed.append({'args': args, 'kwargs': kwargs})
@@ -179,10 +191,34 @@ class MockVmsConn(object):
         self.params_passed.append({'args': args, 'kwargs': kwargs})
         return self.pop_return_value("launch")
 
+    def describe_artifacts(self, context, image_refs):
+        self.described.append(image_refs)
+        return dict([(image_ref, {'size': 1, 'checksum': 'checksum'})
+                     for image_ref in image_refs])
+
+    def prefetch_images(self, context, image_refs=[], artifacts=None):
+        # Prefetching is opportunistic so it is recorded separately from the
+        # calls that tests explicitly set up return values for.
+        self.prefetched.append(image_refs)
+        return image_refs
+
+    def pause_instance(self, instance_ref):
+        self.paused.append(instance_ref['name'])
+
+    def unpause_instance(self, instance_ref):
+        self.unpaused.append(instance_ref['name'])
+
     def replug(self, *args, **kwargs):
         self.params_passed.append({'args': args, 'kwargs': kwargs})
         return self.pop_return_value("replug")
 
+    def prepare_migration(self, context, instance_ref, network_info,
+                          block_device_info=None):
+        self.prepared.append(instance_ref['uuid'])
+
+    def cancel_migration(self, context, instance_ref):
+        self.cancelled.append(instance_ref['uuid'])
+
     def pre_migration(self, *args, **kwargs):
         self.params_passed.append({'args': args, 'kwargs': kwargs})
         return self.pop_return_value("pre_migration")